@@ -1,39 +1,70 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, request, jsonify, send_file, Response
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, get_jwt, create_access_token, create_refresh_token
 from dotenv import load_dotenv
 import os
-import io
+import json
+import tempfile
 from datetime import datetime, timedelta
 
 # Load environment variables
 load_dotenv()
 
 # Import generators
-from generators.screenplay_generator import generate_screenplay
-from generators.character_generator import generate_characters
-from generators.scene_generator import generate_scenes
-from generators.sound_design_generator import generate_sound_design
-from generators.script_analyzer import analyze_script
+from generators.pipeline import run_generation, run_analysis, arun_generation, regenerate_section, package_json, GENERATE_STAGES, ANALYZE_STAGES, SECTIONS
 from utils.pdf_generator import generate_pdf
-from utils.text_extractor import extract_text_from_pdf, extract_text_from_docx, clean_text
+from utils.pdf_cache import get_pdf_cache, pdf_cache_key
+from utils.schema import SchemaError
+from utils.text_extractor import preview_pdf, preview_docx, clean_text, detect_file_type
+from utils.ai_cache import get_ai_cache
+from utils.ai_client import MODELS
+from utils.model_health import get_model_health
+from utils.rate_limiter import get_rate_limiter
+from utils.sse import stream_pipeline
+from utils.batch import stream_batch
+from utils.database import init_database
+from utils.metrics import METRICS_ENABLED, render_metrics
+from jobs import submit_job, get_job, start_job_workers
+from runs import ArtifactStore, get_run, open_run
+from auth import AuthBusy, BCRYPT_LOG_ROUNDS, validate_credentials, validate_new_password, set_user_password, check_user_password
+from stories import list_stories, get_user_story, create_story, DEFAULT_PAGE_SIZE
+from search import search_stories, ensure_search_index
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 # Import auth and models (User/Story models can stay for backend DB access if needed)
-from models import db, bcrypt
+from models import db, bcrypt, User
+
+# Uploaded files larger than this spill from memory to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_KB', '256')) * 1024
+
+
+class SpooledUploadRequest(Request):
+    """Request whose file parts are streamed into spooled temporary files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
 
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
+
+# Reject request bodies (uploads included) above this size with 413
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '20'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///scriptoria.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # JWT configuration
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
+app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', '30')))
 
-# Initialize extensions
-db.init_app(app)
+# Password hashing cost (see auth.py)
+app.config['BCRYPT_LOG_ROUNDS'] = BCRYPT_LOG_ROUNDS
+
+# Initialize extensions (database settings come from DATABASE_URL, see utils/database.py)
+init_database(app, db)
 bcrypt.init_app(app)
+jwt = JWTManager(app)
 
 # Enhanced CORS configuration
 CORS(app, resources={
@@ -41,11 +72,147 @@ CORS(app, resources={
         "origins": "*",
         "methods": ["GET", "POST", "DELETE", "PUT", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type"],
+        "expose_headers": ["Content-Type", "ETag", "Content-Location"],
         "supports_credentials": False
     }
 })
 
+# Script length limits for /analyze_script
+MIN_SCRIPT_CHARS = 100
+MAX_SCRIPT_CHARS = int(os.getenv('MAX_SCRIPT_CHARS', '400000'))  # long scripts are analysed in chunks
+# Characters of extracted text returned by /upload; PDF extraction stops once reached
+UPLOAD_MAX_CHARS = int(os.getenv('UPLOAD_MAX_CHARS', '2000'))
+# Story ideas accepted by one /generate/batch request
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '50'))
+
+def validate_generate_request(data):
+    """
+    Validate a /generate payload
+    
+    Returns:
+        (story_idea, genre, error) - error is None when the payload is valid
+    """
+    if not data:
+        return None, None, "No data provided"
+    if not isinstance(data, dict):
+        return None, None, "Request body must be a JSON object"
+    
+    story_idea = data.get('storyIdea') or ''
+    genre = data.get('genre') or 'Drama'
+    if not isinstance(story_idea, str) or not isinstance(genre, str):
+        return None, None, "storyIdea and genre must be strings"
+    story_idea = story_idea.strip()
+    
+    if not story_idea:
+        return None, None, "Story idea is required"
+    if len(story_idea) < 20:
+        return None, None, "Story idea must be at least 20 characters"
+    if len(story_idea) > 500:
+        return None, None, "Story idea must be less than 500 characters"
+    
+    return story_idea, genre, None
+
+def validate_analyze_request(data):
+    """
+    Validate an /analyze_script payload
+    
+    Returns:
+        (script_text, genre, error) - error is None when the payload is valid
+    """
+    if not data:
+        return None, None, "No data provided"
+    if not isinstance(data, dict):
+        return None, None, "Request body must be a JSON object"
+    
+    script_text = data.get('scriptText') or ''
+    genre = data.get('genre') or 'Drama'
+    if not isinstance(script_text, str) or not isinstance(genre, str):
+        return None, None, "scriptText and genre must be strings"
+    script_text = script_text.strip()
+    
+    if not script_text:
+        return None, None, "Script text is required"
+    if len(script_text) < MIN_SCRIPT_CHARS:
+        return None, None, f"Script text is too short (minimum {MIN_SCRIPT_CHARS:,} characters)"
+    if len(script_text) > MAX_SCRIPT_CHARS:
+        return None, None, f"Script text is too long (maximum {MAX_SCRIPT_CHARS:,} characters)"
+    
+    return script_text, genre, None
+
+def validate_story_fields(data):
+    """
+    Check a /stories body and the types of its text fields
+    
+    Returns:
+        Error message, or None when the body is usable
+    """
+    if not isinstance(data, dict):
+        return "Request body must be a JSON object"
+    for key in ('title', 'storyIdea', 'genre'):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            return f"{key} must be a string"
+    return None
+
+def build_package_response(result, run_id=None):
+    """Response body for a finished generation/analysis pipeline"""
+    payload = {
+        "success": True,
+        **package_json(result),
+        "pipeline": result.report(),
+        "timestamp": datetime.now().isoformat()
+    }
+    if run_id:
+        payload["runId"] = run_id
+    return payload
+
+def open_pipeline_store(kind, params, run_id=None):
+    """
+    Stage output store for a generation/analysis request
+    
+    Resumes run_id when the client retries with one, otherwise starts a new
+    run. If run storage is unavailable the request still runs, just without
+    resume support.
+    
+    Returns:
+        (store, error) - error is set when run_id names no run of this kind
+    """
+    try:
+        stored_run_id = open_run(kind, params, run_id)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"⚠️  Run storage unavailable, continuing without resume support: {e}")
+        return None, None
+    if stored_run_id is None:
+        return None, "Run not found"
+    return ArtifactStore(app, stored_run_id), None
+
+def pipeline_error_response(e, message, label):
+    """
+    Map a pipeline exception to a (payload, status) error response
+    
+    Args:
+        e: The exception raised by the pipeline
+        message: User-facing error for general failures
+        label: Short name of the operation for the log line
+    """
+    error_msg = str(e)
+    if isinstance(e, ValueError):
+        # API key or configuration errors
+        print(f"❌ Configuration error: {error_msg}")
+        return {
+            "success": False,
+            "error": "API configuration error. Please check GROQ_API_KEY in .env file",
+            "details": error_msg
+        }, 500
+    
+    # General errors
+    print(f"❌ {label} error: {error_msg}")
+    return {
+        "success": False,
+        "error": message,
+        "details": error_msg
+    }, 500
+
 @app.route('/')
 def home():
     """Root endpoint to verify backend is running"""
@@ -55,8 +222,23 @@ def home():
         "version": "1.0.0",
         "endpoints": {
             "/health": "Health check",
+            "/health/models": "Upstream model health and rate limit state",
+            "/metrics": "Prometheus metrics",
             "/generate": "Generate screenplay (POST)",
             "/analyze_script": "Analyze existing script (POST)",
+            "/runs/<id>/regenerate/<section>": "Regenerate one section of an earlier run (POST)",
+            "/generate/stream": "Generate screenplay, streamed as Server-Sent Events (POST)",
+            "/generate/batch": "Generate many screenplays, streamed as newline-delimited JSON (POST)",
+            "/analyze_script/stream": "Analyze existing script, streamed as Server-Sent Events (POST)",
+            "/jobs": "Queue a generation or analysis job (POST)",
+            "/jobs/<id>": "Job status and stage progress (GET)",
+            "/jobs/<id>/result": "Finished job result (GET)",
+            "/auth/register": "Create an account (POST)",
+            "/auth/login": "Sign in for access and refresh tokens (POST)",
+            "/auth/refresh": "New access token from a refresh token (POST)",
+            "/stories": "List (GET) or save (POST) stories in your library",
+            "/stories/<id>": "Get, update (PUT) or delete a saved story",
+            "/stories/search": "Full-text search over your saved stories (GET)",
             "/upload": "Upload script file (POST)",
             "/export_pdf": "Export to PDF (POST)"
         }
@@ -67,220 +249,605 @@ def home():
 def generate():
     """
     Generate screenplay and characters using Gemini AI
+    
+    Pass the runId of a failed request to resume it.
     """
+    store = None
     try:
         data = request.get_json()
         
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "No data provided"
-            }), 400
-        
-        story_idea = data.get('storyIdea', '').strip()
-        genre = data.get('genre', 'Drama')
-        
-        # Validation
-        if not story_idea:
-            return jsonify({
-                "success": False,
-                "error": "Story idea is required"
-            }), 400
-        
-        if len(story_idea) < 20:
+        story_idea, genre, error = validate_generate_request(data)
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Story idea must be at least 20 characters"
+                "error": error
             }), 400
         
-        if len(story_idea) > 500:
+        store, error = open_pipeline_store('generate', {'story_idea': story_idea, 'genre': genre}, data.get('runId'))
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Story idea must be less than 500 characters"
-            }), 400
+                "error": error
+            }), 404
         
         print(f"🎬 Generating screenplay for: {story_idea[:50]}...")
         print(f"📝 Genre: {genre}")
         
-        # Generate screenplay using AI
-        print("⏳ Calling Groq API for screenplay...")
-        screenplay_data = generate_screenplay(story_idea, genre)
-        print("✅ Screenplay generated!")
-        
-        # Generate characters using AI
-        print("⏳ Generating characters...")
-        characters = generate_characters(screenplay_data)
-        print("✅ Characters generated!")
-        
-        # Generate scenes using AI
-        print("⏳ Generating scene breakdown...")
-        scenes = generate_scenes(screenplay_data, characters)
-        print("✅ Scenes generated!")
-        
-        # Generate sound design using AI
-        print("⏳ Generating sound design...")
-        sound_design = generate_sound_design(screenplay_data, scenes)
-        print("✅ Sound design generated!")
+        # Run screenplay → (characters | scenes → sound design) through the stage graph
+        result = run_generation(story_idea, genre, store=store)
         
-        response = {
-            "success": True,
-            "screenplay": screenplay_data,
-            "characters": characters,
-            "scenes": scenes,
-            "soundDesign": sound_design,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        return jsonify(response)
-    
-    except ValueError as e:
-        # API key or configuration errors
-        error_msg = str(e)
-        print(f"❌ Configuration error: {error_msg}")
-        return jsonify({
-            "success": False,
-            "error": "API configuration error. Please check GROQ_API_KEY in .env file",
-            "details": error_msg
-        }), 500
+        return jsonify(build_package_response(result, store and store.run_id))
     
     except Exception as e:
-        # General errors
-        error_msg = str(e)
-        print(f"❌ Generation error: {error_msg}")
-        return jsonify({
-            "success": False,
-            "error": "Failed to generate screenplay. Please try again.",
-            "details": error_msg
-        }), 500
+        payload, status = pipeline_error_response(e, "Failed to generate screenplay. Please try again.", "Generation")
+        if store is not None:
+            # Retrying with this id resumes from the last stage that succeeded
+            payload["runId"] = store.run_id
+        return jsonify(payload), status
 
 @app.route('/analyze_script', methods=['POST'])
 # @jwt_required()  # Temporarily disabled for testing
 def analyze_script_endpoint():
     """
     Analyze an existing script and generate pre-production materials
+    
+    Pass the runId of a failed request to resume it.
     """
+    store = None
     try:
         data = request.get_json()
         
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "No data provided"
-            }), 400
-        
-        script_text = data.get('scriptText', '').strip()
-        genre = data.get('genre', 'Drama')
-        
-        # Validation
-        if not script_text:
+        script_text, genre, error = validate_analyze_request(data)
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Script text is required"
+                "error": error
             }), 400
         
-        if len(script_text) < 100:
+        store, error = open_pipeline_store('analyze', {'script_text': script_text, 'genre': genre}, data.get('runId'))
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Script text is too short (minimum 100 characters)"
-            }), 400
-        
-        if len(script_text) > 100000:
-            return jsonify({
-                "success": False,
-                "error": "Script text is too long (maximum 100,000 characters)"
-            }), 400
+                "error": error
+            }), 404
         
         print(f"🎬 Analyzing existing script...")
         print(f"📝 Genre: {genre}")
         print(f"📄 Script length: {len(script_text)} characters")
         
-        # Analyze script using AI
-        print("⏳ Analyzing script structure...")
-        screenplay_data = analyze_script(script_text, genre)
-        print("✅ Script analyzed!")
-        
-        # Generate characters using AI
-        print("⏳ Generating character profiles...")
-        characters = generate_characters(screenplay_data)
-        print("✅ Characters generated!")
-        
-        # Generate scenes using AI
-        print("⏳ Generating scene breakdown...")
-        scenes = generate_scenes(screenplay_data, characters)
-        print("✅ Scenes generated!")
+        # Run analysis → (characters | scenes → sound design) through the stage graph
+        result = run_analysis(script_text, genre, store=store)
         
-        # Generate sound design using AI
-        print("⏳ Generating sound design...")
-        sound_design = generate_sound_design(screenplay_data, scenes)
-        print("✅ Sound design generated!")
-        
-        response = {
-            "success": True,
-            "screenplay": screenplay_data,
-            "characters": characters,
-            "scenes": scenes,
-            "soundDesign": sound_design,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        return jsonify(response)
+        return jsonify(build_package_response(result, store and store.run_id))
     
-    except ValueError as e:
-        # API key or configuration errors
-        error_msg = str(e)
-        print(f"❌ Configuration error: {error_msg}")
+    except Exception as e:
+        payload, status = pipeline_error_response(e, "Failed to analyze script. Please try again.", "Script analysis")
+        if store is not None:
+            payload["runId"] = store.run_id
+        return jsonify(payload), status
+
+@app.route('/runs/<run_id>/regenerate/<section>', methods=['POST'])
+def regenerate_run_section(run_id, section):
+    """
+    Generate a new version of one section of an earlier run
+    
+    Only the section and the sections that depend on it are regenerated
+    (characters: just characters; scenes: scenes and sound design;
+    screenplay: everything). The rest comes from the stored run.
+    """
+    if section not in SECTIONS:
         return jsonify({
             "success": False,
-            "error": "API configuration error. Please check GROQ_API_KEY in .env file",
-            "details": error_msg
-        }), 500
+            "error": f"Section must be one of: {', '.join(SECTIONS)}"
+        }), 400
+    
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"success": False, "error": "Run not found"}), 404
     
+    print(f"🔁 Regenerating {section} for run {run.id}")
+    try:
+        result, regenerated = regenerate_section(run.kind, json.loads(run.params), section,
+                                                 ArtifactStore(app, run.id))
     except Exception as e:
-        # General errors
-        error_msg = str(e)
-        print(f"❌ Script analysis error: {error_msg}")
+        label = "Script analysis" if run.kind == 'analyze' else "Generation"
+        payload, status = pipeline_error_response(e, f"Failed to regenerate {section}. Please try again.", label)
+        payload["runId"] = run.id
+        return jsonify(payload), status
+    
+    payload = build_package_response(result, run.id)
+    payload["regenerated"] = regenerated
+    return jsonify(payload)
+
+def sse_response(events):
+    """Wrap an SSE generator in an unbuffered streaming response"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Generate screenplay package, pushing each stage result as an SSE event
+    """
+    story_idea, genre, error = validate_generate_request(request.get_json(silent=True))
+    if error:
         return jsonify({
             "success": False,
-            "error": "Failed to analyze script. Please try again.",
-            "details": error_msg
+            "error": error
+        }), 400
+    
+    print(f"🎬 Streaming screenplay generation for: {story_idea[:50]}...")
+    return sse_response(stream_pipeline(
+        lambda listener, on_item, cancel: run_generation(story_idea, genre, listener=listener, on_item=on_item,
+                                                         cancel=cancel),
+        len(GENERATE_STAGES),
+        "Failed to generate screenplay. Please try again."
+    ))
+
+@app.route('/analyze_script/stream', methods=['POST'])
+def analyze_script_stream():
+    """
+    Analyze an existing script, pushing each stage result as an SSE event
+    """
+    script_text, genre, error = validate_analyze_request(request.get_json(silent=True))
+    if error:
+        return jsonify({
+            "success": False,
+            "error": error
+        }), 400
+    
+    print(f"🎬 Streaming script analysis ({len(script_text)} characters)...")
+    return sse_response(stream_pipeline(
+        lambda listener, on_item, cancel: run_analysis(script_text, genre, listener=listener, on_item=on_item,
+                                                       cancel=cancel),
+        len(ANALYZE_STAGES),
+        "Failed to analyze script. Please try again."
+    ))
+
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """
+    Generate packages for many story ideas, streamed as newline-delimited JSON
+    
+    Body: {"items": [{"storyIdea": ..., "genre": ...}, ...]}
+    
+    Each line is one item's /generate response plus its "index", in the
+    order items finish; a failed item doesn't stop the others. The last line
+    is a summary.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            "success": False,
+            "error": "items must be a non-empty list"
+        }), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            "success": False,
+            "error": f"Too many items (maximum {BATCH_MAX_ITEMS})"
+        }), 400
+    
+    valid = []
+    rejected = []
+    for index, item in enumerate(items):
+        story_idea, genre, error = validate_generate_request(item) if isinstance(item, dict) \
+            else (None, None, "Item must be an object")
+        if error:
+            rejected.append({"index": index, "success": False, "error": error})
+            continue
+        store, _ = open_pipeline_store('generate', {'story_idea': story_idea, 'genre': genre})
+        valid.append((index, (story_idea, genre, store)))
+    
+    async def run_item(item):
+        story_idea, genre, store = item
+        run_id = store and store.run_id
+        try:
+            result = await arun_generation(story_idea, genre, store=store)
+        except Exception as e:
+            payload, _ = pipeline_error_response(e, "Failed to generate screenplay. Please try again.", "Generation")
+        else:
+            payload = build_package_response(result, run_id)
+        if run_id:
+            payload["runId"] = run_id
+        payload["storyIdea"] = story_idea
+        return payload
+    
+    print(f"🎬 Batch generating {len(valid)} screenplay(s) ({len(rejected)} rejected)...")
+    return Response(stream_batch(valid, run_item, "Failed to generate screenplay. Please try again.", rejected),
+                    mimetype='application/x-ndjson', headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+def ensure_job_workers():
+    """Start in-process job workers on first use if JOB_INPROCESS_WORKERS is set (development; jobs normally run in worker.py)"""
+    start_job_workers(app, int(os.getenv('JOB_INPROCESS_WORKERS', '0')))
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a generation job and return its id immediately
+    
+    Body: {"type": "generate", "storyIdea": ..., "genre": ...}
+       or {"type": "analyze", "scriptText": ..., "genre": ...}
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('type', 'generate')
+    
+    if kind == 'generate':
+        story_idea, genre, error = validate_generate_request(data)
+        params = {'story_idea': story_idea, 'genre': genre}
+    elif kind == 'analyze':
+        script_text, genre, error = validate_analyze_request(data)
+        params = {'script_text': script_text, 'genre': genre}
+    else:
+        error = "Job type must be 'generate' or 'analyze'"
+    
+    if error:
+        return jsonify({
+            "success": False,
+            "error": error
+        }), 400
+    
+    try:
+        job = submit_job(kind, params)
+        ensure_job_workers()
+    except Exception as e:
+        print(f"❌ Job submit error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to queue job. Please try again.",
+            "details": str(e)
         }), 500
+    
+    print(f"📥 Queued {kind} job {job.id}")
+    return jsonify({
+        "success": True,
+        "jobId": job.id,
+        "status": job.status,
+        "statusUrl": f"/jobs/{job.id}",
+        "resultUrl": f"/jobs/{job.id}/result"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status and per-stage progress"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    
+    ensure_job_workers()
+    return jsonify({"success": True, "job": job.to_dict()})
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Result of a finished job; 202 while it is still queued or running"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    
+    if job.status in ('queued', 'running'):
+        ensure_job_workers()
+        return jsonify({"success": True, "job": job.to_dict()}), 202
+    
+    if job.status == 'failed':
+        return jsonify({
+            "success": False,
+            "error": "Failed to analyze script. Please try again." if job.kind == 'analyze'
+                     else "Failed to generate screenplay. Please try again.",
+            "details": job.error
+        }), 500
+    
+    response = json.loads(job.result)
+    response.update({
+        "success": True,
+        "jobId": job.id,
+        "timestamp": job.finished_at.isoformat()
+    })
+    return jsonify(response)
+
+def current_user_id():
+    """Id of the user the request's access token belongs to"""
+    return int(get_jwt_identity())
+
+def auth_tokens(user):
+    """
+    Access and refresh tokens for a user
+    
+    The identity is the user id and the email rides along as a claim, so
+    protected routes never need to load the user.
+    """
+    claims = {"email": user.email}
+    return {
+        "accessToken": create_access_token(identity=str(user.id), additional_claims=claims),
+        "refreshToken": create_refresh_token(identity=str(user.id), additional_claims=claims)
+    }
+
+def auth_busy_response(e):
+    response = jsonify({"success": False, "error": str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route('/auth/register', methods=['POST'])
+def register():
+    """
+    Create an account
+    
+    Body: {"email": ..., "password": ...}
+    """
+    email, password, error = validate_credentials(request.get_json(silent=True))
+    error = error or validate_new_password(password)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    if User.query.filter_by(email=email).first() is not None:
+        return jsonify({"success": False, "error": "An account with this email already exists"}), 409
+    
+    user = User(email=email)
+    try:
+        set_user_password(user, password)
+    except AuthBusy as e:
+        return auth_busy_response(e)
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Registered by a concurrent request since the check above
+        db.session.rollback()
+        return jsonify({"success": False, "error": "An account with this email already exists"}), 409
+    
+    return jsonify({"success": True, "user": user.to_dict(), **auth_tokens(user)}), 201
+
+@app.route('/auth/login', methods=['POST'])
+def login():
+    """
+    Sign in
+    
+    Body: {"email": ..., "password": ...}
+    Returns an access token for the Authorization header and a refresh
+    token for /auth/refresh.
+    """
+    email, password, error = validate_credentials(request.get_json(silent=True))
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
+    user = User.query.filter_by(email=email).first()
+    try:
+        if not check_user_password(user, password):
+            return jsonify({"success": False, "error": "Invalid email or password"}), 401
+    except AuthBusy as e:
+        return auth_busy_response(e)
+    
+    return jsonify({"success": True, "user": user.to_dict(), **auth_tokens(user)})
+
+@app.route('/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """New access token, sent with the refresh token in the Authorization header"""
+    token = create_access_token(identity=get_jwt_identity(), additional_claims={"email": get_jwt().get("email")})
+    return jsonify({"success": True, "accessToken": token})
+
+@app.route('/stories', methods=['GET'])
+@jwt_required()
+def story_list():
+    """
+    One page of the user's story library, most recently updated first
+    
+    Query: limit (default 20, max 100), cursor (nextCursor of the previous page)
+    Stories are summaries; fetch /stories/<id> for the screenplay and characters.
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        stories, next_cursor = list_stories(current_user_id(), limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    return jsonify({
+        "success": True,
+        "stories": [story.to_dict(include_content=False) for story in stories],
+        "nextCursor": next_cursor
+    })
+
+@app.route('/stories/search', methods=['GET'])
+@jwt_required()
+def story_search():
+    """
+    Search the user's stories by title, idea, outline and characters
+    
+    Query: q (words to match; the last one may be partial), limit (default 20, max 50)
+    Results are best match first, each with an HTML-escaped snippet where
+    matches are wrapped in <mark>.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"success": False, "error": "Search query is required"}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit must be a number"}), 400
+    
+    results = search_stories(current_user_id(), query, limit)
+    return jsonify({
+        "success": True,
+        "stories": [dict(story.to_dict(include_content=False), snippet=snippet) for story, snippet in results]
+    })
+
+@app.route('/stories', methods=['POST'])
+@jwt_required()
+def story_create():
+    """
+    Save a generated package to the library
+    
+    Body: {"screenplay": {...}, "characters": [...], "scenes": [...], "soundDesign": {...},
+           "storyIdea": ..., "genre": ...}
+    """
+    data = request.get_json(silent=True) or {}
+    error = validate_story_fields(data)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    if not data.get('screenplay'):
+        return jsonify({"success": False, "error": "Screenplay is required"}), 400
+    
+    ensure_search_index()
+    try:
+        story = create_story(current_user_id(), data['screenplay'], data.get('characters'),
+                             story_idea=data.get('storyIdea'), genre=data.get('genre'),
+                             scenes=data.get('scenes'), sound_design=data.get('soundDesign'))
+    except SchemaError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": "Invalid screenplay data", "details": str(e)}), 400
+    
+    return jsonify({"success": True, "story": story.to_dict()}), 201
+
+@app.route('/stories/<int:story_id>', methods=['GET'])
+@jwt_required()
+def story_detail(story_id):
+    """A saved story with its screenplay, characters, scenes and sound design"""
+    story = get_user_story(current_user_id(), story_id)
+    if story is None:
+        return jsonify({"success": False, "error": "Story not found"}), 404
+    return jsonify({"success": True, "story": story.to_dict()})
+
+@app.route('/stories/<int:story_id>', methods=['PUT'])
+@jwt_required()
+def story_update(story_id):
+    """
+    Update a saved story
+    
+    Body: any of screenplay, characters, scenes, soundDesign, storyIdea, title, genre
+    """
+    ensure_search_index()
+    story = get_user_story(current_user_id(), story_id)
+    if story is None:
+        return jsonify({"success": False, "error": "Story not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    error = validate_story_fields(data)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    try:
+        if any(key in data for key in ('screenplay', 'characters', 'scenes', 'soundDesign')):
+            package = story.package_data
+            # Content edits keep the stored title; only a title field changes it
+            story.set_content(data.get('screenplay') or package['screenplay'],
+                              data['characters'] if 'characters' in data else package['characters'],
+                              data['scenes'] if 'scenes' in data else package['scenes'],
+                              data['soundDesign'] if 'soundDesign' in data else package['soundDesign'],
+                              title=story.title)
+    except SchemaError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": "Invalid screenplay data", "details": str(e)}), 400
+    
+    if 'storyIdea' in data:
+        story.story_idea = data['storyIdea']
+    if data.get('title'):
+        story.title = data['title'][:255]
+    if 'genre' in data:
+        story.genre = (data['genre'] or '')[:50] or None
+    db.session.commit()
+    return jsonify({"success": True, "story": story.to_dict()})
+
+@app.route('/stories/<int:story_id>', methods=['DELETE'])
+@jwt_required()
+def story_delete(story_id):
+    """Remove a story from the library"""
+    ensure_search_index()
+    story = get_user_story(current_user_id(), story_id)
+    if story is None:
+        return jsonify({"success": False, "error": "Story not found"}), 404
+    db.session.delete(story)
+    db.session.commit()
+    return jsonify({"success": True})
+
+def pdf_download_name(data):
+    """Safe attachment filename for a package's PDF"""
+    filename = f"Scriptoria_{(data.get('screenplay') or {}).get('title', 'Script')}.pdf"
+    return "".join(x for x in filename if x.isalnum() or x in "._- ")
+
+def send_cached_pdf(key, path_or_buffer, filename):
+    """PDF attachment response carrying the content hash as its ETag"""
+    response = send_file(
+        path_or_buffer,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/pdf',
+        conditional=False,
+        etag=False
+    )
+    response.set_etag(key)
+    response.headers['Content-Location'] = f'/export_pdf/{key}'
+    # Content-addressed: the bytes behind this key never change
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
+def not_modified(key):
+    response = Response(status=304)
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
 
 @app.route('/export_pdf', methods=['POST'])
 def export_pdf():
     """
     Export screenplay package to PDF
+    
+    Renders are cached on disk under a hash of the package content. The
+    hash is returned as the ETag; If-None-Match gets a 304 and the cached
+    file can be fetched again from GET /export_pdf/<etag>.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        pdf_buffer = generate_pdf(data)
+        if not isinstance(data, dict) or not isinstance(data.get('screenplay'), dict):
+            return jsonify({"error": "Request body must be a JSON object with a screenplay object"}), 400
         
-        filename = f"Scriptoria_{data['screenplay'].get('title', 'Script')}.pdf"
-        filename = "".join(x for x in filename if x.isalnum() or x in "._- ")
+        key = pdf_cache_key(data)
+        if key in request.if_none_match:
+            return not_modified(key)
         
-        # Get the PDF size for Content-Length header
-        pdf_buffer.seek(0, 2)  # Seek to end
-        pdf_size = pdf_buffer.tell()
-        pdf_buffer.seek(0)  # Seek back to start
+        filename = pdf_download_name(data)
+        cache = get_pdf_cache()
+        path = cache.get(key) if cache else None
+        if path:
+            print("📦 Serving cached PDF")
+            return send_cached_pdf(key, path, filename)
         
-        response = send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/pdf'
-        )
-        
-        # Add explicit headers to prevent network errors
-        response.headers['Content-Length'] = str(pdf_size)
-        response.headers['Cache-Control'] = 'no-cache'
+        pdf_buffer = generate_pdf(data)
+        if cache:
+            try:
+                return send_cached_pdf(key, cache.put(key, pdf_buffer.getvalue()), filename)
+            except OSError as e:
+                print(f"⚠️  Could not cache PDF: {e}")
         
-        return response
+        return send_cached_pdf(key, pdf_buffer, filename)
+    except SchemaError as e:
+        return jsonify({"error": f"Invalid package: {str(e)}"}), 400
     except Exception as e:
         print(f"❌ PDF Export error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/export_pdf/<key>', methods=['GET'])
+def export_pdf_cached(key):
+    """
+    Re-download a previously exported PDF by its ETag
+    """
+    if len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+        return jsonify({"error": "Invalid PDF key"}), 400
+    if key in request.if_none_match:
+        return not_modified(key)
+    
+    cache = get_pdf_cache()
+    path = cache.get(key) if cache else None
+    if not path:
+        return jsonify({"error": "PDF not found or expired; export it again"}), 404
+    
+    filename = request.args.get('filename', 'Scriptoria.pdf')
+    filename = "".join(x for x in filename if x.isalnum() or x in "._- ") or 'Scriptoria.pdf'
+    return send_cached_pdf(key, path, filename)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and extract text."""
@@ -292,42 +859,75 @@ def upload_file():
         return jsonify({"error": "No selected file"}), 400
     
     if file:
-        filename = file.filename.lower()
         try:
-            file_stream = io.BytesIO(file.read())
+            # Read straight from the spooled upload; no in-memory copy
+            file_stream = file.stream
+            file_type = detect_file_type(file_stream)
             
-            if filename.endswith('.pdf'):
-                raw_text = extract_text_from_pdf(file_stream)
-            elif filename.endswith(('.doc', '.docx')):
-                raw_text = extract_text_from_docx(file_stream)
+            # PDFs stop at the response budget; their full length is then estimated
+            if file_type == 'pdf':
+                raw_text, full_length, estimated = preview_pdf(file_stream, max_chars=UPLOAD_MAX_CHARS + 1)
+            elif file_type == 'docx':
+                raw_text, full_length, estimated = preview_docx(file_stream, max_chars=UPLOAD_MAX_CHARS + 1)
+            elif file_type == 'doc':
+                return jsonify({"error": "Legacy .doc files are not supported. Please save as DOCX or PDF."}), 400
             else:
                 return jsonify({"error": "Unsupported file format. Please upload PDF or DOCX."}), 400
             
             extracted_text = clean_text(raw_text)
             
-            if len(extracted_text) < 20:
+            if full_length < 20:
                 return jsonify({"error": "Extracting text failed or content too short (min 20 chars)."}), 400
             
             return jsonify({
                 "success": True,
-                "extracted_text": extracted_text[:2000],  # Limit to 2000 chars for safety
-                "full_length": len(extracted_text)
+                "extracted_text": extracted_text[:UPLOAD_MAX_CHARS],
+                "full_length": full_length,
+                "full_length_estimated": estimated,
+                "truncated": estimated or full_length > UPLOAD_MAX_CHARS
             })
             
         except Exception as e:
             print(f"❌ Upload error: {str(e)}")
             return jsonify({"error": f"Failed to process file: {str(e)}"}), 500
 
+@app.errorhandler(413)
+def request_too_large(e):
+    """JSON body for uploads over MAX_CONTENT_LENGTH"""
+    return jsonify({"error": f"File too large (maximum {MAX_UPLOAD_MB} MB)"}), 413
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     api_key_set = bool(os.getenv('GROQ_API_KEY'))
+    cache = get_ai_cache()
     return jsonify({
         "status": "healthy",
         "message": "Scriptoria backend is running",
-        "ai_configured": api_key_set
+        "ai_configured": api_key_set,
+        "ai_cache": cache.stats() if cache else None
     })
 
+@app.route('/health/models', methods=['GET'])
+def model_health():
+    """Circuit breaker and rate limit state for each model in the fallback chain"""
+    health = get_model_health().snapshot(MODELS)
+    limits = get_rate_limiter().snapshot()
+    return jsonify({
+        "models": [
+            dict(health[model], model=model, rateLimit=limits.get(model))
+            for model in MODELS
+        ]
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (summed across gunicorn workers in multiprocess mode)"""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics unavailable: prometheus_client is not installed"}), 503
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 if __name__ == '__main__':
     print("🎬 Scriptoria Backend Starting...")
     print("📡 Server running at http://localhost:5000")
@@ -344,6 +944,8 @@ if __name__ == '__main__':
     else:
         print("⚠️  WARNING: GROQ_API_KEY not found in .env file")
         print("💡 Create a .env file with your API key to enable AI generation")
+    if not int(os.getenv('JOB_INPROCESS_WORKERS', '0')):
+        print("💡 Jobs queued via /jobs run in `python worker.py` (or set JOB_INPROCESS_WORKERS for local runs)")
     
     # Check JWT secret
     if not os.getenv('JWT_SECRET_KEY'):
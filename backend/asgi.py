@@ -0,0 +1,177 @@
+"""
+ASGI entry point for Scriptoria
+/generate and /analyze_script run natively on asyncio, so one process can
+hold hundreds of upstream Groq calls without a thread per request. Every
+other route is served by the Flask app through asgiref's WSGI adapter.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import json
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app as flask_app,
+    MAX_UPLOAD_MB,
+    validate_generate_request,
+    validate_analyze_request,
+    build_package_response,
+    pipeline_error_response,
+    open_pipeline_store,
+)
+from generators.pipeline import arun_generation, arun_analysis
+
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+def in_app_context(func, *args):
+    """Call a Flask-side helper that needs the app context (from a worker thread)"""
+    with flask_app.app_context():
+        return func(*args)
+
+
+class BodyTooLarge(Exception):
+    """Request body over the Flask app's MAX_CONTENT_LENGTH"""
+
+
+def content_length(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def read_json(scope, receive):
+    """
+    Read the full request body and decode it as JSON (None if invalid)
+
+    Raises:
+        BodyTooLarge: If the body is over MAX_CONTENT_LENGTH (checked from
+            Content-Length up front and while reading)
+    """
+    limit = flask_app.config.get('MAX_CONTENT_LENGTH')
+    declared = content_length(scope)
+    if limit is not None and declared is not None and declared > limit:
+        raise BodyTooLarge()
+
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    body = b''.join(chunks)
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def send_json(send, payload, status=200):
+    """Send a JSON response with the same CORS headers the Flask app uses"""
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-expose-headers', b'Content-Type'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def generate(data):
+    store = None
+    try:
+        story_idea, genre, error = validate_generate_request(data)
+        if error:
+            return {"success": False, "error": error}, 400
+
+        store, error = await asyncio.to_thread(in_app_context, open_pipeline_store, 'generate',
+                                               {'story_idea': story_idea, 'genre': genre}, data.get('runId'))
+        if error:
+            return {"success": False, "error": error}, 404
+
+        print(f"🎬 Generating screenplay for: {story_idea[:50]}...")
+        print(f"📝 Genre: {genre}")
+        result = await arun_generation(story_idea, genre, store=store)
+        return build_package_response(result, store and store.run_id), 200
+    except Exception as e:
+        payload, status = pipeline_error_response(e, "Failed to generate screenplay. Please try again.", "Generation")
+        if store is not None:
+            payload["runId"] = store.run_id
+        return payload, status
+
+
+async def analyze_script(data):
+    store = None
+    try:
+        script_text, genre, error = validate_analyze_request(data)
+        if error:
+            return {"success": False, "error": error}, 400
+
+        store, error = await asyncio.to_thread(in_app_context, open_pipeline_store, 'analyze',
+                                               {'script_text': script_text, 'genre': genre}, data.get('runId'))
+        if error:
+            return {"success": False, "error": error}, 404
+
+        print(f"🎬 Analyzing existing script...")
+        print(f"📝 Genre: {genre}")
+        print(f"📄 Script length: {len(script_text)} characters")
+        result = await arun_analysis(script_text, genre, store=store)
+        return build_package_response(result, store and store.run_id), 200
+    except Exception as e:
+        payload, status = pipeline_error_response(e, "Failed to analyze script. Please try again.", "Script analysis")
+        if store is not None:
+            payload["runId"] = store.run_id
+        return payload, status
+
+
+# POST routes served natively; everything else (including CORS preflight)
+# goes through Flask.
+ASYNC_ROUTES = {
+    '/generate': generate,
+    '/analyze_script': analyze_script,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = ASYNC_ROUTES.get(scope.get('path'))
+    if scope['type'] == 'http' and scope['method'] == 'POST' and handler is not None:
+        try:
+            data = await read_json(scope, receive)
+        except BodyTooLarge:
+            await send_json(send, {"error": f"File too large (maximum {MAX_UPLOAD_MB} MB)"}, 413)
+            return
+        payload, status = await handler(data)
+        await send_json(send, payload, status)
+        return
+
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,146 @@
+"""
+Password hashing and verification off the request threads
+bcrypt is deliberately slow, so its work runs on a small dedicated pool
+(AUTH_HASH_WORKERS threads; bcrypt releases the GIL while hashing) with a
+bounded backlog. A burst of logins waits for, or is turned away from, that
+pool instead of taking every CPU from generation requests. Successful
+verifications are remembered for a few minutes, so clients that log in
+repeatedly don't pay for bcrypt each time.
+"""
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from models import bcrypt
+from utils.ai_cache import MemoryCache
+
+# bcrypt cost factor (each step doubles the work)
+BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
+# Threads hashing at once, and hashes allowed to wait for one
+HASH_WORKERS = int(os.getenv('AUTH_HASH_WORKERS', '2'))
+HASH_BACKLOG = int(os.getenv('AUTH_HASH_BACKLOG', '32'))
+# Seconds a request waits for its hash before giving up
+HASH_TIMEOUT = float(os.getenv('AUTH_HASH_TIMEOUT', '10'))
+# Seconds a successful verification is remembered
+VERIFY_CACHE_SECONDS = float(os.getenv('AUTH_VERIFY_CACHE_SECONDS', '300'))
+
+MIN_PASSWORD_LENGTH = 8
+MAX_PASSWORD_LENGTH = 72  # bcrypt ignores bytes past 72
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_BACKLOG)
+
+# Keys are keyed hashes of (stored hash, password), so no password sits in memory
+_verified = MemoryCache(max_entries=4096, ttl=VERIFY_CACHE_SECONDS)
+_cache_secret = secrets.token_bytes(32)
+_dummy_hash = None
+
+
+class AuthBusy(Exception):
+    """The hashing pool's backlog is full; the client should retry shortly"""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt')
+    return _executor
+
+
+def _run_hashing(func, *args):
+    """
+    Run bcrypt work on the hashing pool and wait for it
+
+    Raises:
+        AuthBusy: If HASH_BACKLOG requests are already waiting, or the
+            result takes longer than HASH_TIMEOUT
+    """
+    if not _slots.acquire(blocking=False):
+        raise AuthBusy("Too many sign-ins in progress, please retry shortly")
+    try:
+        future = _get_executor().submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except TimeoutError as e:
+        raise AuthBusy("Sign-in is taking too long, please retry shortly") from e
+
+
+def validate_credentials(data) -> tuple:
+    """
+    Pull email and password out of a request body
+
+    Returns:
+        (email, password, error) - error is None when both are usable
+    """
+    if not isinstance(data, dict):
+        return None, None, "Request body must be JSON"
+    email = str(data.get('email') or '').strip().lower()
+    password = data.get('password')
+    if not _EMAIL.match(email) or len(email) > 120:
+        return None, None, "A valid email is required"
+    if not isinstance(password, str) or not password:
+        return None, None, "Password is required"
+    return email, password, None
+
+
+def validate_new_password(password: str):
+    """Error message for a password that can't be registered, or None"""
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return f"Password must be at least {MIN_PASSWORD_LENGTH} characters"
+    if len(password.encode('utf-8')) > MAX_PASSWORD_LENGTH:
+        return f"Password must be at most {MAX_PASSWORD_LENGTH} bytes"
+    return None
+
+
+def set_user_password(user, password: str):
+    """Hash a password on the hashing pool and store it on the user"""
+    _run_hashing(user.set_password, password)
+
+
+def _cache_key(password_hash: str, password: str) -> str:
+    material = f'{password_hash}\0{password}'.encode('utf-8')
+    return hmac.new(_cache_secret, material, hashlib.sha256).hexdigest()
+
+
+def check_user_password(user, password: str) -> bool:
+    """
+    Verify a password against a user's stored hash
+
+    Args:
+        user: User row, or None for an unknown email (a dummy hash is
+            checked so response times don't reveal which emails exist)
+        password: Password as submitted
+
+    Returns:
+        True if the password matches
+
+    Raises:
+        AuthBusy: If the hashing pool's backlog is full
+    """
+    global _dummy_hash
+    if user is None:
+        if _dummy_hash is None:
+            _dummy_hash = _run_hashing(bcrypt.generate_password_hash, secrets.token_hex(16))
+        _run_hashing(bcrypt.check_password_hash, _dummy_hash, password)
+        return False
+
+    key = _cache_key(user.password_hash, password)
+    if _verified.get(key):
+        return True
+    if not _run_hashing(user.check_password, password):
+        return False
+    # Keyed on the stored hash, so a password change invalidates it
+    _verified.set(key, '1')
+    return True
@@ -0,0 +1,161 @@
+"""
+Benchmark mixed SQLite reads and writes across processes
+
+Writer processes save stories and update job heartbeats the way web and job
+workers do, while reader processes page through the library and open
+stories. The same load runs against the default engine (rollback journal)
+and the one utils.database configures (WAL and pragmas).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_database [--seconds 5] [--readers 4] [--writers 2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.exc import OperationalError
+
+from models import db, User, Story, Job
+from utils.database import configure_engine, engine_options
+from utils.package_codec import encode_package
+
+SEED_STORIES = 2000
+PAGE_SIZE = 20
+
+
+def make_engine(url: str, tuned: bool):
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    configure_engine(engine)
+    return engine
+
+
+def sample_package(i: int) -> bytes:
+    return encode_package({
+        'screenplay': {'title': f'Story {i}', 'logline': 'A keeper of a lighthouse finds a message. ' * 5,
+                       'threeActStructure': {f'act{a}': {'title': f'Act {a}', 'description': 'Events unfold. ' * 30}
+                                             for a in (1, 2, 3)}},
+        'characters': [{'name': 'Ann', 'role': 'Lead', 'arc': 'learns to let go'}],
+        'scenes': [], 'soundDesign': None
+    })
+
+
+def seed(url: str, tuned: bool):
+    engine = make_engine(url, tuned)
+    if not tuned:
+        with engine.begin() as connection:
+            connection.execute(text("PRAGMA journal_mode=DELETE"))
+    db.metadata.create_all(engine, tables=[User.__table__, Story.__table__, Job.__table__])
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert().values(id=1, email='bench@example.com', password_hash='x',
+                                                          created_at=now))
+        connection.execute(Story.__table__.insert(), [
+            {'user_id': 1, 'title': f'Story {i}', 'screenplay': '', 'package': sample_package(i),
+             'created_at': now, 'updated_at': now} for i in range(SEED_STORIES)
+        ])
+        connection.execute(Job.__table__.insert(), [
+            {'id': f'job{i}', 'kind': 'generate', 'status': 'running', 'params': '{}', 'created_at': now}
+            for i in range(20)
+        ])
+    engine.dispose()
+
+
+def writer(url: str, tuned: bool, seconds: float, results):
+    engine = make_engine(url, tuned)
+    stories, jobs = Story.__table__, Job.__table__
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                now = datetime.utcnow()
+                connection.execute(stories.insert().values(
+                    user_id=1, title=f'New {os.getpid()}-{i}', screenplay='', package=sample_package(i),
+                    created_at=now, updated_at=now))
+            with engine.begin() as connection:
+                connection.execute(update(jobs).where(jobs.c.id == f'job{i % 20}')
+                                   .values(heartbeat_at=datetime.utcnow(), progress='{"screenplay":"completed"}'))
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put(('write', latencies, errors))
+
+
+def reader(url: str, tuned: bool, seconds: float, results):
+    engine = make_engine(url, tuned)
+    stories = Story.__table__
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(
+                    select(stories.c.id, stories.c.title, stories.c.updated_at)
+                    .where(stories.c.user_id == 1)
+                    .order_by(stories.c.updated_at.desc(), stories.c.id.desc()).limit(PAGE_SIZE)
+                ).all()
+                story_id = random.randint(1, SEED_STORIES)
+                connection.execute(select(stories.c.package).where(stories.c.id == story_id)).first()
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put(('read', latencies, errors))
+
+
+def run(tuned: bool, seconds: float, readers: int, writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        seed(url, tuned)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=writer, args=(url, tuned, seconds, results))
+                     for _ in range(writers)]
+        processes += [multiprocessing.Process(target=reader, args=(url, tuned, seconds, results))
+                      for _ in range(readers)]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    summary = {}
+    for kind in ('read', 'write'):
+        latencies = sorted(l for k, ls, _ in collected if k == kind for l in ls)
+        errors = sum(e for k, _, e in collected if k == kind)
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+        summary[kind] = (len(latencies) / seconds, statistics.median(latencies) * 1000 if latencies else 0.0,
+                         p99 * 1000, errors)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.readers} reader and {args.writers} writer processes, {args.seconds:g}s per engine\n")
+    print(f"{'engine':<10}{'op':<7}{'ops/s':>10}{'p50 (ms)':>11}{'p99 (ms)':>11}{'locked':>9}")
+    for name, tuned in (('default', False), ('tuned', True)):
+        summary = run(tuned, args.seconds, args.readers, args.writers)
+        for kind, (rate, p50, p99, errors) in summary.items():
+            print(f"{name:<10}{kind:<7}{rate:>10.0f}{p50:>11.2f}{p99:>11.2f}{errors:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark utils.json_helper against the previous regex-chain implementation
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_json_helper
+"""
+import json
+import re
+import timeit
+
+from utils import json_helper
+
+
+def legacy_safe_parse_json(response: str):
+    """The pre-scanner implementation, kept here for comparison"""
+    response = "".join(char for char in response if ord(char) >= 32 or char in "\n\r\t")
+    json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+    if json_match:
+        json_str = json_match.group(1).strip()
+    else:
+        first_bracket = response.find('[')
+        first_brace = response.find('{')
+        start_idx = -1
+        if first_bracket != -1 and (first_brace == -1 or first_bracket < first_brace):
+            start_idx, end_char = first_bracket, ']'
+        elif first_brace != -1:
+            start_idx, end_char = first_brace, '}'
+        json_str = response.strip()
+        if start_idx != -1:
+            last_idx = response.rfind(end_char)
+            if last_idx != -1:
+                json_str = response[start_idx:last_idx + 1].strip()
+    cleaned_str = re.sub(r',\s*([\]}])', r'\1', json_str)
+    try:
+        return json.loads(cleaned_str)
+    except json.JSONDecodeError as first_error:
+        very_clean_str = re.sub(r'//.*?\n', '\n', cleaned_str)
+        very_clean_str = re.sub(r'/\*.*?\*/', '', very_clean_str, flags=re.DOTALL)
+        try:
+            return json.loads(very_clean_str)
+        except Exception:
+            raise first_error
+
+
+def sample_package() -> dict:
+    """A scene breakdown roughly the size of a real JSON-mode response"""
+    return {"scenes": [{
+        "sceneNumber": i,
+        "location": "INT. WAREHOUSE - NIGHT",
+        "timeOfDay": "NIGHT",
+        "characters": ["Detective Arjun Rao", "Maya Chen"],
+        "action": "Arjun steps through the broken door, flashlight sweeping crates stamped with "
+                  "the harbor authority's seal. Maya hangs back, listening for footsteps. " * 2,
+        "duration": "2.5"
+    } for i in range(1, 31)]}
+
+
+def cases() -> dict:
+    payload = json.dumps(sample_package(), indent=2)
+    return {
+        "clean JSON": payload,
+        "fenced with prose": f"Here is the breakdown you asked for:\n```json\n{payload}\n```\nLet me know!",
+        "trailing commas": payload.replace('"duration": "2.5"\n', '"duration": "2.5",\n'),
+        "comments": payload.replace('"sceneNumber"', '// scene\n    "sceneNumber"'),
+    }
+
+
+def main(number: int = 200):
+    print(f"{'case':<20}{'legacy (ms)':>14}{'scanner (ms)':>14}{'speedup':>10}")
+    for name, text in cases().items():
+        legacy = timeit.timeit(lambda: legacy_safe_parse_json(text), number=number) / number * 1000
+        current = timeit.timeit(lambda: json_helper.safe_parse_json(text), number=number) / number * 1000
+        print(f"{name:<20}{legacy:>14.3f}{current:>14.3f}{legacy / current:>9.1f}x")
+
+    # Correctness inside strings: the legacy trailing-comma regex rewrites values
+    tricky = '{"note": "keep this ,] intact", "items": [1, 2,],}'
+    print("\nstring contents preserved:")
+    print("  legacy: ", legacy_safe_parse_json(tricky)["note"])
+    print("  scanner:", json_helper.safe_parse_json(tricky)["note"])
+    print(f"\nparser backend: {'orjson' if json_helper.orjson else 'json'}")
+
+
+if __name__ == '__main__':
+    main()
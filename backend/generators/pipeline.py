@@ -0,0 +1,184 @@
+"""
+Stage graphs for the generation and analysis pipelines
+Each stage lists exactly what it needs, so characters and scenes can run
+side by side once the screenplay outline exists.
+
+For uploaded scripts the screenplay parser runs up front; when it finds a
+properly formatted screenplay the scene breakdown is taken from it directly
+instead of asking the model.
+
+Given a stage output store (see runs.py), stages that already succeeded for
+the same inputs are reused rather than generated again.
+"""
+import os
+
+from generators.screenplay_generator import generate_screenplay, agenerate_screenplay
+from generators.character_generator import generate_characters, agenerate_characters
+from generators.scene_generator import generate_scenes, agenerate_scenes
+from generators.sound_design_generator import generate_sound_design, agenerate_sound_design
+from generators.script_analyzer import analyze_script, aanalyze_script
+from utils.ai_client import fresh_completions
+from utils.pipeline import Stage, run_pipeline, arun_pipeline, dependents, PipelineResult
+from utils.screenplay_parser import parse_screenplay, is_formatted_screenplay
+from utils.schema import normalize_scenes, to_json
+
+# Parsed scripts with at least this many sluglines skip the LLM scene stage
+MIN_PARSED_SCENES = int(os.getenv('MIN_PARSED_SCENES', '3'))
+
+# Scenes only need character names, which the outline already provides via
+# mainCharacters, so they do not wait for full character profiles.
+DOWNSTREAM_STAGES = [
+    Stage('characters', generate_characters, requires=('screenplay',), afunc=agenerate_characters),
+    Stage('scenes', generate_scenes, requires=('screenplay',), afunc=agenerate_scenes),
+    Stage('soundDesign', generate_sound_design, requires=('screenplay', 'scenes'), afunc=agenerate_sound_design),
+]
+
+GENERATE_STAGES = [
+    Stage('screenplay', generate_screenplay, requires=('story_idea', 'genre'), afunc=agenerate_screenplay),
+] + DOWNSTREAM_STAGES
+
+ANALYZE_STAGES = [
+    Stage('screenplay', analyze_script, requires=('script_text', 'genre', 'parsed'), afunc=aanalyze_script),
+] + DOWNSTREAM_STAGES
+
+# Package sections that can be regenerated on their own
+SECTIONS = tuple(stage.name for stage in GENERATE_STAGES)
+
+
+def parsed_scenes(parsed: dict) -> list:
+    """Scene breakdown straight from the screenplay parser"""
+    return normalize_scenes(parsed['scenes'])
+
+
+def package_json(result: PipelineResult) -> dict:
+    """
+    The package sections of a finished run as JSON-ready dicts
+
+    Stages hand typed schema objects to each other; this is where they are
+    turned back into the camelCase JSON clients get.
+    """
+    return {name: to_json(result[name]) for name in SECTIONS}
+
+
+def analysis_stages(parsed: dict) -> list:
+    """
+    Stage graph for an uploaded script
+
+    Formatted screenplays get their scenes from the parser, so the scenes
+    stage (and sound design after it) no longer waits on the model.
+    """
+    if not is_formatted_screenplay(parsed, MIN_PARSED_SCENES):
+        return ANALYZE_STAGES
+    print(f"📜 Parsed {len(parsed['scenes'])} scenes locally, skipping AI scene breakdown")
+    return [
+        Stage('scenes', parsed_scenes, requires=('parsed',)) if stage.name == 'scenes' else stage
+        for stage in ANALYZE_STAGES
+    ]
+
+
+def analysis_inputs(script_text: str, genre: str) -> dict:
+    return {'script_text': script_text, 'genre': genre, 'parsed': parse_screenplay(script_text)}
+
+
+def run_generation(story_idea: str, genre: str, listener=None, on_item=None, store=None,
+                   cancel=None) -> PipelineResult:
+    """
+    Run the full pre-production pipeline for a new story idea
+
+    Args:
+        story_idea: User's story concept
+        genre: Selected genre
+        listener: Optional stage event callback (see run_pipeline)
+        on_item: Optional partial result callback; scenes are reported one
+            by one as they stream in
+        store: Optional stage output store for resuming an earlier run
+        cancel: Optional threading.Event that stops the run before its next stage
+
+    Returns:
+        PipelineResult with screenplay, characters, scenes and soundDesign
+    """
+    return run_pipeline(GENERATE_STAGES, {'story_idea': story_idea, 'genre': genre},
+                        listener=listener, on_item=on_item, store=store, cancel=cancel)
+
+
+def run_analysis(script_text: str, genre: str, listener=None, on_item=None, store=None,
+                 cancel=None) -> PipelineResult:
+    """
+    Run the pre-production pipeline for an existing script
+
+    Args:
+        script_text: Full text of the existing script
+        genre: Genre of the script
+        listener: Optional stage event callback (see run_pipeline)
+        on_item: Optional partial result callback (see run_generation)
+        store: Optional stage output store for resuming an earlier run
+        cancel: Optional threading.Event (see run_generation)
+
+    Returns:
+        PipelineResult with screenplay, characters, scenes and soundDesign
+    """
+    inputs = analysis_inputs(script_text, genre)
+    return run_pipeline(analysis_stages(inputs['parsed']), inputs, listener=listener, on_item=on_item,
+                        store=store, cancel=cancel)
+
+
+async def arun_generation(story_idea: str, genre: str, listener=None, on_item=None,
+                          store=None) -> PipelineResult:
+    """Async variant of run_generation()"""
+    return await arun_pipeline(GENERATE_STAGES, {'story_idea': story_idea, 'genre': genre},
+                               listener=listener, on_item=on_item, store=store)
+
+
+async def arun_analysis(script_text: str, genre: str, listener=None, on_item=None,
+                        store=None) -> PipelineResult:
+    """Async variant of run_analysis()"""
+    inputs = analysis_inputs(script_text, genre)
+    return await arun_pipeline(analysis_stages(inputs['parsed']), inputs, listener=listener, on_item=on_item,
+                               store=store)
+
+
+def pipeline_for(kind: str, params: dict):
+    """(stages, inputs) for a stored run's kind and params"""
+    if kind == 'generate':
+        return GENERATE_STAGES, {'story_idea': params['story_idea'], 'genre': params['genre']}
+    inputs = analysis_inputs(params['script_text'], params['genre'])
+    return analysis_stages(inputs['parsed']), inputs
+
+
+def fresh_stage(stage: Stage) -> Stage:
+    """Copy of a stage that asks the model again instead of reusing cached answers"""
+    def func(*args):
+        with fresh_completions():
+            return stage.func(*args)
+
+    afunc = None
+    if stage.afunc is not None:
+        async def afunc(*args):
+            with fresh_completions():
+                return await stage.afunc(*args)
+
+    return Stage(stage.name, func, stage.requires, afunc)
+
+
+def regenerate_section(kind: str, params: dict, section: str, store, listener=None):
+    """
+    Produce a new version of one section of a stored run
+
+    Only the section and the stages downstream of it are run again; every
+    other stage comes from the store.
+
+    Args:
+        kind: The run's kind ('generate' or 'analyze')
+        params: The run's stored inputs
+        section: Stage to regenerate (one of SECTIONS)
+        store: The run's stage output store
+        listener: Optional stage event callback (see run_pipeline)
+
+    Returns:
+        (PipelineResult, names of the stages that were regenerated)
+    """
+    stages, inputs = pipeline_for(kind, params)
+    regenerated = [section] + dependents(stages, section)
+    store.invalidate(regenerated)
+    stages = [fresh_stage(stage) if stage.name == section else stage for stage in stages]
+    return run_pipeline(stages, inputs, listener=listener, store=store), regenerated
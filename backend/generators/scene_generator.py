@@ -1,43 +1,65 @@
 """
 Scene Generator using Groq API
 Generates scene breakdown based on screenplay and characters
+
+When the pipeline wants partial results (see utils.pipeline.item_sink), the
+completion is streamed and each scene is reported as soon as its JSON
+object is complete.
 """
-import json
-import re
 from utils.ai_client import get_ai_client
+from utils.async_bridge import run_sync
 from utils.json_helper import safe_parse_json
+from utils.schema import Scene, Screenplay, normalize_characters, normalize_scenes, normalize_screenplay
+from utils.json_stream import JSONArrayStream
+from utils.pipeline import item_sink
+from utils.token_budget import compact_screenplay, max_tokens_for
 
-def generate_scenes(screenplay_data: dict, characters: list) -> list:
+def generate_scenes(screenplay_data, characters: list = None) -> list:
     """
     Generate scene breakdown from screenplay and characters
     
     Args:
-        screenplay_data: Screenplay outline dictionary
-        characters: List of character dictionaries
+        screenplay_data: Screenplay outline (Screenplay or its dictionary)
+        characters: List of Character objects or dictionaries. When omitted,
+            the outline's main characters are used so scenes don't have to
+            wait for full character profiles.
         
     Returns:
-        List of scene dictionaries
+        List of Scene objects
+    """
+    # The sink lives in this thread's context; pass it across to the bridge loop
+    return run_sync(agenerate_scenes(screenplay_data, characters, on_scene=item_sink()))
+
+async def agenerate_scenes(screenplay_data, characters: list = None, on_scene=None) -> list:
+    """
+    Async variant of generate_scenes()
+    
+    Args:
+        on_scene: Optional callable receiving each scene dict as soon as it has
+            streamed in (defaults to the pipeline's item sink, if any)
     """
     client = get_ai_client()
+    on_scene = on_scene or item_sink()
     
     # Type Guard: Ensure screenplay_data and characters are valid
-    if not isinstance(screenplay_data, dict):
+    if not isinstance(screenplay_data, (Screenplay, dict)):
         raise ValueError("Scene generator received invalid screenplay data. Please try regenerating.")
-    if not isinstance(characters, list):
+    if characters is not None and not isinstance(characters, list):
         raise ValueError("Scene generator received invalid character data. Please try regenerating.")
+    screenplay = normalize_screenplay(screenplay_data)
     
-    title = screenplay_data.get('title', 'Untitled')
-    logline = screenplay_data.get('logline', '')
-    genre = screenplay_data.get('genre', 'Drama')
+    # Title, logline and act summaries as compact JSON, so scenes follow the arc
+    outline = compact_screenplay(screenplay)
     
     # Extract character names for context
-    character_names = [char.get('name', 'Unknown') for char in characters]
+    if characters is None:
+        character_names = list(screenplay.main_characters)
+    else:
+        character_names = [char.name for char in normalize_characters(characters)]
     
     prompt = f"""You are a film production expert. Based on this screenplay outline, create a detailed scene breakdown.
 
-Title: {title}
-Logline: {logline}
-Genre: {genre}
+Outline: {outline}
 Characters: {', '.join(character_names)}
 
 CRITICAL: When listing characters in scenes, you MUST use the EXACT names from the Characters list above: {', '.join(character_names)}
@@ -59,43 +81,35 @@ Generate 8-12 scenes in this JSON format:
 Create a complete scene breakdown that covers the full story arc. Return ONLY the JSON array, no additional text."""
 
 
+    max_tokens = max_tokens_for('scenes')
     try:
-        response = client.generate(prompt, json_mode=True)
+        if on_scene is not None:
+            response = await astream_scenes(client, prompt, on_scene, max_tokens)
+        else:
+            response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens)
         result = safe_parse_json(response)
         
-        # Robust list extraction if AI returns an object instead of a direct array
-        if isinstance(result, dict):
-            print(f"⚠️ AI returned dict with keys: {list(result.keys())}, attempting to extract list...")
-            
-            # 1. Broad list of common keys AI might use for scenes
-            common_keys = [
-                'scenes', 'breakdown', 'scene_breakdown', 'sceneBreakdown',
-                'scene_list', 'sceneList', 'data', 'result', 'list', 'items'
-            ]
-            
-            for key in common_keys:
-                if key in result and isinstance(result[key], list):
-                    print(f"✅ Found scene list under key: '{key}'")
-                    result = result[key]
-                    break
-            else:
-                # 2. If no common key found, search for ONLY list found in top-level values
-                lists_found = [v for v in result.values() if isinstance(v, list)]
-                if len(lists_found) == 1:
-                    print("✅ Found exactly one list in response, assuming it's the scene list")
-                    result = lists_found[0]
-                elif len(lists_found) > 1:
-                    # Pick the largest list if multiple lists found
-                    print(f"✅ Found {len(lists_found)} lists, picking the largest one")
-                    result = max(lists_found, key=len)
-        
-        if not isinstance(result, list):
-            raise ValueError(f"AI returned {type(result).__name__} instead of a list. Keys: {list(result.keys()) if isinstance(result, dict) else 'N/A'}")
-            
-        return result
+        # Wrapped lists and loose fields are coerced by the shared schema
+        return normalize_scenes(result)
         
     except Exception as e:
         print(f"❌ Scene generation error: {e}")
         if 'response' in locals() and response:
             print(f"Full response for debugging: {response}")
         raise Exception(f"Failed to generate scenes: {str(e)}")
+
+
+async def astream_scenes(client, prompt: str, on_scene, max_tokens: int = None) -> str:
+    """
+    Stream a scene breakdown, passing each scene to on_scene as it completes
+    
+    Returns:
+        The full response text, for the usual parsing and validation
+    """
+    parser = JSONArrayStream()
+    async for delta in client.astream(prompt, json_mode=True, max_tokens=max_tokens):
+        for scene in parser.feed(delta):
+            if isinstance(scene, dict):
+                on_scene(Scene.from_raw(scene, parser.count - 1).to_dict())
+    print(f"🎞️  Streamed {parser.count} scenes")
+    return parser.text
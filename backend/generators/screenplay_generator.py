@@ -2,12 +2,13 @@
 Screenplay Generator using Gemini API
 Generates screenplay outlines with 3-act structure
 """
-import json
-import re
 from utils.ai_client import get_ai_client
+from utils.async_bridge import run_sync
 from utils.json_helper import safe_parse_json
+from utils.schema import Screenplay, normalize_screenplay
+from utils.token_budget import max_tokens_for
 
-def generate_screenplay(story_idea: str, genre: str) -> dict:
+def generate_screenplay(story_idea: str, genre: str) -> Screenplay:
     """
     Generate screenplay outline from story idea using AI
     
@@ -16,8 +17,12 @@ def generate_screenplay(story_idea: str, genre: str) -> dict:
         genre: Selected genre
         
     Returns:
-        Dictionary containing screenplay data
+        Screenplay outline
     """
+    return run_sync(agenerate_screenplay(story_idea, genre))
+
+async def agenerate_screenplay(story_idea: str, genre: str) -> Screenplay:
+    """Async variant of generate_screenplay()"""
     client = get_ai_client()
     
     prompt = f"""You are a professional screenplay consultant. Create a compelling screenplay outline based on this story idea.
@@ -80,14 +85,14 @@ Generate a screenplay outline in the following JSON format. Be creative and deta
 Return ONLY the JSON object, no additional text."""
 
     try:
-        response = client.generate(prompt, json_mode=True)
+        response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('screenplay'))
         result = safe_parse_json(response)
         
         # Ensure result is a dictionary, not a string
         if not isinstance(result, dict):
             raise ValueError(f"AI returned {type(result).__name__} instead of dictionary object")
             
-        return result
+        return normalize_screenplay(result)
         
     except Exception as e:
         print(f"❌ Screenplay generation error: {e}")
@@ -1,50 +1,44 @@
 """
 Script Analyzer - Analyzes existing scripts to extract structure and generate pre-production materials
+
+Long scripts are analysed map-reduce style: the text is split on scene
+headings into chunks that are summarised concurrently, then a reduce pass
+turns the ordered summaries into the usual structure JSON.
+
+Structural facts (scenes, character cues, dialogue counts) come from the
+local screenplay parser; the model is only asked for interpretation.
 """
+import asyncio
 import json
+import os
+import re
 from utils.ai_client import get_ai_client
+from utils.async_bridge import run_sync
 from utils.json_helper import safe_parse_json
+from utils.screenplay_parser import parse_screenplay, main_character_names
+from utils.schema import Screenplay, normalize_screenplay
+from utils.token_budget import fit_text, max_tokens_for
 
-def analyze_script(script_text: str, genre: str = "Drama") -> dict:
-    """
-    Analyze an existing script and extract screenplay structure
-    
-    Args:
-        script_text: Full text of the existing script
-        genre: Genre of the script
-        
-    Returns:
-        Dictionary containing screenplay structure data
-    """
-    client = get_ai_client()
-    
-    prompt = f"""You are a professional script supervisor analyzing screenplay material (full script, treatment, or outline).
-
-SCRIPT/TREATMENT TEXT:
-{script_text}
-
-GENRE: {genre}
-
-INSTRUCTIONS:
-- This may be a full screenplay, treatment, outline, or beat sheet
-- If character names are provided, use them exactly as written
-- If no character names are given, suggest appropriate names based on character descriptions
-- Extract structure even from short treatments or outlines
-- Expand brief descriptions into fuller narrative descriptions
+# Scripts longer than this are analysed in chunks of about this size
+CHUNK_CHARS = int(os.getenv('ANALYZE_CHUNK_CHARS', '12000'))
+# Concurrent chunk summaries per script
+MAX_CONCURRENT_CHUNKS = int(os.getenv('ANALYZE_MAX_CONCURRENCY', '4'))
+# Prompt tokens allowed for the part summaries in the reduce pass
+OUTLINE_TOKENS = int(os.getenv('ANALYZE_OUTLINE_TOKENS', '6000'))
 
-Return a JSON object with the following format:
+SCENE_HEADING = re.compile(r'^\s*(?:\d+\s*[.)]?\s*)?(?:INT\.?/EXT|EXT\.?/INT|I/E|INT|EXT)[.\s]', re.MULTILINE)
 
-{{
+STRUCTURE_FORMAT = """{
     "title": "Extract or infer the title from the script",
     "logline": "Create a compelling one-sentence logline based on the script",
-    "genre": "{genre}",
+    "genre": "__GENRE__",
     "mainCharacters": [
         "First main character's name (extracted from script)",
         "Second main character's name (extracted from script)",
         "Third main character's name (extracted from script)"
     ],
-    "threeActStructure": {{
-        "act1": {{
+    "threeActStructure": {
+        "act1": {
             "title": "Act 1: Setup",
             "description": "Summarize Act 1 based on the script content",
             "keyEvents": [
@@ -52,8 +46,8 @@ Return a JSON object with the following format:
                 "Key event 2 from the script",
                 "Key event 3 from the script"
             ]
-        }},
-        "act2": {{
+        },
+        "act2": {
             "title": "Act 2: Confrontation",
             "description": "Summarize Act 2 based on the script content",
             "keyEvents": [
@@ -61,8 +55,8 @@ Return a JSON object with the following format:
                 "Key event 2 from the script",
                 "Key event 3 from the script"
             ]
-        }},
-        "act3": {{
+        },
+        "act3": {
             "title": "Act 3: Resolution",
             "description": "Summarize Act 3 based on the script content",
             "keyEvents": [
@@ -70,8 +64,8 @@ Return a JSON object with the following format:
                 "Key event 2 from the script",
                 "Key event 3 from the script"
             ]
-        }}
-    }},
+        }
+    },
     "plotPoints": [
         "Opening Image (describe from script)",
         "Catalyst (describe from script)",
@@ -80,7 +74,107 @@ Return a JSON object with the following format:
         "Climax (describe from script)",
         "Resolution (describe from script)"
     ]
-}}
+}"""
+
+
+def structure_format(genre: str) -> str:
+    """JSON skeleton every analysis pass must return"""
+    return STRUCTURE_FORMAT.replace('__GENRE__', genre)
+
+
+def split_script(script_text: str, max_chars: int = CHUNK_CHARS) -> list:
+    """
+    Split a script into chunks of at most max_chars, breaking on scene headings
+
+    Scenes are kept whole where possible; a single scene longer than
+    max_chars is split on line boundaries.
+    """
+    starts = [m.start() for m in SCENE_HEADING.finditer(script_text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    scenes = [script_text[start:end] for start, end in zip(starts, starts[1:] + [len(script_text)])]
+
+    pieces = []
+    for scene in scenes:
+        while len(scene) > max_chars:
+            cut = scene.rfind('\n', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(scene[:cut])
+            scene = scene[cut:]
+        if scene.strip():
+            pieces.append(scene)
+
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current.strip())
+            current = ''
+        current += piece
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+def known_characters_note(parsed: dict) -> str:
+    """Prompt lines listing the speaking characters found by the parser"""
+    characters = (parsed or {}).get('characters', [])[:15]
+    if not characters:
+        return ""
+    listing = ', '.join(f"{c['name']} ({c['dialogueCount']} lines)" for c in characters)
+    return f"\nSPEAKING CHARACTERS (parsed from dialogue cues, most lines first): {listing}\n"
+
+
+def seed_main_characters(result: dict, parsed: dict) -> Screenplay:
+    """Normalise the analysis and fill mainCharacters from the parser if the model left it empty"""
+    screenplay = normalize_screenplay(result)
+    names = main_character_names(parsed or {})
+    if names and not screenplay.main_characters:
+        screenplay.main_characters = names
+    return screenplay
+
+
+def analyze_script(script_text: str, genre: str = "Drama", parsed: dict = None) -> Screenplay:
+    """
+    Analyze an existing script and extract screenplay structure
+    
+    Args:
+        script_text: Full text of the existing script
+        genre: Genre of the script
+        parsed: parse_screenplay() output, computed here if not given
+        
+    Returns:
+        Screenplay with the extracted structure
+    """
+    return run_sync(aanalyze_script(script_text, genre, parsed))
+
+async def aanalyze_script(script_text: str, genre: str = "Drama", parsed: dict = None) -> Screenplay:
+    """Async variant of analyze_script()"""
+    if parsed is None:
+        parsed = parse_screenplay(script_text)
+    if len(script_text) > CHUNK_CHARS:
+        return await aanalyze_script_chunked(script_text, genre, parsed)
+
+    client = get_ai_client()
+    
+    prompt = f"""You are a professional script supervisor analyzing screenplay material (full script, treatment, or outline).
+
+SCRIPT/TREATMENT TEXT:
+{script_text}
+
+GENRE: {genre}
+{known_characters_note(parsed)}
+INSTRUCTIONS:
+- This may be a full screenplay, treatment, outline, or beat sheet
+- If character names are provided, use them exactly as written
+- If SPEAKING CHARACTERS are listed, choose mainCharacters from that list
+- If no character names are given, suggest appropriate names based on character descriptions
+- Extract structure even from short treatments or outlines
+- Expand brief descriptions into fuller narrative descriptions
+
+Return a JSON object with the following format:
+
+{structure_format(genre)}
 
 IMPORTANT: 
 - Extract character names if provided (like "Arjun Rao" or "Detective Arjun")
@@ -92,14 +186,123 @@ IMPORTANT:
 Return ONLY the JSON object, no additional text."""
 
     try:
-        response = client.generate(prompt, json_mode=True)
+        response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('analysis', prompt=prompt))
         result = safe_parse_json(response)
         
         # Ensure result is a dictionary
         if not isinstance(result, dict):
             raise ValueError(f"AI returned {type(result).__name__} instead of dictionary object")
             
-        return result
+        return seed_main_characters(result, parsed)
+        
+    except Exception as e:
+        print(f"❌ Script analysis error: {e}")
+        if 'response' in locals() and response:
+            print(f"Full response for debugging: {response}")
+        raise Exception(f"Failed to analyze script: {str(e)}")
+
+
+async def asummarize_chunk(chunk: str, index: int, total: int, genre: str) -> dict:
+    """
+    Map step: summarise one chunk of a long script
+
+    Returns:
+        Dictionary with summary, characters and keyEvents for the chunk
+    """
+    client = get_ai_client()
+    
+    prompt = f"""You are a professional script supervisor. This is part {index + 1} of {total} of a {genre} screenplay.
+
+SCRIPT EXCERPT:
+{chunk}
+
+Summarize ONLY this excerpt as a JSON object:
+
+{{
+    "summary": "3-5 sentences describing what happens in this excerpt",
+    "characters": ["Names of characters who appear, exactly as written"],
+    "keyEvents": ["Important plot events in this excerpt, in order"]
+}}
+
+Return ONLY the JSON object, no additional text."""
+
+    response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('chunk_summary'))
+    result = safe_parse_json(response)
+    if not isinstance(result, dict):
+        raise ValueError(f"AI returned {type(result).__name__} instead of dictionary object for part {index + 1}")
+    return result
+
+
+async def aanalyze_script_chunked(script_text: str, genre: str = "Drama", parsed: dict = None) -> Screenplay:
+    """
+    Map-reduce analysis for scripts too long for a single prompt
+
+    Chunks are summarised concurrently (at most MAX_CONCURRENT_CHUNKS at a
+    time), then one reduce pass builds the threeActStructure / mainCharacters
+    JSON from the ordered summaries.
+    """
+    chunks = split_script(script_text)
+    print(f"🧩 Analyzing script in {len(chunks)} chunks...")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+
+    async def summarize(index, chunk):
+        async with semaphore:
+            return await asummarize_chunk(chunk, index, len(chunks), genre)
+
+    try:
+        summaries = await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks)))
+    except Exception as e:
+        print(f"❌ Script analysis error: {e}")
+        raise Exception(f"Failed to analyze script: {str(e)}")
+
+    # Characters ranked by how many parts of the script they appear in
+    appearances = {}
+    for summary in summaries:
+        for name in summary.get('characters', []) or []:
+            if isinstance(name, str) and name.strip():
+                appearances[name.strip()] = appearances.get(name.strip(), 0) + 1
+    ranked_characters = sorted(appearances, key=lambda name: -appearances[name])
+    # Dialogue cues are a more reliable ranking than the model's summaries
+    if parsed and parsed.get('characters'):
+        ranked_characters = main_character_names(parsed, limit=15)
+
+    # Very long scripts get an even share of the outline budget per part
+    part_tokens = max(OUTLINE_TOKENS // len(summaries), 50)
+    outline = "\n\n".join(
+        fit_text(f"PART {i + 1}:\n{summary.get('summary', '')}\nKey events: {'; '.join(map(str, summary.get('keyEvents', []) or []))}",
+                 part_tokens)
+        for i, summary in enumerate(summaries)
+    )
+
+    client = get_ai_client()
+    
+    prompt = f"""You are a professional script supervisor. Below are summaries of consecutive parts of a full-length screenplay, in story order.
+
+{outline}
+
+CHARACTERS (most frequently appearing first): {', '.join(ranked_characters[:15])}
+
+GENRE: {genre}
+
+Combine the parts into one screenplay analysis. Return a JSON object with the following format:
+
+{structure_format(genre)}
+
+IMPORTANT:
+- Use character names exactly as listed above
+- Divide the acts according to the story as a whole, not the part boundaries
+- Base all responses on the summaries provided
+
+Return ONLY the JSON object, no additional text."""
+
+    try:
+        response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('analysis', prompt=prompt))
+        result = safe_parse_json(response)
+        
+        if not isinstance(result, dict):
+            raise ValueError(f"AI returned {type(result).__name__} instead of dictionary object")
+            
+        return seed_main_characters(result, parsed)
         
     except Exception as e:
         print(f"❌ Script analysis error: {e}")
@@ -118,6 +321,16 @@ def extract_characters_from_script(script_text: str) -> list:
     Returns:
         List of character names found in the script
     """
+    return run_sync(aextract_characters_from_script(script_text))
+
+
+async def aextract_characters_from_script(script_text: str) -> list:
+    """Async variant of extract_characters_from_script()"""
+    # Formatted scripts name their speakers in the cues; no model call needed
+    names = main_character_names(parse_screenplay(script_text))
+    if names:
+        return names
+
     client = get_ai_client()
     
     prompt = f"""Analyze this script and extract all speaking character names.
@@ -131,7 +344,7 @@ Return a JSON array of character names (3-5 main characters) in order of importa
 Return ONLY the JSON array, no additional text."""
 
     try:
-        response = client.generate(prompt, json_mode=True)
+        response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('character_names'))
         result = safe_parse_json(response)
         
         if isinstance(result, list):
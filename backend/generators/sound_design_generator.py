@@ -2,37 +2,43 @@
 Sound Design Generator using Groq API
 Generates sound design suggestions based on scenes and genre
 """
-import json
-import re
 from utils.ai_client import get_ai_client
+from utils.async_bridge import run_sync
 from utils.json_helper import safe_parse_json
+from utils.schema import Screenplay, normalize_scenes, normalize_screenplay, normalize_sound_design
+from utils.token_budget import max_tokens_for
 
-def generate_sound_design(screenplay_data: dict, scenes: list) -> dict:
+def generate_sound_design(screenplay_data, scenes: list):
     """
     Generate sound design suggestions from screenplay and scenes
     
     Args:
-        screenplay_data: Screenplay outline dictionary
-        scenes: List of scene dictionaries
+        screenplay_data: Screenplay outline (Screenplay or its dictionary)
+        scenes: List of Scene objects or dictionaries
         
     Returns:
-        Sound design dictionary with music, sfx, and ambience
+        SoundDesign with music, sfx, and ambience
     """
+    return run_sync(agenerate_sound_design(screenplay_data, scenes))
+
+async def agenerate_sound_design(screenplay_data, scenes: list):
+    """Async variant of generate_sound_design()"""
     client = get_ai_client()
     
     # Type Guard: Ensure inputs are valid
-    if not isinstance(screenplay_data, dict):
+    if not isinstance(screenplay_data, (Screenplay, dict)):
         raise ValueError("Sound generator received invalid screenplay data.")
     if not isinstance(scenes, list):
         raise ValueError("Sound generator received invalid scene data.")
     
-    title = screenplay_data.get('title', 'Untitled')
-    genre = screenplay_data.get('genre', 'Drama')
+    screenplay = normalize_screenplay(screenplay_data)
+    title = screenplay.title
+    genre = screenplay.genre
     
     # Extract key scene info
     scene_summary = []
-    for scene in scenes[:5]:  # Use first 5 scenes for context
-        scene_summary.append(f"Scene {scene.get('sceneNumber')}: {scene.get('location')} - {scene.get('action', '')[:80]}")
+    for scene in normalize_scenes(scenes[:5]):  # Use first 5 scenes for context
+        scene_summary.append(f"Scene {scene.scene_number}: {scene.location} - {scene.action[:80]}")
     
     prompt = f"""You are a professional sound designer for films. Based on this screenplay, create comprehensive sound design suggestions.
 
@@ -77,13 +83,13 @@ Generate sound design in this JSON format:
 Create detailed, production-ready sound design suggestions. Return ONLY the JSON object, no additional text."""
 
     try:
-        response = client.generate(prompt, json_mode=True)
+        response = await client.agenerate(prompt, json_mode=True, max_tokens=max_tokens_for('soundDesign'))
         result = safe_parse_json(response)
         
         if not isinstance(result, dict):
             raise ValueError(f"AI returned {type(result).__name__} instead of a dictionary for sound design.")
             
-        return result
+        return normalize_sound_design(result)
         
     except Exception as e:
         print(f"❌ Sound design generation error: {e}")
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings (picked up automatically from the working directory)
+Each worker is a separate process, so Prometheus samples are written to
+files in PROMETHEUS_MULTIPROC_DIR and /metrics sums them (utils/metrics.py).
+The directory has to be set before the workers import the app, and emptied
+on every start so samples from earlier runs aren't counted.
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'scriptoria-metrics'))
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
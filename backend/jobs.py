@@ -0,0 +1,253 @@
+"""
+Background job queue for screenplay generation
+Jobs are rows in the `jobs` table. Web processes only insert and read rows;
+worker threads (in-process or in `worker.py`) claim queued jobs, run the
+generator pipeline and record stage progress and results.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from models import db, Job
+from generators.pipeline import run_generation, run_analysis, package_json
+from runs import ArtifactStore, resume_run, start_run
+
+JOB_KINDS = ('generate', 'analyze')
+
+# Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+# Running jobs without a heartbeat for this long are assumed orphaned
+STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '300'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+# Seconds between stale-job sweeps in each worker
+SWEEP_INTERVAL = STALE_AFTER / 2
+# Seconds between heartbeats while a job runs (well under STALE_AFTER)
+HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', str(STALE_AFTER / 5)))
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+
+def ensure_job_table():
+    """Create the jobs table on first use (gunicorn never runs app.py's __main__)"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    with _tables_lock:
+        if not _tables_ready:
+            try:
+                Job.__table__.create(db.engine, checkfirst=True)
+            except OperationalError as e:
+                # Another worker created it between the check and the CREATE
+                if 'already exists' not in str(e):
+                    raise
+            _tables_ready = True
+
+
+def submit_job(kind: str, params: dict) -> Job:
+    """
+    Queue a generation job
+
+    Args:
+        kind: 'generate' (params: story_idea, genre) or 'analyze' (params: script_text, genre)
+        params: Validated pipeline inputs
+
+    Returns:
+        The queued Job row
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    ensure_job_table()
+    job = Job(id=uuid.uuid4().hex, kind=kind, status='queued', params=json.dumps(params),
+              progress=json.dumps({}))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def get_job(job_id: str):
+    """Fetch a job by id (None if it doesn't exist)"""
+    ensure_job_table()
+    return db.session.get(Job, job_id)
+
+
+def claim_next_job(worker_id: str):
+    """
+    Atomically move the oldest queued job to 'running'
+
+    The conditional UPDATE makes the claim safe across threads and processes:
+    only one worker sees rowcount == 1 for a given job.
+    """
+    while True:
+        candidate = db.session.query(Job.id).filter_by(status='queued') \
+            .order_by(Job.created_at).limit(1).scalar()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        now = datetime.utcnow()
+        claimed = db.session.query(Job).filter_by(id=candidate, status='queued').update({
+            'status': 'running',
+            'worker_id': worker_id,
+            'started_at': now,
+            'heartbeat_at': now,
+            'attempts': Job.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate)
+
+
+def requeue_stale_jobs():
+    """Return orphaned running jobs to the queue, or fail them after MAX_ATTEMPTS"""
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+    stale = db.session.query(Job.id, Job.attempts) \
+        .filter(Job.status == 'running', Job.heartbeat_at < cutoff).all()
+    recovered = 0
+    for job_id, attempts in stale:
+        if attempts >= MAX_ATTEMPTS:
+            changes = {'status': 'failed', 'error': 'Worker stopped responding', 'finished_at': datetime.utcnow()}
+        else:
+            changes = {'status': 'queued', 'worker_id': None}
+        # Conditional like claim_next_job: every worker sweeps, and a job
+        # reclaimed or refreshed since the SELECT is left alone
+        recovered += db.session.query(Job) \
+            .filter(Job.id == job_id, Job.status == 'running', Job.heartbeat_at < cutoff) \
+            .update(changes, synchronize_session=False)
+    db.session.commit()
+    if recovered:
+        print(f"♻️  Recovered {recovered} stale job(s)")
+
+
+class JobHeartbeat(threading.Thread):
+    """Refreshes a running job's heartbeat_at, so a long stage isn't taken for a dead worker"""
+
+    def __init__(self, app, job_id: str, worker_id: str):
+        super().__init__(name=f'job-heartbeat-{job_id[:8]}', daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        jobs = Job.__table__
+        while not self._stop_event.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self.app.app_context():
+                    # Own short transaction; only while this worker still owns the job
+                    with db.engine.begin() as connection:
+                        connection.execute(
+                            update(jobs)
+                            .where(jobs.c.id == self.job_id, jobs.c.status == 'running',
+                                   jobs.c.worker_id == self.worker_id)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+            except Exception as e:
+                print(f"⚠️  Job {self.job_id} heartbeat failed: {e}")
+
+
+def run_job(job: Job):
+    """Run a claimed job's pipeline, recording stage progress as it goes"""
+    params = json.loads(job.params)
+    progress = json.loads(job.progress) if job.progress else {}
+
+    def listener(kind, stage, data):
+        progress[stage] = {'started': 'running'}.get(kind, kind)
+        job.progress = json.dumps(progress)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    print(f"🛠️  Job {job.id} ({job.kind}) started")
+    heartbeat = JobHeartbeat(current_app._get_current_object(), job.id, job.worker_id)
+    heartbeat.start()
+    try:
+        # The job id doubles as the run id, so a requeued job resumes where
+        # the previous attempt stopped
+        run = resume_run(job.id, job.kind, params) or start_run(job.kind, params, run_id=job.id)
+        store = ArtifactStore(current_app._get_current_object(), run.id)
+        if job.kind == 'generate':
+            result = run_generation(params['story_idea'], params['genre'], listener=listener, store=store)
+        else:
+            result = run_analysis(params['script_text'], params['genre'], listener=listener, store=store)
+
+        job.result = json.dumps({
+            **package_json(result),
+            "pipeline": result.report(),
+            "runId": run.id
+        })
+        job.status = 'succeeded'
+        print(f"✅ Job {job.id} finished")
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.error = str(e)
+        print(f"❌ Job {job.id} failed: {e}")
+    finally:
+        heartbeat.stop()
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+class JobWorker(threading.Thread):
+    """Polls the jobs table and runs one job at a time, sweeping up orphaned jobs every SWEEP_INTERVAL"""
+
+    def __init__(self, app, index: int = 0):
+        super().__init__(name=f'job-worker-{index}', daemon=True)
+        self.app = app
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        self._stop_event = threading.Event()
+        # start_job_workers() has just swept
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    ensure_job_table()
+                    if time.monotonic() >= self._next_sweep:
+                        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+                        requeue_stale_jobs()
+                    job = claim_next_job(self.worker_id)
+                    if job is not None:
+                        run_job(job)
+                        continue
+            except Exception as e:
+                print(f"⚠️  Job worker {self.worker_id} error: {e}")
+            self._stop_event.wait(POLL_INTERVAL)
+
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def start_job_workers(app, count: int):
+    """Start `count` worker threads in this process (idempotent)"""
+    with _workers_lock:
+        if _workers or count <= 0:
+            return _workers
+        with app.app_context():
+            ensure_job_table()
+            requeue_stale_jobs()
+        for index in range(count):
+            worker = JobWorker(app, index)
+            worker.start()
+            _workers.append(worker)
+        print(f"🛠️  Started {count} job worker(s)")
+        return _workers
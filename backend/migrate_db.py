@@ -1,27 +1,121 @@
 """
 Database Migration Script - Add Stories Table
 Run this once to create the stories table
+
+Also adds the stories.package column to older databases and moves each
+story's JSON columns into it, compressed (see utils/package_codec.py). The
+backfill works in small batches, each its own short transaction, so the app
+can keep serving while it runs, and it can be interrupted and re-run.
+
+Usage: python migrate_db.py [--batch-size N] [--pause SECONDS]
 """
+import argparse
+import json
+import time
+
+from sqlalchemy import inspect, select, text, update
 
 from app import app, db
-from models import User, Story
+from models import Story
+from utils.package_codec import encode_package
+
+BACKFILL_BATCH_SIZE = 500
+
+def add_package_column():
+    """Add stories.package to databases created before it existed"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('stories')}
+    if 'package' in columns:
+        return
+    column_type = Story.__table__.c.package.type.compile(dialect=db.engine.dialect)
+    with db.engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE stories ADD COLUMN package {column_type}"))
+    print("✅ Added stories.package column")
+
+def backfill_story_packages(batch_size: int = BACKFILL_BATCH_SIZE, pause: float = 0.0) -> int:
+    """
+    Compress legacy screenplay/characters JSON into stories.package
+
+    Args:
+        batch_size: Stories per transaction
+        pause: Seconds to sleep between batches, to leave room for live traffic
 
-def create_tables():
+    Returns:
+        Number of stories converted
+    """
+    table = Story.__table__
+    converted = skipped = 0
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.screenplay, table.c.characters)
+                .where(table.c.package.is_(None), table.c.id > last_id)
+                .order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for story_id, screenplay, characters in rows:
+                try:
+                    package = {
+                        'screenplay': json.loads(screenplay),
+                        'characters': json.loads(characters) if characters else [],
+                        'scenes': [],
+                        'soundDesign': None
+                    }
+                except ValueError:
+                    skipped += 1
+                    continue
+                # The package IS NULL guard leaves rows the app rewrote meanwhile alone
+                result = connection.execute(
+                    update(table)
+                    .where(table.c.id == story_id, table.c.package.is_(None))
+                    # Same content, so keep updated_at (library order and cursors depend on it)
+                    .values(package=encode_package(package), screenplay='', characters=None,
+                            updated_at=table.c.updated_at)
+                )
+                converted += result.rowcount
+        last_id = rows[-1][0]
+        print(f"   ...{converted} stories compressed (up to id {last_id})")
+        if pause:
+            time.sleep(pause)
+
+    if skipped:
+        print(f"⚠️  Skipped {skipped} stories with unreadable JSON; they stay in the legacy columns")
+    if converted and db.engine.dialect.name == 'sqlite':
+        print("💡 Run VACUUM on the database to reclaim the space of the old columns")
+    return converted
+
+def create_tables(batch_size: int = BACKFILL_BATCH_SIZE, pause: float = 0.0):
     with app.app_context():
         print("🔄 Creating database tables...")
-        
+
         # Create all tables
         db.create_all()
-        
+        add_package_column()
+
+        # create_all() skips indexes on tables that already existed
+        for index in Story.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
         print("✅ Database tables created successfully!")
         print("   - users table")
         print("   - stories table")
-        
+        print("   - jobs table")
+        print("   - pipeline_runs table")
+        print("   - stage_artifacts table")
+
+        print("\n🔄 Compressing story packages...")
+        converted = backfill_story_packages(batch_size, pause)
+        print(f"✅ {converted} stories compressed")
+
         # Verify tables exist
-        from sqlalchemy import inspect
         inspector = inspect(db.engine)
         tables = inspector.get_table_names()
         print(f"\n📋 Current tables: {tables}")
 
 if __name__ == '__main__':
-    create_tables()
+    parser = argparse.ArgumentParser(description="Create tables and compress story packages")
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds between backfill batches")
+    args = parser.parse_args()
+    create_tables(args.batch_size, args.pause)
@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime
+import json
+from utils.schema import Screenplay, normalize_screenplay, normalize_characters, normalize_package
+from utils.package_codec import encode_package, decode_package
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
@@ -39,20 +42,62 @@ class User(db.Model):
 class Story(db.Model):
     """Story model for saving generated screenplays"""
     __tablename__ = 'stories'
+    # Library pages are keyset-paginated on (user_id, updated_at, id)
+    __table_args__ = (db.Index('ix_stories_user_updated_id', 'user_id', 'updated_at', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
     genre = db.Column(db.String(50))
     story_idea = db.Column(db.Text)
+    # Legacy JSON columns; rows written since packages were introduced keep
+    # screenplay empty and characters NULL (see migrate_db.py for the backfill)
     screenplay = db.Column(db.Text, nullable=False)
     characters = db.Column(db.Text)  # JSON string
+    package = db.Column(db.LargeBinary)  # compressed JSON package (utils.package_codec)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
         return f'<Story {self.title}>'
     
+    def set_content(self, screenplay, characters=None, scenes=None, sound_design=None, title=None):
+        """
+        Validate generator output and store it
+
+        Title and genre follow the screenplay; pass title to keep one the
+        user chose instead.
+        """
+        package = normalize_package({'screenplay': screenplay, 'characters': characters,
+                                     'scenes': scenes, 'soundDesign': sound_design})
+        self.title = (title or package.screenplay.title)[:255]
+        self.genre = (package.screenplay.genre or self.genre or '')[:50] or None
+        self.package = encode_package(package.to_dict())
+        self.screenplay = ''
+        self.characters = None
+    
+    @property
+    def package_data(self) -> dict:
+        """The stored package: screenplay, characters, scenes and soundDesign"""
+        if self.package is not None:
+            return decode_package(self.package)
+        return {
+            'screenplay': json.loads(self.screenplay),
+            'characters': json.loads(self.characters) if self.characters else [],
+            'scenes': [],
+            'soundDesign': None
+        }
+    
+    @property
+    def screenplay_data(self) -> Screenplay:
+        """The stored screenplay as a typed object"""
+        return normalize_screenplay(self.package_data['screenplay'])
+    
+    @property
+    def character_list(self) -> list:
+        """The stored characters as typed Character objects"""
+        return normalize_characters(self.package_data['characters'] or [])
+    
     def to_dict(self, include_content=True):
         """Convert story to dictionary"""
         data = {
@@ -65,11 +110,95 @@ class Story(db.Model):
         }
         
         if include_content:
+            try:
+                package = self.package_data
+            except ValueError:
+                # Legacy row with broken JSON: pass the stored text through as before
+                package = None
             data.update({
                 'story_idea': self.story_idea,
-                'screenplay': self.screenplay,
-                'characters': self.characters
+                'screenplay': json.dumps(package['screenplay']) if package else self.screenplay,
+                'characters': json.dumps(package['characters']) if package else self.characters,
+                'scenes': json.dumps(package['scenes']) if package else '[]',
+                'soundDesign': json.dumps(package['soundDesign']) if package else 'null'
             })
         
         return data
 
+
+class Job(db.Model):
+    """Background generation job; the jobs table doubles as the work queue"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'generate' or 'analyze'
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    params = db.Column(db.Text, nullable=False)  # JSON string
+    progress = db.Column(db.Text)  # JSON string: {stage: status}
+    result = db.Column(db.Text)  # JSON string
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(128))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+    
+    def to_dict(self, include_result=False):
+        """Convert job to dictionary"""
+        def fmt(value):
+            return value.strftime('%Y-%m-%dT%H:%M:%SZ') if value else None
+        
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': json.loads(self.progress) if self.progress else {},
+            'attempts': self.attempts,
+            'created_at': fmt(self.created_at),
+            'started_at': fmt(self.started_at),
+            'finished_at': fmt(self.finished_at)
+        }
+        
+        if self.error:
+            data['error'] = self.error
+        
+        if include_result:
+            data['result'] = json.loads(self.result) if self.result else None
+        
+        return data
+
+
+class PipelineRun(db.Model):
+    """One generation/analysis request whose stage outputs can be resumed or regenerated"""
+    __tablename__ = 'pipeline_runs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'generate' or 'analyze'
+    params = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    artifacts = db.relationship('StageArtifact', backref='run', lazy=True, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<PipelineRun {self.id} {self.kind}>'
+
+
+class StageArtifact(db.Model):
+    """Output of one pipeline stage, valid for as long as its inputs hash the same"""
+    __tablename__ = 'stage_artifacts'
+    __table_args__ = (db.UniqueConstraint('run_id', 'stage', name='uq_stage_artifacts_run_stage'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), db.ForeignKey('pipeline_runs.id'), nullable=False, index=True)
+    stage = db.Column(db.String(40), nullable=False)
+    input_hash = db.Column(db.String(64), nullable=False)
+    output = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StageArtifact {self.run_id}/{self.stage}>'
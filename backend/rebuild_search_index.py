@@ -0,0 +1,20 @@
+"""
+Rebuild the story search index
+Run after restoring a database, bulk edits made outside the ORM, or if
+search results look stale.
+"""
+
+from app import app
+from search import rebuild_search_index
+
+def rebuild():
+    with app.app_context():
+        print("🔄 Rebuilding story search index...")
+        count = rebuild_search_index()
+        if count or app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            print(f"✅ Indexed {count} stories")
+        else:
+            print("ℹ️  Full-text search needs SQLite with FTS5; searches use LIKE instead")
+
+if __name__ == '__main__':
+    rebuild()
@@ -0,0 +1,178 @@
+"""
+Resumable pipeline runs
+Every stage output of a generation or analysis is stored under the request's
+run id, keyed by a hash of the stage's inputs. Retrying a failed run with its
+id only calls Groq for the stages that never finished, and regenerating one
+section re-runs that stage plus whatever depends on it.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from models import db, PipelineRun, StageArtifact
+from utils.schema import to_json
+
+RUN_KINDS = ('generate', 'analyze')
+
+# Runs untouched for this long are deleted along with their artifacts
+RUN_TTL_DAYS = float(os.getenv('RUN_TTL_DAYS', '7'))
+# Minimum seconds between two prune passes in one process
+PRUNE_INTERVAL = 3600
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def ensure_run_tables():
+    """Create the run tables on first use (gunicorn never runs app.py's __main__)"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    with _tables_lock:
+        if not _tables_ready:
+            for model in (PipelineRun, StageArtifact):
+                try:
+                    model.__table__.create(db.engine, checkfirst=True)
+                except OperationalError as e:
+                    # Another worker created it between the check and the CREATE
+                    if 'already exists' not in str(e):
+                        raise
+            _tables_ready = True
+
+
+def stage_input_hash(stage: str, args: list) -> str:
+    """Canonical hash of a stage's name and arguments"""
+    # Typed results and their stored JSON must hash alike, or resumes would miss
+    canonical = json.dumps(to_json(args), sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{stage}\n{canonical}'.encode('utf-8')).hexdigest()
+
+
+def get_run(run_id: str):
+    """Fetch a run by id (None if it doesn't exist)"""
+    ensure_run_tables()
+    return db.session.get(PipelineRun, run_id)
+
+
+def start_run(kind: str, params: dict, run_id: str = None) -> PipelineRun:
+    """
+    Record a new run
+
+    Args:
+        kind: 'generate' (params: story_idea, genre) or 'analyze' (params: script_text, genre)
+        params: Validated pipeline inputs, kept so sections can be regenerated
+        run_id: Id to use (e.g. a job id); a fresh one by default
+
+    Returns:
+        The new PipelineRun row
+    """
+    if kind not in RUN_KINDS:
+        raise ValueError(f"Unknown run kind: {kind}")
+
+    ensure_run_tables()
+    prune_runs()
+    run = PipelineRun(id=run_id or uuid.uuid4().hex, kind=kind, params=json.dumps(params))
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def resume_run(run_id: str, kind: str, params: dict):
+    """
+    Reopen an earlier run with (possibly edited) inputs
+
+    Stages whose inputs are unchanged keep their stored output; the rest are
+    re-run.
+
+    Returns:
+        The PipelineRun, or None if there is no run of this kind with that id
+    """
+    run = get_run(run_id)
+    if run is None or run.kind != kind:
+        return None
+    run.params = json.dumps(params)
+    run.updated_at = datetime.utcnow()
+    db.session.commit()
+    return run
+
+
+def open_run(kind: str, params: dict, run_id: str = None):
+    """
+    Resume run_id when given, otherwise start a new run
+
+    Returns:
+        The run id, or None when run_id names no run of this kind
+    """
+    if run_id:
+        run = resume_run(run_id, kind, params)
+        return run.id if run is not None else None
+    return start_run(kind, params).id
+
+
+def prune_runs():
+    """Delete runs (and their artifacts) untouched for RUN_TTL_DAYS, at most hourly"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+
+    cutoff = datetime.utcnow() - timedelta(days=RUN_TTL_DAYS)
+    expired = db.session.query(PipelineRun.id).filter(PipelineRun.updated_at < cutoff)
+    db.session.query(StageArtifact).filter(StageArtifact.run_id.in_(expired.scalar_subquery())) \
+        .delete(synchronize_session=False)
+    deleted = db.session.query(PipelineRun).filter(PipelineRun.updated_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        print(f"🧹 Pruned {deleted} expired run(s)")
+
+
+class ArtifactStore:
+    """
+    Stage output store for run_pipeline(), backed by the stage_artifacts table
+
+    Each call opens its own app context, so the store can be used from the
+    request thread, job workers and the ASGI loop's worker threads alike.
+    """
+
+    def __init__(self, app, run_id: str):
+        self.app = app
+        self.run_id = run_id
+
+    def _artifact(self, stage: str):
+        return StageArtifact.query.filter_by(run_id=self.run_id, stage=stage).first()
+
+    def load(self, stage: str, args: list):
+        """Stored output of a stage, if it was produced from the same arguments"""
+        with self.app.app_context():
+            artifact = self._artifact(stage)
+            if artifact is None or artifact.input_hash != stage_input_hash(stage, args):
+                return None
+            return json.loads(artifact.output)
+
+    def save(self, stage: str, args: list, result):
+        """Store (or replace) a stage's output for this run"""
+        with self.app.app_context():
+            artifact = self._artifact(stage)
+            if artifact is None:
+                artifact = StageArtifact(run_id=self.run_id, stage=stage)
+                db.session.add(artifact)
+            artifact.input_hash = stage_input_hash(stage, args)
+            artifact.output = json.dumps(to_json(result))
+            artifact.created_at = datetime.utcnow()
+            db.session.commit()
+
+    def invalidate(self, stages):
+        """Drop the stored outputs of the given stages"""
+        with self.app.app_context():
+            StageArtifact.query.filter(StageArtifact.run_id == self.run_id,
+                                       StageArtifact.stage.in_(list(stages))) \
+                .delete(synchronize_session=False)
+            db.session.commit()
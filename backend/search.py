@@ -0,0 +1,270 @@
+"""
+Full-text search over saved stories
+On SQLite, stories are mirrored into an FTS5 table (rowid = story id) holding
+the readable text of each story: title, story idea, the outline's logline,
+acts and plot points, and the character profiles. Mapper events keep it in
+step with every insert, update and delete made through the ORM, in the same
+transaction. Other databases fall back to a LIKE scan, which can't see into
+compressed packages and so matches only titles and story ideas of stories
+saved since.
+"""
+import html
+import json
+import re
+import threading
+
+from sqlalchemy import event, inspect, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only
+
+from models import db, Story
+from stories import SUMMARY_COLUMNS
+from utils.package_codec import decode_package
+from utils.schema import SchemaError, normalize_screenplay, normalize_characters
+
+FTS_TABLE = 'stories_fts'
+# Columns after user_id, in table order, with their bm25 weights
+FTS_COLUMNS = (('title', 10.0), ('story_idea', 4.0), ('screenplay', 2.0), ('characters', 3.0))
+MAX_RESULTS = 50
+# Words of context around the match in each snippet
+SNIPPET_TOKENS = 16
+# Match markers used inside SQLite; the snippet is HTML-escaped before they
+# become <mark> tags, and they're stripped from indexed text
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+_MARKERS = str.maketrans('', '', MATCH_START + MATCH_END)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = None
+_fts_lock = threading.Lock()
+
+
+def _stored_content(screenplay_json, characters_json, package):
+    """(screenplay, characters) data from the package, or the legacy JSON columns"""
+    if package is not None:
+        data = decode_package(package)
+        return data.get('screenplay'), data.get('characters')
+    return (json.loads(screenplay_json) if screenplay_json else None,
+            json.loads(characters_json) if characters_json else None)
+
+
+def _fields(title, story_idea, screenplay_json, characters_json, package=None) -> dict:
+    """Searchable text of one story, per FTS column"""
+    screenplay_text = ''
+    characters_text = ''
+    try:
+        screenplay_data, characters_data = _stored_content(screenplay_json, characters_json, package)
+    except ValueError:
+        screenplay_data = characters_data = None
+    try:
+        screenplay = normalize_screenplay(screenplay_data) if screenplay_data else None
+    except (ValueError, SchemaError):
+        screenplay = None
+    if screenplay is not None:
+        parts = [screenplay.logline, screenplay.genre, ' '.join(screenplay.main_characters)]
+        for act in screenplay.acts.values():
+            parts.extend([act.title, act.description, ' '.join(act.key_events)])
+        parts.extend(screenplay.plot_points)
+        screenplay_text = '\n'.join(part for part in parts if part)
+
+    try:
+        characters = normalize_characters(characters_data) if characters_data else []
+    except (ValueError, SchemaError):
+        characters = []
+    characters_text = '\n'.join(
+        ' '.join(filter(None, [c.name, c.role, c.arc, ', '.join(c.traits)])) for c in characters
+    )
+
+    fields = {'title': title or '', 'story_idea': story_idea or '',
+              'screenplay': screenplay_text, 'characters': characters_text}
+    return {name: value.translate(_MARKERS) for name, value in fields.items()}
+
+
+def highlight(snippet: str) -> str:
+    """HTML for a raw FTS snippet: text escaped, matches wrapped in <mark>"""
+    escaped = html.escape(snippet, quote=False)
+    return escaped.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _create_table(connection) -> bool:
+    """Create the FTS5 table if needed; False when FTS5 can't be used here"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    columns = ', '.join(name for name, _ in FTS_COLUMNS)
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(user_id UNINDEXED, {columns}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+    except OperationalError as e:
+        print(f"⚠️  Full-text search unavailable, using LIKE search: {e}")
+        return False
+    return True
+
+
+def _table_exists(connection) -> bool:
+    return connection.dialect.name == 'sqlite' and connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': FTS_TABLE}).first() is not None
+
+
+def ensure_search_index() -> bool:
+    """
+    Create the FTS table on first use and index stories saved before it existed
+
+    Commits the session, so call it before other work in the request.
+
+    Returns:
+        False when full-text search is unavailable (not SQLite, or no FTS5)
+    """
+    global _fts_available
+    if _fts_available is None:
+        with _fts_lock:
+            if _fts_available is None:
+                connection = db.session.connection()
+                existed = _table_exists(connection)
+                available = _create_table(connection)
+                if available and not existed:
+                    count = _reindex_all(connection)
+                    if count:
+                        print(f"🔎 Indexed {count} existing stories for search")
+                db.session.commit()
+                _fts_available = available
+    return _fts_available
+
+
+def _indexing(connection) -> bool:
+    """Whether ORM writes should update the index (never creates the table mid-flush)"""
+    if _fts_available is None:
+        return _table_exists(connection)
+    return _fts_available
+
+
+def _index_row(connection, story_id, user_id, title, story_idea, screenplay, characters, package):
+    fields = _fields(title, story_idea, screenplay, characters, package)
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': story_id})
+    connection.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, user_id, title, story_idea, screenplay, characters) "
+        f"VALUES (:id, :user_id, :title, :story_idea, :screenplay, :characters)"
+    ), {'id': story_id, 'user_id': user_id, **fields})
+
+
+def _index_story(connection, story_id):
+    """(Re)index one story from its row as it stands in this transaction"""
+    table = Story.__table__
+    row = connection.execute(
+        table.select().with_only_columns(table.c.id, table.c.user_id, table.c.title, table.c.story_idea,
+                                         table.c.screenplay, table.c.characters, table.c.package)
+        .where(table.c.id == story_id)
+    ).first()
+    if row is not None:
+        _index_row(connection, *row)
+
+
+def _reindex_all(connection, batch_size: int = 500) -> int:
+    table = Story.__table__
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    count = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            table.select().with_only_columns(table.c.id, table.c.user_id, table.c.title, table.c.story_idea,
+                                             table.c.screenplay, table.c.characters, table.c.package)
+            .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return count
+        for row in rows:
+            _index_row(connection, *row)
+        count += len(rows)
+        last_id = rows[-1][0]
+
+
+def rebuild_search_index() -> int:
+    """
+    Recreate the search index from the stories table
+
+    Returns:
+        Number of stories indexed (0 when full-text search is unavailable)
+    """
+    global _fts_available
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+        _fts_available = _create_table(connection)
+        return _reindex_all(connection) if _fts_available else 0
+
+
+# Keep the index in step with ORM writes once the table exists (bulk
+# query.delete()/update() bypass these; run rebuild_search_index.py after those)
+_INDEXED_ATTRIBUTES = ('user_id', 'title', 'story_idea', 'screenplay', 'characters', 'package')
+
+
+@event.listens_for(Story, 'after_insert')
+def _story_inserted(mapper, connection, story):
+    if _indexing(connection):
+        _index_story(connection, story.id)
+
+
+@event.listens_for(Story, 'after_update')
+def _story_updated(mapper, connection, story):
+    state = inspect(story)
+    if any(state.attrs[name].history.has_changes() for name in _INDEXED_ATTRIBUTES) \
+            and _indexing(connection):
+        _index_story(connection, story.id)
+
+
+@event.listens_for(Story, 'after_delete')
+def _story_deleted(mapper, connection, story):
+    if _indexing(connection):
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': story.id})
+
+
+def match_query(query: str) -> str:
+    """
+    FTS5 query for user input: every word must match, the last one as a prefix
+
+    Words are quoted, so FTS syntax characters in the input can't cause
+    errors. Returns '' when the input has no words.
+    """
+    words = _TOKEN.findall(query)
+    if not words:
+        return ''
+    return ' '.join(f'"{word}"' for word in words[:-1]) + (' ' if len(words) > 1 else '') + f'"{words[-1]}"*'
+
+
+def search_stories(user_id: int, query: str, limit: int = 20) -> list:
+    """
+    Rank a user's stories against a search query
+
+    Returns:
+        List of (story, snippet) pairs, best match first. Stories carry only
+        the summary columns; snippet is HTML-escaped text with matches in
+        <mark> (None in LIKE fallback mode).
+    """
+    limit = max(1, min(limit, MAX_RESULTS))
+    if not ensure_search_index():
+        pattern = f'%{query.strip()}%'
+        stories = Story.query.options(load_only(*SUMMARY_COLUMNS, raiseload=True)) \
+            .filter(Story.user_id == user_id,
+                    or_(Story.title.ilike(pattern), Story.story_idea.ilike(pattern),
+                        Story.screenplay.ilike(pattern), Story.characters.ilike(pattern))) \
+            .order_by(Story.updated_at.desc(), Story.id.desc()).limit(limit).all()
+        return [(story, None) for story in stories]
+
+    match = match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for _, weight in FTS_COLUMNS)
+    rows = db.session.execute(text(
+        f"SELECT rowid, snippet({FTS_TABLE}, -1, char(2), char(3), '…', {SNIPPET_TOKENS}) "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match AND user_id = :user_id "
+        f"ORDER BY bm25({FTS_TABLE}, 0.0, {weights}) LIMIT :limit"
+    ), {'match': match, 'user_id': user_id, 'limit': limit}).all()
+    if not rows:
+        return []
+
+    stories = Story.query.options(load_only(*SUMMARY_COLUMNS, raiseload=True)) \
+        .filter(Story.id.in_([row[0] for row in rows])).all()
+    by_id = {story.id: story for story in stories}
+    return [(by_id[story_id], highlight(snippet)) for story_id, snippet in rows if story_id in by_id]
@@ -0,0 +1,92 @@
+"""
+Story library queries
+Library pages are keyset-paginated on (updated_at, id) within a user, so a
+page costs the same for the first and the thousandth page, and list queries
+load only the summary columns; the package and story_idea are read when a
+single story is fetched.
+"""
+import base64
+import os
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+
+from models import db, Story
+
+DEFAULT_PAGE_SIZE = int(os.getenv('STORIES_PAGE_SIZE', '20'))
+MAX_PAGE_SIZE = 100
+
+# Columns the library list needs; everything else stays unloaded
+SUMMARY_COLUMNS = (Story.id, Story.user_id, Story.title, Story.genre, Story.created_at, Story.updated_at)
+
+
+def encode_cursor(story: Story) -> str:
+    """Opaque cursor pointing just past a story in (updated_at, id) order"""
+    raw = f'{story.updated_at.isoformat()}|{story.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Inverse of encode_cursor()
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        updated_at, story_id = raw.split('|')
+        return datetime.fromisoformat(updated_at), int(story_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def list_stories(user_id: int, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+    """
+    One page of a user's stories, most recently updated first
+
+    Args:
+        user_id: Owner of the stories
+        limit: Page size (clamped to 1..MAX_PAGE_SIZE)
+        cursor: nextCursor from the previous page, if any
+
+    Returns:
+        (stories, next_cursor) - next_cursor is None on the last page. Only
+        the summary columns are loaded; touching the others raises.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = Story.query.options(load_only(*SUMMARY_COLUMNS, raiseload=True)) \
+        .filter(Story.user_id == user_id)
+    if cursor:
+        updated_at, story_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Story.updated_at, Story.id) < tuple_(updated_at, story_id))
+
+    # One extra row tells us whether another page exists
+    rows = query.order_by(Story.updated_at.desc(), Story.id.desc()).limit(limit + 1).all()
+    stories = rows[:limit]
+    next_cursor = encode_cursor(stories[-1]) if len(rows) > limit else None
+    return stories, next_cursor
+
+
+def get_user_story(user_id: int, story_id: int):
+    """A story with all its columns, or None if it doesn't exist or isn't the user's"""
+    return Story.query.filter_by(id=story_id, user_id=user_id).first()
+
+
+def create_story(user_id: int, screenplay, characters=None, story_idea: str = None,
+                 genre: str = None, scenes=None, sound_design=None) -> Story:
+    """
+    Save a generated package as a new story
+
+    Raises:
+        SchemaError: If the screenplay isn't a usable outline
+    """
+    story = Story(user_id=user_id, story_idea=story_idea, genre=genre)
+    story.set_content(screenplay, characters, scenes, sound_design)
+    db.session.add(story)
+    db.session.commit()
+    return story
@@ -0,0 +1,248 @@
+"""
+Two-tier memoization cache for AI completions
+Tier 1 is a per-process LRU with TTL; tier 2 is a SQLite file shared by every
+gunicorn worker on the host. Keys are hashes of everything that shapes the
+completion (model, prompts, sampling parameters, JSON mode).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'ai_cache.db')
+
+
+def make_cache_key(model: str, system_prompt: str, prompt: str, temperature: float,
+                   max_tokens: int, json_mode: bool) -> str:
+    """Stable hash of the parameters that determine a completion"""
+    material = json.dumps([model, system_prompt, prompt, temperature, max_tokens, bool(json_mode)],
+                          ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe LRU with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, stored_at: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, stored_at or time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk tier shared across processes
+    Entries expire by age; the table is pruned to a maximum entry count and
+    total size, least recently used first.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 200 * 1024 * 1024,
+                 ttl: float = 86400, prune_every: int = 50):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_cache_accessed ON ai_cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; autocommit with WAL so readers never block"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Return (value, created_at) or None"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def set(self, key: str, value: str):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode('utf-8')), now, now)
+        )
+        with self._writes_lock:
+            self._writes += 1
+            should_prune = self._writes % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired entries, then the least recently used ones over the limits"""
+        conn = self._connect()
+        conn.execute("DELETE FROM ai_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        if total > self.max_bytes:
+            # Walk from the oldest entry until enough bytes are released
+            excess = total - self.max_bytes
+            doomed = []
+            for key, size in conn.execute("SELECT key, size FROM ai_cache ORDER BY accessed_at"):
+                doomed.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM ai_cache WHERE key = ?", doomed)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM ai_cache")
+
+
+class AICache:
+    """Memory tier in front of the shared SQLite tier, with hit/miss counters"""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def peek(self, key: str) -> Optional[str]:
+        """Memory-tier lookup only; safe to call on the event loop"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.peek(key)
+        if value is not None:
+            return value
+
+        if self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"⚠️  AI cache read failed: {e}")
+                self._count('errors')
+                entry = None
+            if entry is not None:
+                value, created_at = entry
+                self.memory.set(key, value, stored_at=created_at)
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                print(f"⚠️  AI cache write failed: {e}")
+                self._count('errors')
+        self._count('stores')
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        return stats
+
+
+# Global cache instance
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_cache() -> Optional[AICache]:
+    """Get or create the process-wide AI cache (None when AI_CACHE_ENABLED=0)"""
+    global _cache
+    if os.getenv('AI_CACHE_ENABLED', '1') == '0':
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = float(os.getenv('AI_CACHE_TTL', '86400'))
+                memory = MemoryCache(max_entries=int(os.getenv('AI_CACHE_MAX_ENTRIES', '512')), ttl=ttl)
+                disk = None
+                if os.getenv('AI_CACHE_DISK_ENABLED', '1') != '0':
+                    try:
+                        disk = SQLiteCache(
+                            os.getenv('AI_CACHE_PATH', DEFAULT_CACHE_PATH),
+                            max_entries=int(os.getenv('AI_CACHE_DISK_MAX_ENTRIES', '10000')),
+                            max_bytes=int(float(os.getenv('AI_CACHE_DISK_MAX_MB', '200')) * 1024 * 1024),
+                            ttl=ttl
+                        )
+                    except sqlite3.Error as e:
+                        print(f"⚠️  AI disk cache unavailable, using memory only: {e}")
+                _cache = AICache(memory, disk)
+    return _cache
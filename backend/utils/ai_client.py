@@ -2,83 +2,371 @@
 AI Client for Groq API integration
 100% FREE - No credit card required!
 Super fast: 70+ tokens/second
+
+The client is asyncio-native: `agenerate` is the real implementation and
+`generate` is a thin blocking wrapper for the Flask routes. `astream`
+yields the completion as it is generated.
 """
+import asyncio
+import contextvars
 import os
-from groq import Groq
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from groq import AsyncGroq
 import httpx
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
+from utils.async_bridge import run_sync
+from utils.ai_cache import get_ai_cache, make_cache_key
+from utils.rate_limiter import get_rate_limiter, backoff_delay, estimate_request_tokens
+from utils.model_health import get_model_health, is_decommissioned_error
+from utils.single_flight import get_single_flight
+from utils.token_budget import MAX_OUTPUT_TOKENS
+from utils.metrics import MODEL_SECONDS, MODEL_RETRIES, MODEL_FALLBACKS, record_usage
+
+# Models to try in order of preference
+MODELS = [
+    "llama-3.3-70b-versatile",
+    "llama-3.1-70b-versatile",
+    "mixtral-8x7b-32768",
+    "llama-3.1-8b-instant"
+]
+
+# Set inside fresh_completions(); cached answers are not reused while it is
+_fresh = contextvars.ContextVar('ai_fresh_completions', default=False)
+
+
+@contextmanager
+def fresh_completions():
+    """
+    Ask the model again for every completion requested inside the block
+
+    Used for "try another version": the cached answer for an identical
+    prompt would otherwise come straight back. New answers still replace
+    the cached ones.
+    """
+    token = _fresh.set(True)
+    try:
+        yield
+    finally:
+        _fresh.reset(token)
+
 
 class AIClient:
     def __init__(self):
         """Initialize Groq API client (100% FREE!)"""
         self.api_key = os.getenv('GROQ_API_KEY', '')
-        
+
         if not self.api_key:
             raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        # Create httpx client with proxy detection disabled
-        http_client = httpx.Client(trust_env=False)
-        
-        # Groq client - OpenAI compatible
-        self.client = Groq(api_key=self.api_key, http_client=http_client)
-    def generate(self, prompt: str, max_retries: int = 2, json_mode: bool = False) -> Optional[str]:
+
+        # httpx async clients are bound to the event loop that first uses them,
+        # so keep one Groq client per loop (ASGI server loop, sync bridge loop).
+        self._clients = weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+        self.max_connections = int(os.getenv('AI_MAX_CONNECTIONS', '200'))
+
+    def _get_client(self) -> AsyncGroq:
+        """Get the Groq client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                # Create httpx client with proxy detection disabled
+                http_client = httpx.AsyncClient(
+                    trust_env=False,
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections)
+                )
+                # Groq client - OpenAI compatible. SDK retries are disabled so
+                # the rate limit scheduler below owns every retry decision.
+                client = AsyncGroq(api_key=self.api_key, http_client=http_client, max_retries=0)
+                self._clients[loop] = client
+        return client
+
+    @staticmethod
+    def _settings(json_mode: bool, max_tokens: Optional[int] = None):
+        """System prompt, temperature and max_tokens for a request"""
+        system_content = "You are a professional screenplay writer and story consultant."
+        if json_mode:
+            system_content += " You MUST respond with a valid JSON object ONLY. No other text."
+        temperature = 0.8 if json_mode else 0.9
+        max_tokens = max_tokens or (MAX_OUTPUT_TOKENS if json_mode else 2048)
+        return system_content, temperature, max_tokens
+
+    @staticmethod
+    async def _cached(cache, cache_key: str) -> Optional[str]:
+        """Cached completion for a key, checking the memory tier first"""
+        if cache is None:
+            return None
+        cached = cache.peek(cache_key)
+        if cached is None:
+            cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            print("⚡ AI cache hit")
+        return cached
+
+    async def agenerate(self, prompt: str, max_retries: int = 2, json_mode: bool = False,
+                        use_cache: bool = True, max_tokens: Optional[int] = None) -> Optional[str]:
         """
         Generate content with automatic model fallback for rate limits.
+
+        Identical requests are answered from the two-tier response cache;
+        pass use_cache=False (or call inside fresh_completions()) to force a
+        fresh completion (the result still replaces the cached one).
+        max_tokens defaults to the largest budget; generators pass their
+        stage's budget (see utils.token_budget).
+        """
+        system_content, temperature, max_tokens = self._settings(json_mode, max_tokens)
+        use_cache = use_cache and not _fresh.get()
+
+        # Keyed on the preferred model: a fallback answer stands in for it
+        cache = get_ai_cache()
+        cache_key = make_cache_key(MODELS[0], system_content, prompt, temperature, max_tokens, json_mode)
+        if use_cache:
+            cached = await self._cached(cache, cache_key)
+            if cached is not None:
+                return cached
+
+        async def complete():
+            return await self._acomplete(prompt, system_content, temperature, max_tokens, json_mode,
+                                         max_retries, cache, cache_key)
+
+        if not use_cache:
+            return await complete()
+
+        # Identical concurrent requests (double submits, several tabs) share
+        # one upstream call instead of each starting their own
+        disk = cache.disk if cache is not None else None
+        flight = get_single_flight(disk.path if disk is not None else None)
+        lookup = (lambda key: (disk.get(key) or (None,))[0]) if disk is not None else None
+        return await flight.do(cache_key, complete, lookup)
+
+    async def astream(self, prompt: str, max_retries: int = 2, json_mode: bool = False,
+                      use_cache: bool = True, max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Stream a completion, yielding text deltas as the model produces them
+
+        Uses the same cache, pacing, retries and model fallback as agenerate();
+        a cached answer is yielded in one piece. Fallback to another model is
+        only possible until the first delta has been yielded; a failure after
+        that is raised to the caller.
         """
-        # List of models to try in order of preference
-        models = [
-            "llama-3.3-70b-versatile",
-            "llama-3.1-70b-versatile",
-            "mixtral-8x7b-32768",
-            "llama-3.1-8b-instant"
-        ]
-        
+        system_content, temperature, max_tokens = self._settings(json_mode, max_tokens)
+        use_cache = use_cache and not _fresh.get()
+        cache = get_ai_cache()
+        cache_key = make_cache_key(MODELS[0], system_content, prompt, temperature, max_tokens, json_mode)
+        if use_cache:
+            cached = await self._cached(cache, cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        deltas = asyncio.Queue()
+        finished = object()
+
+        async def produce():
+            try:
+                await self._acomplete(prompt, system_content, temperature, max_tokens, json_mode,
+                                      max_retries, cache, cache_key, on_delta=deltas.put_nowait)
+            finally:
+                deltas.put_nowait(finished)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                delta = await deltas.get()
+                if delta is finished:
+                    break
+                yield delta
+            await producer  # surface errors
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+    @staticmethod
+    async def _read_stream(stream, on_delta: Callable[[str], None], started: list, model: str) -> str:
+        """Forward streamed deltas and return the full content"""
+        parts = []
+        async for chunk in stream:
+            # Groq reports usage on the final chunk
+            record_usage(model, getattr(getattr(chunk, 'x_groq', None), 'usage', None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                started.append(True)
+                parts.append(delta)
+                on_delta(delta)
+        return ''.join(parts)
+
+    async def _acomplete(self, prompt: str, system_content: str, temperature: float, max_tokens: int,
+                         json_mode: bool, max_retries: int, cache, cache_key: str,
+                         on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Call the model chain with pacing, backoff and circuit breaking; cache the result
+
+        With on_delta, the completion is streamed and each text delta is passed
+        to it as it arrives.
+        """
+        client = self._get_client()
+        streamed = []
+        scheduler = get_rate_limiter()
+        health = get_model_health()
+        cost = estimate_request_tokens(system_content + prompt, max_tokens)
         last_error = None
-        
-        for model in models:
+
+        # Models with an open circuit (decommissioned, failing, long rate
+        # limit window) are skipped instead of rediscovered on every call
+        for model in health.candidates(MODELS):
             for attempt in range(max_retries + 1):
+                # Pace the call against the model's known budget; if it won't
+                # have room soon, a fallback model is the faster option
                 try:
-                    system_content = "You are a professional screenplay writer and story consultant."
-                    if json_mode:
-                        system_content += " You MUST respond with a valid JSON object ONLY. No other text."
+                    acquired = await scheduler.acquire(model, cost)
+                except BaseException:
+                    # Cancelled while pacing: don't keep a half-open probe slot
+                    health.release(model)
+                    raise
+                if not acquired:
+                    health.release(model)
+                    print(f"⚠️  {model} is out of rate limit budget, trying next available model...")
+                    MODEL_FALLBACKS.labels(model=model, reason='budget').inc()
+                    last_error = last_error or Exception(f"Rate limit budget exhausted for {model}")
+                    break
 
+                answered = False
+                try:
                     params = {
                         "model": model,
                         "messages": [
                             {"role": "system", "content": system_content},
                             {"role": "user", "content": prompt}
                         ],
-                        "temperature": 0.8 if json_mode else 0.9,
-                        "max_tokens": 4096 if json_mode else 2048,
+                        "temperature": temperature,
+                        "max_tokens": max_tokens,
                     }
 
                     if json_mode:
                         params["response_format"] = {"type": "json_object"}
+                    if on_delta is not None:
+                        params["stream"] = True
+
+                    requested_at = time.perf_counter()
+                    raw = await client.chat.completions.with_raw_response.create(**params)
+                    scheduler.record_response(model, raw.headers)
+                    answered = True
+                    response = await raw.parse()
+                    finish_reason = None
+                    if on_delta is not None:
+                        content = await self._read_stream(response, on_delta, streamed, model)
+                    else:
+                        content = response.choices[0].message.content
+                        finish_reason = response.choices[0].finish_reason
+                        record_usage(model, getattr(response, 'usage', None))
+                    MODEL_SECONDS.labels(model=model, outcome='success').observe(time.perf_counter() - requested_at)
+                    health.record_success(model)
+                    if finish_reason == 'length' and json_mode and max_tokens < MAX_OUTPUT_TOKENS \
+                            and attempt < max_retries:
+                        # Budget was too tight and the JSON is cut off; ask again with more room
+                        max_tokens = min(max_tokens * 2, MAX_OUTPUT_TOKENS)
+                        cost = estimate_request_tokens(system_content + prompt, max_tokens)
+                        print(f"⚠️  {model} ran out of tokens, retrying with max_tokens={max_tokens}...")
+                        MODEL_RETRIES.labels(model=model, reason='truncated').inc()
+                        continue
+                    if cache is not None and content:
+                        await asyncio.to_thread(cache.set, cache_key, content)
+                    return content
 
-                    response = self.client.chat.completions.create(**params)
-                    return response.choices[0].message.content
-                
                 except Exception as e:
+                    status = getattr(e, 'status_code', None)
+                    rate_limited = status == 429 or "rate_limit_exceeded" in str(e).lower()
+                    MODEL_SECONDS.labels(model=model, outcome='rate_limited' if rate_limited else 'error') \
+                        .observe(time.perf_counter() - requested_at)
+                    if streamed:
+                        # Part of the answer is already out; retrying would repeat it
+                        health.record_failure(model, e)
+                        raise
                     last_error = e
-                    error_msg = str(e).lower()
-                    
-                    # If it's a rate limit (429), try the next model immediately
-                    if "rate_limit_exceeded" in error_msg or "429" in error_msg:
+
+                    if rate_limited:
+                        headers = getattr(getattr(e, 'response', None), 'headers', None)
+                        blocked_for = scheduler.record_rate_limit(model, headers)
+                        # A short Retry-After is cheaper than a weaker model;
+                        # acquire() sleeps it out on the next attempt
+                        if blocked_for <= scheduler.max_wait and attempt < max_retries:
+                            print(f"⚠️  Rate limit on {model}, retrying in {blocked_for:.1f}s...")
+                            MODEL_RETRIES.labels(model=model, reason='rate_limit').inc()
+                            continue
                         print(f"⚠️  Rate limit on {model}, trying next available model...")
+                        MODEL_FALLBACKS.labels(model=model, reason='rate_limit').inc()
+                        health.record_failure(model, e, cooldown=blocked_for)
                         break # Break inner loop to try next model
-                    
+
                     print(f"⚠️  Attempt {attempt + 1} with {model} failed: {str(e)}")
+                    headers = getattr(getattr(e, 'response', None), 'headers', None)
+                    if headers and 'x-ratelimit-remaining-tokens' in headers:
+                        scheduler.record_response(model, headers)
+                    else:
+                        scheduler.release(model, cost)
+
+                    if json_mode and 'json_validate_failed' in str(e) and max_tokens < MAX_OUTPUT_TOKENS \
+                            and attempt < max_retries:
+                        # JSON mode rejects answers cut off by max_tokens
+                        max_tokens = min(max_tokens * 2, MAX_OUTPUT_TOKENS)
+                        cost = estimate_request_tokens(system_content + prompt, max_tokens)
+                        print(f"⚠️  Retrying {model} with max_tokens={max_tokens}...")
+                        MODEL_RETRIES.labels(model=model, reason='truncated').inc()
+                        continue
+
+                    # Other client errors won't go away by retrying this model;
+                    # only a missing/decommissioned model counts against its health
+                    if status is not None and 400 <= status < 500 and status not in (408, 409):
+                        if is_decommissioned_error(e):
+                            health.record_failure(model, e)
+                        else:
+                            health.release(model)
+                        MODEL_FALLBACKS.labels(model=model, reason='client_error').inc()
+                        break
+
+                    if health.record_failure(model, e):
+                        MODEL_FALLBACKS.labels(model=model, reason='circuit_open').inc()
+                        break # Circuit opened, stop hammering this model
+
                     if attempt == max_retries:
                         print(f"❌ All retries for {model} failed.")
-        
+                        MODEL_FALLBACKS.labels(model=model, reason='exhausted').inc()
+                    else:
+                        MODEL_RETRIES.labels(model=model, reason='error').inc()
+                        await asyncio.sleep(backoff_delay(attempt))
+
+                except BaseException:
+                    # Cancelled mid-call (a sibling stage failed, the client went
+                    # away): neither a success nor a failure, so free the probe
+                    # slot and, if no answer came back, the budget reservation
+                    health.release(model)
+                    if not answered:
+                        scheduler.release(model, cost)
+                    raise
+
         raise Exception(f"AI Generation failed across all fallback models. Last error: {str(last_error)}")
 
+    def generate(self, prompt: str, max_retries: int = 2, json_mode: bool = False,
+                 use_cache: bool = True, max_tokens: Optional[int] = None) -> Optional[str]:
+        """Blocking wrapper around agenerate() for synchronous callers"""
+        return run_sync(self.agenerate(prompt, max_retries=max_retries, json_mode=json_mode, use_cache=use_cache,
+                                       max_tokens=max_tokens))
+
 # Global client instance
 _client = None
+_client_lock = threading.Lock()
 
 def get_ai_client() -> AIClient:
-    """Get or create the global AI client instance"""
+    """Get or create the global AI client instance (safe to call from pipeline threads)"""
     global _client
     if _client is None:
-        _client = AIClient()
+        with _client_lock:
+            if _client is None:
+                _client = AIClient()
     return _client
@@ -0,0 +1,70 @@
+"""
+Bridge between the synchronous Flask routes and the asyncio AI stack
+A single background event loop runs every coroutine submitted from sync code,
+so blocking callers share one set of upstream connections.
+"""
+import asyncio
+import contextvars
+import threading
+from typing import Awaitable, TypeVar
+
+T = TypeVar('T')
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _start_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name='async-bridge', daemon=True)
+    thread.start()
+    ready.wait()
+    return loop
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Get or start the background event loop for this process"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        with _loop_lock:
+            if _loop is None or _loop.is_closed():
+                _loop = _start_loop()
+    return _loop
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on the background loop and block until it finishes
+
+    The coroutine sees the caller's context variables.
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        Whatever the coroutine returns (exceptions are re-raised in the caller)
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the bridge loop itself; await the coroutine instead")
+
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), loop).result()
+
+
+async def _in_context(coro, context: contextvars.Context):
+    # Tasks copy the context that is current when they are created, so
+    # creating this one inside the caller's context carries its context
+    # variables (e.g. fresh_completions()) over to the bridge loop
+    return await context.run(asyncio.ensure_future, coro)
@@ -0,0 +1,119 @@
+"""
+Batch runner streaming newline-delimited JSON
+Items run as tasks on the shared bridge loop, at most BATCH_MAX_CONCURRENCY
+at a time across every batch in the process, and each result is written
+out as soon as its item finishes.
+"""
+import asyncio
+import json
+import os
+import queue
+import time
+from typing import Awaitable, Callable, Iterator, List, Tuple
+
+from utils.ai_client import MODELS
+from utils.async_bridge import get_loop
+from utils.rate_limiter import get_rate_limiter
+
+# Pipelines running at once for batches, process-wide
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
+# Blank lines sent while nothing has finished, so proxies keep the connection
+HEARTBEAT_SECONDS = float(os.getenv('BATCH_HEARTBEAT_SECONDS', '15'))
+
+_slots = None
+
+
+def _get_slots() -> asyncio.Semaphore:
+    """Process-wide batch slots (only ever used on the bridge loop)"""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    return _slots
+
+
+def format_ndjson(data) -> str:
+    """Encode one NDJSON line"""
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+
+async def _admission_delay():
+    """Hold new items back while every model is blocked by its rate limit"""
+    limiter = get_rate_limiter()
+    wait = min(limiter.wait_time(model) for model in MODELS)
+    if wait > 0:
+        print(f"⏱️  Holding batch item for {wait:.1f}s until a model has rate limit budget")
+        await asyncio.sleep(wait)
+
+
+async def _run_batch(items: List[Tuple[int, object]], run_item: Callable[[object], Awaitable[dict]],
+                     error_message: str, emit: Callable[[dict], None]):
+    slots = _get_slots()
+
+    async def run_one(index, item):
+        async with slots:
+            await _admission_delay()
+            try:
+                payload = await run_item(item)
+            except Exception as e:
+                print(f"❌ Batch item {index} error: {e}")
+                payload = {"success": False, "error": error_message, "details": str(e)}
+        emit({"index": index, **payload})
+
+    await asyncio.gather(*(run_one(index, item) for index, item in items))
+
+
+def stream_batch(items: List[Tuple[int, object]], run_item: Callable[[object], Awaitable[dict]],
+                 error_message: str, rejected: List[dict] = ()) -> Iterator[str]:
+    """
+    Run batch items concurrently and yield NDJSON lines as they finish
+
+    Args:
+        items: (index, item) pairs to run
+        run_item: Coroutine function turning one item into its response
+            payload (which should carry its own "success" flag)
+        error_message: User-facing message for items that raise
+        rejected: Payloads for items that failed validation (each with its
+            "index"); written first
+
+    Yields:
+        One line per item in completion order ({"index": ..., "success": ...,
+        ...}), then a summary line {"done": true, "total", "succeeded",
+        "failed", "elapsed"}. Items fail independently.
+    """
+    lines = queue.Queue()
+    finished = object()
+    started = time.perf_counter()
+    succeeded = failed = 0
+
+    def emit(payload):
+        lines.put(payload)
+
+    future = asyncio.run_coroutine_threadsafe(_run_batch(items, run_item, error_message, emit), get_loop())
+    future.add_done_callback(lambda _: lines.put(finished))
+
+    for payload in rejected:
+        failed += 1
+        yield format_ndjson(payload)
+
+    try:
+        while True:
+            try:
+                payload = lines.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield '\n'
+                continue
+            if payload is finished:
+                break
+            if payload.get('success'):
+                succeeded += 1
+            else:
+                failed += 1
+            yield format_ndjson(payload)
+    finally:
+        # Client went away: stop the items still running
+        future.cancel()
+
+    if future.exception() is not None:
+        print(f"❌ Batch error: {future.exception()}")
+    yield format_ndjson({"done": True, "total": succeeded + failed, "succeeded": succeeded,
+                         "failed": failed, "elapsed": round(time.perf_counter() - started, 3)})
@@ -0,0 +1,112 @@
+"""
+Database engine configuration
+Picks pool settings for the backend DATABASE_URL points at and tunes SQLite
+for several gunicorn workers and job workers sharing one file: WAL journal
+(readers never wait for a writer), synchronous=NORMAL (no fsync per
+commit), a busy timeout (writers queue instead of failing with "database
+is locked"), and a larger page cache and memory map.
+"""
+import os
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = 'sqlite:///scriptoria.db'
+
+# How long a writer waits for the write lock before giving up
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_BYTES = int(os.getenv('SQLITE_MMAP_MB', '128')) * 1024 * 1024
+# Page cache per connection, in KiB
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_MB', '32')) * 1024
+
+# Connections kept open per process, and extra ones allowed under bursts
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+# Seconds to wait for a free connection
+POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Server connections are replaced after this many seconds (before proxies drop them)
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+
+def database_url() -> str:
+    """
+    DATABASE_URL, normalised for SQLAlchemy
+
+    Heroku-style postgres:// URLs are rewritten to postgresql://, which is
+    the only scheme SQLAlchemy 1.4+ accepts.
+    """
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def engine_options(url: str) -> dict:
+    """
+    create_engine() keyword arguments for a database URL
+
+    Args:
+        url: SQLAlchemy database URL
+
+    Returns:
+        Options for SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if is_sqlite(url):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            # Flask-SQLAlchemy gives in-memory databases a single shared connection
+            return {}
+        return {
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+            # Connections move between request threads, job workers and the asyncio bridge
+            'connect_args': {'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False}
+        }
+    return {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+        # Replace connections the server closed while they sat in the pool
+        'pool_pre_ping': True
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Per-connection SQLite settings (the 'connect' event handler)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine):
+    """Install the SQLite pragmas on an engine (no-op for other backends)"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+
+
+def init_database(app, db):
+    """
+    Point Flask-SQLAlchemy at DATABASE_URL with backend-specific engine settings
+
+    Args:
+        app: The Flask app (its database config is filled in here)
+        db: The SQLAlchemy extension, not yet initialised
+    """
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
@@ -1,69 +1,140 @@
 """
 Utility for robustly extracting and parsing JSON from AI responses
+
+Responses are parsed directly when they are already valid JSON (the usual
+case in JSON mode). Otherwise a single string-aware pass repairs trailing
+commas, comments and raw control characters without touching string
+contents, and the payload is decoded from its first bracket (after any
+markdown fence) with trailing prose ignored.
 """
 import json
 import re
 
+try:
+    import orjson
+except ImportError:  # optional, faster parser
+    orjson = None
+
+from utils.metrics import JSON_PARSE_ISSUES
+
+# String literals are matched whole (and kept via group 1) so nothing inside
+# them is ever rewritten; everything else matched here is removed
+_REPAIR = re.compile(r'''
+    ("[^"\\]*(?:\\.[^"\\]*)*")                         # string literal
+  | //[^\n]*|/\*[\s\S]*?\*/                           # comment
+  | ,(?=(?:\s|//[^\n]*|/\*[\s\S]*?\*/)*[\]}])         # trailing comma
+  | [\x00-\x08\x0b\x0c\x0e-\x1f]                      # stray control character
+''', re.VERBOSE)
+_STRING_CONTROL = re.compile(r'[\x00-\x1f]')
+_STRING_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_PAYLOAD_START = re.compile(r'[\[{]')
+_FENCE = re.compile(r'```[a-zA-Z]*')
+_decoder = json.JSONDecoder()
+# Candidate start positions tried before giving up on noisy responses
+MAX_START_ATTEMPTS = 3
+
+
+def _loads(text: str):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _repair_token(match) -> str:
+    token = match.group(1)
+    if token is None:
+        return ''
+    # Raw newlines/tabs inside strings are invalid JSON; escape them
+    return _STRING_CONTROL.sub(lambda m: _STRING_ESCAPES.get(m.group(0), ''), token)
+
+
+def _repair(text: str, escape_strings: bool = False) -> str:
+    """
+    Drop comments, trailing commas and stray control characters in one pass
+
+    String literals are matched as whole tokens, so commas, slashes and
+    brackets inside values are never touched. With escape_strings, raw
+    control characters inside strings are escaped too (slower, so only
+    done when the plain repair is not enough).
+    """
+    if escape_strings:
+        return _REPAIR.sub(_repair_token, text)
+    return _REPAIR.sub(r'\1', text)
+
+
+def _decode(text: str, start: int):
+    """Parse the first JSON value at start, ignoring whatever follows it"""
+    return _decoder.raw_decode(text, start)
+
+
+def _payload_starts(response: str):
+    """Positions of candidate opening brackets, after any markdown fence"""
+    fence = _FENCE.search(response)
+    offset = fence.end() if fence else 0
+    for match in _PAYLOAD_START.finditer(response, offset):
+        yield match.start()
+    if offset:
+        # The fence may not hold the JSON after all
+        for match in _PAYLOAD_START.finditer(response[:fence.start()]):
+            yield match.start()
+
+
 def extract_json(response: str) -> str:
     """
     Extracts JSON string from a response that might contain markdown or extra text.
+
+    The payload is repaired on the way (see clean_json_string).
     """
-    # Clean the response of any weird characters that might break parsing
-    # (e.g., hidden control characters)
-    response = "".join(char for char in response if ord(char) >= 32 or char in "\n\r\t")
-    
-    # 1. Look for ```json ... ``` blocks
-    json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
-    if json_match:
-        return json_match.group(1).strip()
-    
-    # 2. Look for the first '[' or '{' and the last ']' or '}'
-    first_bracket = response.find('[')
-    first_brace = response.find('{')
-    
-    start_idx = -1
-    if first_bracket != -1 and (first_brace == -1 or first_bracket < first_brace):
-        start_idx = first_bracket
-        end_char = ']'
-    elif first_brace != -1:
-        start_idx = first_brace
-        end_char = '}'
-        
-    if start_idx != -1:
-        last_idx = response.rfind(end_char)
-        if last_idx != -1:
-            return response[start_idx:last_idx+1].strip()
-            
+    for start in _payload_starts(response):
+        repaired = _repair(response[start:], escape_strings=True)
+        try:
+            _, end = _decode(repaired, 0)
+            return repaired[:end]
+        except ValueError:
+            closer = '}' if repaired[0] == '{' else ']'
+            return repaired[:repaired.rfind(closer) + 1 or len(repaired)].strip()
     return response.strip()
 
 def clean_json_string(json_str: str) -> str:
     """
     Cleans common AI-generated JSON mistakes like trailing commas.
+
+    String-aware: commas, slashes and brackets inside string values are
+    left alone.
     """
-    # Remove trailing commas before closing braces/brackets
-    json_str = re.sub(r',\s*([\]}])', r'\1', json_str)
-    
-    # Fix common mistakes like single quotes being used as property names
-    # This is risky but helps with some smaller models
-    # Only replace ' if it looks like it's surrounding a key
-    # json_str = re.sub(r"'(.*?)':", r'"\1":', json_str)
-    
-    return json_str
+    return _repair(json_str, escape_strings=True).strip()
 
 def safe_parse_json(response: str):
     """
     Combines extraction and cleaning to safely parse JSON.
     """
-    json_str = extract_json(response)
-    cleaned_str = clean_json_string(json_str)
-    
+    # JSON mode usually returns a clean document: parse it as-is
     try:
-        return json.loads(cleaned_str)
-    except json.JSONDecodeError as first_error:
-        # One last attempt: remove comments if AI included them (e.g., // some comment)
-        very_clean_str = re.sub(r'//.*?\n', '\n', cleaned_str)
-        very_clean_str = re.sub(r'/\*.*?\*/', '', very_clean_str, flags=re.DOTALL)
+        return _loads(response)
+    except ValueError:
+        pass
+
+    first_error = None
+    for attempt, start in enumerate(_payload_starts(response)):
+        if attempt >= MAX_START_ATTEMPTS:
+            break
+        for escape_strings in (False, True):
+            try:
+                result = _decode(_repair(response[start:], escape_strings), 0)[0]
+            except json.JSONDecodeError as e:
+                first_error = first_error or e
+                if not e.msg.startswith('Invalid control character'):
+                    break
+            else:
+                JSON_PARSE_ISSUES.labels(outcome='repaired').inc()
+                return result
+
+    if first_error is None:
+        # No brackets at all; report the error for the text as-is
         try:
-            return json.loads(very_clean_str)
-        except:
-            raise first_error
+            return json.loads(response.strip())
+        except ValueError:
+            JSON_PARSE_ISSUES.labels(outcome='failed').inc()
+            raise
+    JSON_PARSE_ISSUES.labels(outcome='failed').inc()
+    raise first_error
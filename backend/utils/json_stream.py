@@ -0,0 +1,85 @@
+"""
+Incremental JSON parsing for streamed completions
+Yields the objects of a JSON array as soon as each one's closing brace
+arrives, so a scene breakdown can be shown while the model is still
+writing the rest of it.
+"""
+from typing import List
+
+from utils.json_helper import safe_parse_json
+
+_OPENERS = '{['
+_CLOSERS = '}]'
+
+
+class JSONArrayStream:
+    """
+    Feed text chunks in, get completed array elements out
+
+    Tracks the first array whose elements are objects, wherever it sits
+    (a bare top-level array, or e.g. {"scenes": [...]} as JSON mode tends
+    to return). String literals are honoured, so braces inside values don't
+    confuse it. Prose or markdown around the JSON is skipped.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._candidate = None      # depth of an array whose first element is unknown
+        self._target = None         # depth of the array being emitted
+        self._element_start = None
+        self.finished = False
+        self.count = 0
+
+    def feed(self, chunk: str) -> List:
+        """Add a chunk and return the elements it completed"""
+        self.text += chunk
+        items = []
+        text = self.text
+        stack = self._stack
+
+        for pos in range(self._pos, len(text)):
+            if self.finished:
+                break
+            char = text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._candidate is not None and not char.isspace():
+                # First element decides whether this is the array we want
+                if char == '{' and len(stack) == self._candidate:
+                    self._target = self._candidate
+                self._candidate = None
+
+            if char == '"':
+                self._in_string = True
+            elif char in _OPENERS:
+                stack.append(char)
+                if char == '[' and self._target is None:
+                    self._candidate = len(stack)
+                elif char == '{' and self._target is not None and len(stack) == self._target + 1:
+                    self._element_start = pos
+            elif char in _CLOSERS and stack:
+                stack.pop()
+                if self._target is None:
+                    continue
+                if char == '}' and len(stack) == self._target and self._element_start is not None:
+                    items.append(safe_parse_json(text[self._element_start:pos + 1]))
+                    self._element_start = None
+                    self.count += 1
+                elif char == ']' and len(stack) == self._target - 1:
+                    self.finished = True
+
+        self._pos = len(text)
+        return items
+
@@ -0,0 +1,121 @@
+"""
+Prometheus metrics
+Stage and upstream model latencies, retries and fallbacks, token usage, JSON
+repair failures and PDF/extraction timings, served at /metrics. Under
+gunicorn, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) so every
+worker's samples land in one directory and /metrics reports their sum; job
+workers started with the same directory are included too.
+
+prometheus_client is optional: without it every metric is a no-op and
+/metrics answers 503.
+"""
+import os
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # optional; metrics are then dropped
+    prometheus_client = None
+
+METRICS_ENABLED = prometheus_client is not None
+
+STAGE_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+MODEL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+RENDER_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _NoopTimer:
+    """Stands in for Histogram.time() as a context manager or decorator"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, func):
+        return func
+
+
+class _NoopMetric:
+    """Accepts the calls a Counter or Histogram would and records nothing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+    def time(self):
+        return _NoopTimer()
+
+
+def _histogram(name: str, documentation: str, labelnames=(), buckets=MODEL_BUCKETS):
+    if not METRICS_ENABLED:
+        return _NoopMetric()
+    return Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def _counter(name: str, documentation: str, labelnames=()):
+    if not METRICS_ENABLED:
+        return _NoopMetric()
+    return Counter(name, documentation, labelnames)
+
+
+# status: completed or failed
+STAGE_SECONDS = _histogram('scriptoria_stage_duration_seconds', 'Generator pipeline stage run time',
+                           ['stage', 'status'], STAGE_BUCKETS)
+# outcome: success, rate_limited or error
+MODEL_SECONDS = _histogram('scriptoria_model_request_duration_seconds', 'Groq completion request latency',
+                           ['model', 'outcome'], MODEL_BUCKETS)
+# reason: rate_limit, truncated or error
+MODEL_RETRIES = _counter('scriptoria_model_retries_total', 'Completion requests retried on the same model',
+                         ['model', 'reason'])
+# reason: budget (out of rate limit budget), rate_limit, client_error, circuit_open or exhausted
+MODEL_FALLBACKS = _counter('scriptoria_model_fallbacks_total', 'Completions that gave up on a model for the next',
+                           ['model', 'reason'])
+# kind: prompt or completion
+MODEL_TOKENS = _histogram('scriptoria_model_tokens', 'Tokens per completion as reported in response.usage',
+                          ['model', 'kind'], TOKEN_BUCKETS)
+# outcome: repaired (parsed after cleanup) or failed
+JSON_PARSE_ISSUES = _counter('scriptoria_json_parse_issues_total', 'Model answers that were not valid JSON as returned',
+                             ['outcome'])
+PDF_RENDER_SECONDS = _histogram('scriptoria_pdf_render_seconds', 'PDF export render time', (), RENDER_BUCKETS)
+# format: pdf or docx
+EXTRACTION_SECONDS = _histogram('scriptoria_text_extraction_seconds', 'Uploaded script text extraction time',
+                                ['format'], RENDER_BUCKETS)
+
+
+def record_usage(model: str, usage):
+    """Observe prompt and completion token counts from a response's usage block"""
+    if usage is None:
+        return
+    for kind in ('prompt', 'completion'):
+        tokens = getattr(usage, f'{kind}_tokens', None)
+        if tokens is not None:
+            MODEL_TOKENS.labels(model=model, kind=kind).observe(tokens)
+
+
+def _multiprocess_dir():
+    return os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir')
+
+
+def render_metrics():
+    """
+    Current metrics in the Prometheus text format
+
+    Returns:
+        (body, content_type) - summed across processes in multiprocess mode
+    """
+    if _multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,194 @@
+"""
+Process-wide health tracking and circuit breaking for upstream models
+Known-bad models are skipped until their cooldown ends; then a single
+half-open probe decides whether they rejoin the fallback chain.
+"""
+import os
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+# Consecutive failures before a model's circuit opens
+FAILURE_THRESHOLD = int(os.getenv('MODEL_FAILURE_THRESHOLD', '3'))
+# First cooldown after the circuit opens; doubles on each failed probe
+BASE_COOLDOWN = float(os.getenv('MODEL_COOLDOWN_SECONDS', '30'))
+MAX_COOLDOWN = float(os.getenv('MODEL_MAX_COOLDOWN_SECONDS', '900'))
+# Decommissioned / unknown models won't come back soon
+DECOMMISSIONED_COOLDOWN = float(os.getenv('MODEL_DECOMMISSIONED_COOLDOWN_SECONDS', '21600'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_decommissioned_error(error: Exception) -> bool:
+    """True for errors that mean the model itself is gone, not just failing"""
+    status = getattr(error, 'status_code', None)
+    message = str(error).lower()
+    return 'decommissioned' in message or 'model_not_found' in message or \
+        (status == 404 and 'model' in message)
+
+
+class ModelHealth:
+    """Circuit breaker state for one model"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.cooldown = BASE_COOLDOWN
+        self.cooldown_until = 0.0
+        self.probe_in_flight = False
+        self.last_error = None
+        self.last_failure_at = None
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.consecutive_failures,
+            "totalFailures": self.total_failures,
+            "totalSuccesses": self.total_successes,
+            "cooldownRemaining": round(max(0.0, self.cooldown_until - now), 2),
+            "lastError": self.last_error,
+            "lastFailureAt": self.last_failure_at
+        }
+
+
+class ModelHealthRegistry:
+    """Shared health state for every model in the fallback chain"""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = ModelHealth(model)
+        return health
+
+    def allow(self, model: str) -> bool:
+        """
+        Should a call to `model` go ahead?
+
+        An open circuit whose cooldown has passed moves to half-open and lets
+        exactly one probe through; everyone else keeps skipping it until the
+        probe reports back.
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(model)
+            if health.state == CLOSED:
+                return True
+            if health.state == OPEN and now >= health.cooldown_until:
+                health.state = HALF_OPEN
+                health.probe_in_flight = False
+            if health.state == HALF_OPEN and not health.probe_in_flight:
+                health.probe_in_flight = True
+                print(f"🩺 Probing {model} after cooldown...")
+                return True
+            return False
+
+    def candidates(self, models: Iterable[str]) -> Iterator[str]:
+        """
+        Lazily walk a fallback chain, yielding models that may be called now
+
+        Models are checked one at a time so a half-open probe slot is only
+        taken when the caller actually reaches that model. If every model is
+        unavailable, the one closest to recovering is yielded so the request
+        still gets a chance.
+        """
+        models = list(models)
+        yielded = False
+        for model in models:
+            if self.allow(model):
+                yielded = True
+                yield model
+        if not yielded and models:
+            with self._lock:
+                soonest = min(models, key=lambda m: self._get(m).cooldown_until)
+            yield soonest
+
+    def release(self, model: str):
+        """Free a half-open probe slot that ended up unused"""
+        with self._lock:
+            health = self._get(model)
+            if health.state == HALF_OPEN:
+                health.probe_in_flight = False
+
+    def record_success(self, model: str):
+        with self._lock:
+            health = self._get(model)
+            if health.state != CLOSED:
+                print(f"💚 {model} recovered")
+            health.state = CLOSED
+            health.consecutive_failures = 0
+            health.cooldown = BASE_COOLDOWN
+            health.probe_in_flight = False
+            health.total_successes += 1
+
+    def record_failure(self, model: str, error: Exception, cooldown: Optional[float] = None) -> bool:
+        """
+        Count a failed call
+
+        Args:
+            model: Model that failed
+            error: The exception raised
+            cooldown: Open the circuit immediately for this many seconds
+                (e.g. a long Retry-After); decommissioned models get
+                DECOMMISSIONED_COOLDOWN automatically
+
+        Returns:
+            True if the model's circuit is now open
+        """
+        now = time.monotonic()
+        if cooldown is None and is_decommissioned_error(error):
+            cooldown = DECOMMISSIONED_COOLDOWN
+
+        with self._lock:
+            health = self._get(model)
+            health.consecutive_failures += 1
+            health.total_failures += 1
+            health.last_error = str(error)[:300]
+            health.last_failure_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            health.probe_in_flight = False
+
+            if cooldown is not None:
+                open_for = cooldown
+            elif health.state == HALF_OPEN:
+                # Failed probe: back off harder before the next one
+                health.cooldown = min(MAX_COOLDOWN, health.cooldown * 2)
+                open_for = health.cooldown
+            elif health.consecutive_failures >= FAILURE_THRESHOLD:
+                open_for = health.cooldown
+            else:
+                return False
+
+            health.state = OPEN
+            health.cooldown_until = max(health.cooldown_until, now + open_for)
+            print(f"🔌 Circuit open for {model} ({open_for:.0f}s)")
+            return True
+
+    def snapshot(self, models: Iterable[str] = ()) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            for model in models:
+                self._get(model)
+            return {model: health.to_dict(now) for model, health in self._models.items()}
+
+
+# Global registry instance
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_health() -> ModelHealthRegistry:
+    """Get or create the process-wide model health registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelHealthRegistry()
+    return _registry
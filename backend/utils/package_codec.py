@@ -0,0 +1,77 @@
+"""
+Compact binary encoding for stored story packages
+Packages are serialised as canonical JSON (sorted keys, no whitespace) and
+compressed with zstd when the zstandard package is installed, zlib
+otherwise. The first byte names the codec, so blobs written with either can
+be read back whichever is configured now.
+"""
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, better ratio and faster decompression
+    zstandard = None
+
+ZLIB = b'z'
+ZSTD = b's'
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = int(os.getenv('PACKAGE_ZSTD_LEVEL', '10'))
+
+
+def _default_codec() -> bytes:
+    codec = os.getenv('PACKAGE_CODEC', 'zstd' if zstandard is not None else 'zlib')
+    if codec == 'zstd' and zstandard is not None:
+        return ZSTD
+    return ZLIB
+
+
+PACKAGE_CODEC = _default_codec()
+
+
+def canonical_json(data) -> bytes:
+    """UTF-8 JSON with sorted keys and no whitespace"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode_package(data, codec: bytes = None) -> bytes:
+    """
+    Compress a package dict for storage
+
+    Args:
+        data: JSON-serialisable package
+        codec: ZLIB or ZSTD (defaults to PACKAGE_CODEC)
+
+    Returns:
+        Codec byte followed by the compressed canonical JSON
+    """
+    codec = codec or PACKAGE_CODEC
+    raw = canonical_json(data)
+    if codec == ZSTD:
+        return ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return ZLIB + zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decode_package(blob: bytes):
+    """
+    Inverse of encode_package()
+
+    Raises:
+        ValueError: If the blob uses an unknown codec, or zstd without zstandard installed
+    """
+    blob = bytes(blob)
+    codec, payload = blob[:1], blob[1:]
+    if codec == ZLIB:
+        try:
+            raw = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt package: {e}") from e
+    elif codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("Package is zstd-compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raise ValueError(f"Unknown package codec {codec!r}")
+    return json.loads(raw)
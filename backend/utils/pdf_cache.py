@@ -0,0 +1,122 @@
+"""
+Content-addressed on-disk cache for exported PDFs
+Rendered packages are stored under a hash of the fields generate_pdf()
+reads, so repeat downloads of the same package skip ReportLab entirely and
+the hash doubles as the response ETag.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from utils.pdf_generator import PDF_LAYOUT_VERSION
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'pdf_cache')
+
+# Package fields that affect the rendered document
+PDF_FIELDS = ('screenplay', 'characters', 'scenes', 'soundDesign')
+
+
+def pdf_cache_key(data: dict) -> str:
+    """
+    Canonical hash of a package's PDF-relevant content
+
+    Key order, whitespace and unrelated fields (timestamps, pipeline
+    timings) do not change the key; a layout version bump does.
+    """
+    payload = {field: data.get(field) for field in PDF_FIELDS}
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{PDF_LAYOUT_VERSION}\n{canonical}'.encode('utf-8')).hexdigest()
+
+
+class PDFCache:
+    """Bounded directory of rendered PDFs, evicted least recently used first"""
+
+    def __init__(self, directory: str, max_files: int = 500, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached PDF for key, or None"""
+        path = self.path(key)
+        try:
+            os.utime(path)  # mark as recently used for eviction
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, pdf_bytes: bytes) -> str:
+        """Store a rendered PDF atomically and return its path"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.prune()
+        return self.path(key)
+
+    def prune(self):
+        """Drop the least recently used files beyond the count and size limits"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pdf'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort(reverse=True)
+
+            total = 0
+            for index, (_, size, path) in enumerate(entries):
+                total += size
+                if index >= self.max_files or total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "directory": self.directory}
+
+
+# Global cache instance
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> Optional[PDFCache]:
+    """Get or create the process-wide PDF cache (None if disabled or unusable)"""
+    global _pdf_cache
+    if os.getenv('PDF_CACHE_ENABLED', '1') == '0':
+        return None
+    if _pdf_cache is None:
+        with _pdf_cache_lock:
+            if _pdf_cache is None:
+                try:
+                    _pdf_cache = PDFCache(
+                        os.getenv('PDF_CACHE_DIR', DEFAULT_CACHE_DIR),
+                        max_files=int(os.getenv('PDF_CACHE_MAX_FILES', '500')),
+                        max_bytes=int(float(os.getenv('PDF_CACHE_MAX_MB', '200')) * 1024 * 1024)
+                    )
+                except OSError as e:
+                    print(f"⚠️  PDF cache disabled: {e}")
+                    return None
+    return _pdf_cache
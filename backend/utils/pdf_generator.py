@@ -4,7 +4,13 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak,
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 import io
+from utils.schema import SoundDesign, normalize_package
+from utils.metrics import PDF_RENDER_SECONDS
 
+# Bump whenever the layout below changes so cached exports are re-rendered
+PDF_LAYOUT_VERSION = '2'
+
+@PDF_RENDER_SECONDS.time()
 def generate_pdf(data):
     """
     Generates a production script PDF from the provided data.
@@ -57,65 +63,66 @@ def generate_pdf(data):
     
     elements = []
     
+    package = normalize_package(data)
+    screenplay = package.screenplay
+    
     # TITLE PAGE
     elements.append(Spacer(1, 2 * inch))
-    elements.append(Paragraph(data['screenplay'].get('title', 'Untitled Script').upper(), title_style))
-    elements.append(Paragraph(f"GENRE: {data['screenplay'].get('genre', 'Unknown')}", subtitle_style))
+    elements.append(Paragraph((screenplay.title or 'Untitled Script').upper(), title_style))
+    elements.append(Paragraph(f"GENRE: {screenplay.genre or 'Unknown'}", subtitle_style))
     elements.append(Spacer(1, 0.5 * inch))
-    elements.append(Paragraph(f"LOGLINE: {data['screenplay'].get('logline', 'No logline available.')}", body_style))
+    elements.append(Paragraph(f"LOGLINE: {screenplay.logline or 'No logline available.'}", body_style))
     elements.append(Spacer(1, 1 * inch))
     elements.append(Paragraph("SCRIPTORIA PRODUCTION PACKAGE", subtitle_style))
     elements.append(PageBreak())
     
     # CHARACTERS
     elements.append(Paragraph("CHARACTER PROFILES", heading_style))
-    for char in data.get('characters', []):
-        elements.append(Paragraph(char.get('name', 'Unknown'), subheading_style))
-        elements.append(Paragraph(f"<b>ROLE:</b> {char.get('role', 'Unknown')}", body_style))
-        elements.append(Paragraph(f"<b>ARC:</b> {char.get('arc', 'No arc description.')}", body_style))
-        elements.append(Paragraph(f"<b>TRAITS:</b> {', '.join(char.get('traits', []))}", body_style))
+    for char in package.characters:
+        elements.append(Paragraph(char.name, subheading_style))
+        elements.append(Paragraph(f"<b>ROLE:</b> {char.role or 'Unknown'}", body_style))
+        elements.append(Paragraph(f"<b>ARC:</b> {char.arc or 'No arc description.'}", body_style))
+        elements.append(Paragraph(f"<b>TRAITS:</b> {', '.join(char.traits)}", body_style))
         elements.append(Spacer(1, 15))
     elements.append(PageBreak())
     
     # SCREENPLAY OUTLINE
     elements.append(Paragraph("SCREENPLAY OUTLINE", heading_style))
-    for act_key, act_data in data['screenplay'].get('threeActStructure', {}).items():
-        elements.append(Paragraph(act_data.get('title', act_key.upper()), subheading_style))
-        elements.append(Paragraph(act_data.get('description', ''), body_style))
-        
-        event_list = act_data.get('keyEvents', [])
-        for event in event_list:
+    for act in screenplay.acts.values():
+        elements.append(Paragraph(act.title, subheading_style))
+        elements.append(Paragraph(act.description, body_style))
+        for event in act.key_events:
             elements.append(Paragraph(f"• {event}", body_style))
         elements.append(Spacer(1, 10))
     elements.append(PageBreak())
     
     # SCENE BREAKDOWN
     elements.append(Paragraph("SCENE BREAKDOWN", heading_style))
-    for scene in data.get('scenes', []):
-        elements.append(Paragraph(f"SCENE {scene.get('sceneNumber', '')}: {scene.get('location', '')} - {scene.get('timeOfDay', '')}", subheading_style))
-        elements.append(Paragraph(f"<b>CHARACTERS:</b> {', '.join(scene.get('characters', []))}", body_style))
-        elements.append(Paragraph(scene.get('action', ''), body_style))
-        elements.append(Paragraph(f"<b>EST. DURATION:</b> {scene.get('duration', '2.5')} MIN", body_style))
+    for scene in package.scenes:
+        elements.append(Paragraph(f"SCENE {scene.scene_number}: {scene.location} - {scene.time_of_day}", subheading_style))
+        elements.append(Paragraph(f"<b>CHARACTERS:</b> {', '.join(scene.characters)}", body_style))
+        elements.append(Paragraph(scene.action, body_style))
+        elements.append(Paragraph(f"<b>EST. DURATION:</b> {scene.duration or '2.5'} MIN", body_style))
         elements.append(Spacer(1, 15))
     elements.append(PageBreak())
     
     # SOUND DESIGN
     elements.append(Paragraph("SOUND DESIGN", heading_style))
-    sound = data.get('soundDesign', {})
-    if sound:
-        music = sound.get('musicTheme', {})
+    sound = package.sound_design
+    if sound != SoundDesign():
+        music = sound.music_theme
         elements.append(Paragraph("MUSIC THEME", subheading_style))
-        elements.append(Paragraph(f"<b>STYLE:</b> {music.get('style', 'Unknown')}", body_style))
-        elements.append(Paragraph(f"<b>MOOD:</b> {music.get('mood', 'Unknown')}", body_style))
-        elements.append(Paragraph(f"<b>INSTRUMENTS:</b> {', '.join(music.get('instruments', []))}", body_style))
+        elements.append(Paragraph(f"<b>STYLE:</b> {music.style or 'Unknown'}", body_style))
+        elements.append(Paragraph(f"<b>MOOD:</b> {music.mood or 'Unknown'}", body_style))
+        elements.append(Paragraph(f"<b>INSTRUMENTS:</b> {', '.join(music.instruments)}", body_style))
         
         elements.append(Paragraph("AMBIENCE", subheading_style))
-        for amb in sound.get('ambience', []):
-            elements.append(Paragraph(f"• {amb.get('location', '')}: {amb.get('description', '')} ({amb.get('mood', '')})", body_style))
+        for amb in sound.ambience:
+            elements.append(Paragraph(f"• {amb.location}: {amb.description} ({amb.mood})", body_style))
             
         elements.append(Paragraph("KEY SOUND MOMENTS", subheading_style))
-        for moment in sound.get('keyMoments', []):
-            elements.append(Paragraph(f"• SCN {moment.get('scene')}: {moment.get('moment')} - <i>{moment.get('soundDesign')}</i>", body_style))
+        for moment in sound.key_moments:
+            elements.append(Paragraph(f"• SCN {moment.scene}: {moment.moment} - <i>{moment.sound_design}</i>", body_style))
     
     # Build PDF
     doc.build(elements)
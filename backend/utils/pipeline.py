@@ -0,0 +1,403 @@
+"""
+Dependency-graph executor for generator stages
+Independent stages run concurrently on a shared, bounded thread pool, or as
+asyncio tasks when driven from the ASGI entry point.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.metrics import STAGE_SECONDS
+
+# Shared pool for every request in this process. Stages spend nearly all of
+# their time waiting on Groq, so a handful of threads goes a long way.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the process-wide stage executor"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(os.getenv('PIPELINE_MAX_WORKERS', '8'))
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+    return _executor
+
+
+# Set while a stage runs when the caller wants partial results (see item_sink)
+_item_sink = contextvars.ContextVar('pipeline_item_sink', default=None)
+
+
+def item_sink() -> Optional[Callable]:
+    """
+    Callable(item) for reporting partial results from the running stage
+
+    Returns None unless the pipeline was started with on_item, so stages can
+    skip streaming work nobody will see. Capture it before handing work to
+    another thread; run_sync() carries it over to the bridge loop.
+    """
+    return _item_sink.get()
+
+
+class PipelineCancelled(Exception):
+    """The caller gave up on a run (e.g. a streaming client disconnected)"""
+
+
+class Stage:
+    """A pipeline stage and the names of the values it needs"""
+
+    def __init__(self, name: str, func: Callable, requires: Iterable[str] = (),
+                 afunc: Optional[Callable] = None):
+        """
+        Args:
+            name: Key the stage result is stored under
+            func: Callable receiving the required values positionally
+            requires: Names of pipeline inputs or other stages, in argument order
+            afunc: Optional coroutine function used by arun_pipeline()
+        """
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.afunc = afunc
+
+    def __repr__(self):
+        return f'<Stage {self.name} <- {", ".join(self.requires) or "-"}>'
+
+
+class PipelineResult:
+    """Stage outputs plus timing information for one pipeline run"""
+
+    def __init__(self, results: Dict, timings: Dict, stages: List[Stage], reused: Iterable[str] = ()):
+        self.results = results
+        self.timings = timings
+        self.stages = stages
+        self.reused = list(reused)
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    @property
+    def elapsed(self) -> float:
+        if not self.timings:
+            return 0.0
+        start = min(t[0] for t in self.timings.values())
+        end = max(t[1] for t in self.timings.values())
+        return end - start
+
+    @property
+    def critical_path(self) -> List[str]:
+        """Chain of stages that determined the total wall-clock time"""
+        return critical_path(self.stages, self.timings)
+
+    def report(self) -> dict:
+        """JSON-friendly summary of stage durations and the critical path"""
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "stages": {name: round(end - start, 3) for name, (start, end) in self.timings.items()},
+            "criticalPath": self.critical_path,
+            "reused": self.reused
+        }
+
+
+def critical_path(stages: List[Stage], timings: Dict) -> List[str]:
+    """
+    Walk back from the last stage to finish, always following the dependency
+    that finished last (the one the stage actually waited on).
+    """
+    by_name = {stage.name: stage for stage in stages}
+    timed = [name for name in timings if name in by_name]
+    if not timed:
+        return []
+
+    path = []
+    current = max(timed, key=lambda name: timings[name][1])
+    while current is not None:
+        path.append(current)
+        upstream = [dep for dep in by_name[current].requires if dep in timings]
+        current = max(upstream, key=lambda name: timings[name][1]) if upstream else None
+    path.reverse()
+    return path
+
+
+def dependents(stages: List[Stage], name: str) -> List[str]:
+    """Names of every stage that depends on `name`, directly or transitively"""
+    found = []
+    frontier = {name}
+    while frontier:
+        layer = [s.name for s in stages if s.name not in found and frontier.intersection(s.requires)]
+        found.extend(layer)
+        frontier = set(layer)
+    return found
+
+
+def _validate(stages: List[Stage], inputs: Dict):
+    """Reject unknown dependencies and cycles before anything is scheduled"""
+    names = {stage.name for stage in stages}
+    if len(names) != len(stages):
+        raise ValueError("Pipeline stage names must be unique")
+
+    for stage in stages:
+        for dep in stage.requires:
+            if dep not in names and dep not in inputs:
+                raise ValueError(f"Stage '{stage.name}' requires unknown value '{dep}'")
+
+    resolved = set(inputs)
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if all(dep in resolved for dep in s.requires)]
+        if not ready:
+            raise ValueError(f"Pipeline has a dependency cycle between: {[s.name for s in remaining]}")
+        resolved.update(s.name for s in ready)
+        remaining = [s for s in remaining if s not in ready]
+
+
+def _stage_sink(stage: Stage, on_item: Optional[Callable]) -> Optional[Callable]:
+    if on_item is None:
+        return None
+
+    def sink(item):
+        try:
+            on_item(stage.name, item)
+        except Exception as e:
+            print(f"⚠️  Pipeline item callback failed for '{stage.name}': {e}")
+    return sink
+
+
+def _observe_stage(stage: Stage, start: float, status: str) -> float:
+    """Record a stage's run time in the stage histogram; returns the end time"""
+    end = time.perf_counter()
+    STAGE_SECONDS.labels(stage=stage.name, status=status).observe(end - start)
+    return end
+
+
+def _run_stage(stage: Stage, args: list, on_item: Optional[Callable] = None):
+    token = _item_sink.set(_stage_sink(stage, on_item))
+    try:
+        start = time.perf_counter()
+        try:
+            result = stage.func(*args)
+        except Exception:
+            _observe_stage(stage, start, 'failed')
+            raise
+        return result, start, _observe_stage(stage, start, 'completed')
+    finally:
+        _item_sink.reset(token)
+
+
+def _load_stored(store, stage: Stage, args: list):
+    """Stored output for a stage with these arguments, or None"""
+    if store is None:
+        return None
+    try:
+        return store.load(stage.name, args)
+    except Exception as e:
+        print(f"⚠️  Could not load stored output for '{stage.name}': {e}")
+        return None
+
+
+def _save_stored(store, stage: Stage, args: list, result):
+    """Persist a stage output; a failing store must not fail the run"""
+    if store is None:
+        return
+    try:
+        store.save(stage.name, args, result)
+    except Exception as e:
+        print(f"⚠️  Could not store output for '{stage.name}': {e}")
+
+
+def _notify(listener: Optional[Callable], event: str, stage: str, data=None):
+    """Deliver a pipeline event; a broken listener must not break the run"""
+    if listener is None:
+        return
+    try:
+        listener(event, stage, data)
+    except Exception as e:
+        print(f"⚠️  Pipeline listener failed on {event} for '{stage}': {e}")
+
+
+def run_pipeline(stages: List[Stage], inputs: Optional[Dict] = None,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 listener: Optional[Callable] = None,
+                 on_item: Optional[Callable] = None,
+                 store=None,
+                 cancel: Optional[threading.Event] = None) -> PipelineResult:
+    """
+    Run stages as soon as everything they require is available
+
+    Args:
+        stages: Stages to run; order does not matter
+        inputs: Initial values stages may require (e.g. story_idea, genre)
+        executor: Pool to run stages on (defaults to the shared pool)
+        listener: Optional callable(event, stage_name, data) told about
+            'started', 'completed' (data=result) and 'failed' (data=exception)
+        on_item: Optional callable(stage_name, item) receiving partial results
+            that stages report through item_sink(), e.g. scenes as they
+            stream in. Called from the stage's own thread.
+        store: Optional stage output store with load(stage_name, args) and
+            save(stage_name, args, result). A stage whose stored output
+            matches its current arguments is not run again, and each new
+            output is saved as soon as its stage completes, so a failed run
+            can be resumed. Called from the calling thread.
+        cancel: Optional event; once set, no further stage is started.
+            Stages already running are left to finish.
+
+    Returns:
+        PipelineResult with each stage's output and timings
+
+    Raises:
+        PipelineCancelled: If cancel was set before every stage had started
+        The first exception raised by any stage. Stages that have not started
+        yet are cancelled.
+    """
+    inputs = dict(inputs or {})
+    _validate(stages, inputs)
+    executor = executor or get_executor()
+
+    values = dict(inputs)
+    results = {}
+    timings = {}
+    reused = []
+    pending = list(stages)
+    running = {}
+
+    while pending or running:
+        ready = [s for s in pending if all(dep in values for dep in s.requires)]
+        while ready:
+            for stage in ready:
+                if cancel is not None and cancel.is_set():
+                    for other in running:
+                        other.cancel()
+                    raise PipelineCancelled(f"Pipeline cancelled before stage '{stage.name}'")
+                pending.remove(stage)
+                args = [values[dep] for dep in stage.requires]
+                stored = _load_stored(store, stage, args)
+                if stored is not None:
+                    now = time.perf_counter()
+                    values[stage.name] = results[stage.name] = stored
+                    timings[stage.name] = (now, now)
+                    reused.append(stage.name)
+                    print(f"♻️  Stage '{stage.name}' reused from an earlier run")
+                    _notify(listener, 'completed', stage.name, stored)
+                    continue
+                print(f"⏳ Stage '{stage.name}' started...")
+                _notify(listener, 'started', stage.name)
+                future = executor.submit(_run_stage, stage, args, on_item)
+                running[future] = (stage, args)
+            # Reused outputs may have unblocked further stages
+            ready = [s for s in pending if all(dep in values for dep in s.requires)]
+
+        if not running:
+            continue
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, args = running.pop(future)
+            try:
+                result, start, end = future.result()
+            except Exception as e:
+                print(f"❌ Stage '{stage.name}' failed: {e}")
+                _notify(listener, 'failed', stage.name, e)
+                for other in running:
+                    other.cancel()
+                raise
+            values[stage.name] = result
+            results[stage.name] = result
+            timings[stage.name] = (start, end)
+            print(f"✅ Stage '{stage.name}' finished in {end - start:.2f}s")
+            _save_stored(store, stage, args, result)
+            _notify(listener, 'completed', stage.name, result)
+
+    outcome = PipelineResult(results, timings, stages, reused)
+    print(f"🧭 Critical path: {' → '.join(outcome.critical_path)} ({outcome.elapsed:.2f}s)")
+    return outcome
+
+
+async def _arun_stage(stage: Stage, args: list, on_item: Optional[Callable] = None):
+    # Each task has its own context, so this doesn't leak into other stages
+    _item_sink.set(_stage_sink(stage, on_item))
+    start = time.perf_counter()
+    try:
+        if stage.afunc is not None:
+            result = await stage.afunc(*args)
+        else:
+            result = await asyncio.to_thread(stage.func, *args)
+    except Exception:
+        _observe_stage(stage, start, 'failed')
+        raise
+    return result, start, _observe_stage(stage, start, 'completed')
+
+
+async def arun_pipeline(stages: List[Stage], inputs: Optional[Dict] = None,
+                        listener: Optional[Callable] = None,
+                        on_item: Optional[Callable] = None,
+                        store=None) -> PipelineResult:
+    """
+    Async counterpart of run_pipeline(): stages run as tasks on the current loop
+
+    Stages without an afunc fall back to their sync func in a worker thread,
+    and store calls are made from a worker thread too.
+    """
+    inputs = dict(inputs or {})
+    _validate(stages, inputs)
+
+    values = dict(inputs)
+    results = {}
+    timings = {}
+    reused = []
+    pending = list(stages)
+    running = {}
+
+    try:
+        while pending or running:
+            ready = [s for s in pending if all(dep in values for dep in s.requires)]
+            while ready:
+                for stage in ready:
+                    pending.remove(stage)
+                    args = [values[dep] for dep in stage.requires]
+                    stored = None
+                    if store is not None:
+                        stored = await asyncio.to_thread(_load_stored, store, stage, args)
+                    if stored is not None:
+                        now = time.perf_counter()
+                        values[stage.name] = results[stage.name] = stored
+                        timings[stage.name] = (now, now)
+                        reused.append(stage.name)
+                        print(f"♻️  Stage '{stage.name}' reused from an earlier run")
+                        _notify(listener, 'completed', stage.name, stored)
+                        continue
+                    print(f"⏳ Stage '{stage.name}' started...")
+                    _notify(listener, 'started', stage.name)
+                    task = asyncio.ensure_future(_arun_stage(stage, args, on_item))
+                    running[task] = (stage, args)
+                ready = [s for s in pending if all(dep in values for dep in s.requires)]
+
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage, args = running.pop(task)
+                try:
+                    result, start, end = task.result()
+                except Exception as e:
+                    print(f"❌ Stage '{stage.name}' failed: {e}")
+                    _notify(listener, 'failed', stage.name, e)
+                    raise
+                values[stage.name] = result
+                results[stage.name] = result
+                timings[stage.name] = (start, end)
+                print(f"✅ Stage '{stage.name}' finished in {end - start:.2f}s")
+                if store is not None:
+                    await asyncio.to_thread(_save_stored, store, stage, args, result)
+                _notify(listener, 'completed', stage.name, result)
+    finally:
+        for task in running:
+            task.cancel()
+
+    outcome = PipelineResult(results, timings, stages, reused)
+    print(f"🧭 Critical path: {' → '.join(outcome.critical_path)} ({outcome.elapsed:.2f}s)")
+    return outcome
@@ -0,0 +1,231 @@
+"""
+Rate-limit-aware scheduling for upstream Groq calls
+Keeps a token bucket per model, fed by Groq's x-ratelimit-* and Retry-After
+response headers, so calls are paced before they get rejected.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from typing import Mapping, Optional
+
+from utils.token_budget import estimate_tokens
+
+# Longest we are willing to wait for a model's budget before falling back
+MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT', '10'))
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq reset durations like '2m59.56s', '7.66s' or '120ms' into seconds"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_float(headers: Mapping, name: str) -> Optional[float]:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_request_tokens(prompt: str, max_tokens: int) -> int:
+    """
+    Rough token cost of a request for pacing purposes
+    Prompt tokens at ~4 characters each plus half the completion allowance;
+    response headers correct the bucket after every call.
+    """
+    return estimate_tokens(prompt) + max_tokens // 2
+
+
+class ModelBucket:
+    """Request and token budgets for one model"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.token_limit = None        # tokens per minute
+        self.tokens = None             # current token level (None = unknown)
+        self.requests_remaining = None
+        self.requests_reset_at = 0.0
+        self.blocked_until = 0.0       # set from Retry-After on 429
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.tokens is not None and self.token_limit:
+            rate = self.token_limit / 60.0
+            self.tokens = min(self.token_limit, self.tokens + (now - self.updated_at) * rate)
+        if self.requests_remaining is not None and now >= self.requests_reset_at:
+            self.requests_remaining = None
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until the model accepts any call (429 block or request quota)"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests_remaining is not None and self.requests_remaining <= 0:
+            wait = max(wait, self.requests_reset_at - now)
+        return wait
+
+    def reserve(self, cost: int, now: float, max_wait: float) -> Optional[float]:
+        """
+        Reserve budget for one call
+
+        Returns:
+            Seconds to wait before sending, or None if that would exceed max_wait
+            (nothing is reserved in that case)
+        """
+        wait = self.delay(now)
+
+        if self.tokens is not None and self.token_limit:
+            deficit = cost - self.tokens
+            if deficit > 0:
+                wait = max(wait, deficit / (self.token_limit / 60.0))
+
+        if wait > max_wait:
+            return None
+
+        if self.tokens is not None:
+            self.tokens -= cost
+        if self.requests_remaining is not None:
+            self.requests_remaining -= 1
+        return wait
+
+    def update(self, headers: Mapping, now: float):
+        """Resynchronise with the x-ratelimit-* headers of a response"""
+        self._refill(now)
+        limit_tokens = _header_float(headers, 'x-ratelimit-limit-tokens')
+        remaining_tokens = _header_float(headers, 'x-ratelimit-remaining-tokens')
+        remaining_requests = _header_float(headers, 'x-ratelimit-remaining-requests')
+        reset_requests = parse_duration(headers.get('x-ratelimit-reset-requests'))
+
+        if limit_tokens:
+            self.token_limit = limit_tokens
+        if remaining_tokens is not None:
+            self.tokens = remaining_tokens
+        if remaining_requests is not None:
+            self.requests_remaining = remaining_requests
+            self.requests_reset_at = now + (reset_requests or 0.0)
+
+    def block(self, seconds: float, now: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def snapshot(self, now: float) -> dict:
+        self._refill(now)
+        return {
+            "tokens": round(self.tokens) if self.tokens is not None else None,
+            "tokenLimit": self.token_limit,
+            "requestsRemaining": self.requests_remaining,
+            "blockedFor": round(max(0.0, self.blocked_until - now), 2)
+        }
+
+
+class RateLimitScheduler:
+    """Process-wide pacing across every event loop and thread"""
+
+    def __init__(self, max_wait: float = MAX_WAIT_SECONDS):
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, model: str) -> ModelBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = ModelBucket(model)
+        return bucket
+
+    async def acquire(self, model: str, cost: int) -> bool:
+        """
+        Wait until `model` has budget for a call of `cost` tokens
+
+        Returns:
+            False without waiting if the model won't have budget within
+            max_wait seconds; the caller should try another model.
+        """
+        with self._lock:
+            wait = self._bucket(model).reserve(cost, time.monotonic(), self.max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            print(f"⏱️  Pacing {model} for {wait:.1f}s to stay under its rate limit")
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled before the call was made: give the reservation back
+                self.release(model, cost)
+                raise
+        return True
+
+    def wait_time(self, model: str) -> float:
+        """Seconds before `model` accepts another call (0 if nothing is known)"""
+        with self._lock:
+            return self._bucket(model).delay(time.monotonic())
+
+    def release(self, model: str, cost: int):
+        """Give back a reservation for a call that never reached the model"""
+        with self._lock:
+            bucket = self._bucket(model)
+            if bucket.tokens is not None:
+                bucket.tokens += cost
+            if bucket.requests_remaining is not None:
+                bucket.requests_remaining += 1
+
+    def record_response(self, model: str, headers: Mapping):
+        with self._lock:
+            self._bucket(model).update(headers, time.monotonic())
+
+    def record_rate_limit(self, model: str, headers: Optional[Mapping]) -> float:
+        """
+        Block a model after a 429
+
+        Returns:
+            How long the model is blocked for, in seconds
+        """
+        headers = headers or {}
+        retry_after = parse_duration(headers.get('retry-after'))
+        if retry_after is None:
+            retry_after = parse_duration(headers.get('x-ratelimit-reset-tokens')) or 1.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(model)
+            bucket.update(headers, now)
+            bucket.block(retry_after, now)
+        return retry_after
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {model: bucket.snapshot(now) for model, bucket in self._buckets.items()}
+
+
+# Global scheduler instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimitScheduler:
+    """Get or create the process-wide rate limit scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RateLimitScheduler()
+    return _scheduler
@@ -0,0 +1,408 @@
+"""
+Typed domain model for generator output
+Every generator result goes through one normaliser here, which coerces
+whatever shape the model returned (wrapped lists, dicts of objects, numbers
+as strings, missing fields) into slotted dataclasses in a single pass. Pipeline stages pass these
+objects to each other; to_json() gives back the camelCase JSON the API has
+always returned, at the points where results leave the process.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Keys models commonly wrap a list in when JSON mode forces an object
+LIST_KEYS = {
+    'characters': ('characters', 'profiles', 'character_profiles', 'characterProfiles',
+                   'character_data', 'characterData', 'main_characters', 'mainCharacters'),
+    'scenes': ('scenes', 'breakdown', 'scene_breakdown', 'sceneBreakdown', 'scene_list', 'sceneList'),
+}
+GENERIC_LIST_KEYS = ('data', 'result', 'list', 'items')
+
+
+class SchemaError(ValueError):
+    """Generator output that cannot be coerced into the expected shape"""
+
+
+def _text(value, default: str = '') -> str:
+    """Text for a field; None, empty and whitespace-only values give default"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip() or default
+    if isinstance(value, (list, tuple)):
+        return ', '.join(text for text in (_text(v) for v in value if v is not None) if text) or default
+    if isinstance(value, dict):
+        return _text(value.get('name') or value.get('description') or next(iter(value.values()), None), default)
+    return str(value)
+
+
+def _text_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value.strip()] if value.strip() else []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if not isinstance(value, (list, tuple)):
+        return [_text(value)]
+    return [text for text in (_text(v) for v in value) if text]
+
+
+def _int(value, default: Optional[int] = None) -> Optional[int]:
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, int):
+        return value
+    try:
+        return int(float(str(value).strip()))
+    except (TypeError, ValueError):
+        return default
+
+
+def _duration(value) -> str:
+    """Minutes as a bare number string ('2.5 minutes' -> '2.5')"""
+    text = _text(value).lower()
+    for unit in ('minutes', 'minute', 'mins', 'min'):
+        text = text.replace(unit, '')
+    return text.strip()
+
+
+def _int_list(value) -> List[int]:
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [n for n in (_int(v) for v in value) if n is not None]
+
+
+def _extra(raw: dict, known: tuple) -> Optional[dict]:
+    """Fields we don't model, kept so responses don't lose information"""
+    extra = {k: v for k, v in raw.items() if k not in known}
+    return extra or None
+
+
+def unwrap_list(raw, kind: str) -> list:
+    """
+    Find the list of items in a generator response
+
+    Accepts a bare list, a list under a known key ({"scenes": [...]}), the
+    only (or largest) list among the top-level values, or a dict of named
+    objects ({"Arjun": {...}}).
+
+    Raises:
+        SchemaError: if no list can be found
+    """
+    if isinstance(raw, list):
+        return raw
+    if not isinstance(raw, dict):
+        raise SchemaError(f"AI returned {type(raw).__name__} instead of a list")
+
+    for key in LIST_KEYS.get(kind, ()) + GENERIC_LIST_KEYS:
+        if isinstance(raw.get(key), list):
+            return raw[key]
+
+    if 'name' in raw:
+        return [raw]  # a single item
+
+    lists_found = [v for v in raw.values() if isinstance(v, list)]
+    if lists_found:
+        return max(lists_found, key=len)
+
+    if raw and all(isinstance(v, dict) for v in raw.values()):
+        # Dictionary of items keyed by name
+        return [dict(v, name=v.get('name', k)) for k, v in raw.items()]
+
+    raise SchemaError(f"AI returned an object without a {kind} list. Keys: {list(raw.keys())}")
+
+
+@dataclass(slots=True)
+class Act:
+    title: str
+    description: str = ''
+    key_events: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_raw(cls, raw, key: str) -> 'Act':
+        if not isinstance(raw, dict):
+            return cls(title=key.upper(), description=_text(raw))
+        return cls(
+            title=_text(raw.get('title'), key.upper()),
+            description=_text(raw.get('description')),
+            key_events=_text_list(raw.get('keyEvents', raw.get('events')))
+        )
+
+    def to_dict(self) -> dict:
+        return {'title': self.title, 'description': self.description, 'keyEvents': self.key_events}
+
+
+@dataclass(slots=True)
+class Screenplay:
+    title: str
+    logline: str = ''
+    genre: str = ''
+    main_characters: List[str] = field(default_factory=list)
+    acts: Dict[str, Act] = field(default_factory=dict)
+    plot_points: List[str] = field(default_factory=list)
+    extra: Optional[dict] = None
+
+    KNOWN = ('title', 'logline', 'genre', 'mainCharacters', 'threeActStructure', 'plotPoints')
+
+    @classmethod
+    def from_raw(cls, raw) -> 'Screenplay':
+        if isinstance(raw, cls):
+            return raw
+        if not isinstance(raw, dict):
+            raise SchemaError(f"AI returned {type(raw).__name__} instead of a screenplay object")
+        structure = raw.get('threeActStructure') or {}
+        if isinstance(structure, list):
+            structure = {f'act{i + 1}': act for i, act in enumerate(structure)}
+        if not isinstance(structure, dict):
+            structure = {}
+        return cls(
+            title=_text(raw.get('title'), 'Untitled'),
+            logline=_text(raw.get('logline')),
+            genre=_text(raw.get('genre')),
+            main_characters=_text_list(raw.get('mainCharacters')),
+            acts={key: Act.from_raw(act, key) for key, act in structure.items()},
+            plot_points=_text_list(raw.get('plotPoints')),
+            extra=_extra(raw, cls.KNOWN)
+        )
+
+    def to_dict(self) -> dict:
+        data = dict(self.extra or {})
+        data.update({
+            'title': self.title,
+            'logline': self.logline,
+            'genre': self.genre,
+            'mainCharacters': self.main_characters,
+            'threeActStructure': {key: act.to_dict() for key, act in self.acts.items()},
+            'plotPoints': self.plot_points
+        })
+        return data
+
+
+@dataclass(slots=True)
+class Character:
+    name: str
+    role: str = ''
+    arc: str = ''
+    traits: List[str] = field(default_factory=list)
+    extra: Optional[dict] = None
+
+    KNOWN = ('name', 'role', 'arc', 'traits')
+
+    @classmethod
+    def from_raw(cls, raw) -> 'Character':
+        if isinstance(raw, cls):
+            return raw
+        if isinstance(raw, str):
+            return cls(name=raw.strip())
+        if not isinstance(raw, dict):
+            raise SchemaError(f"Character entry is {type(raw).__name__}, not an object")
+        return cls(
+            name=_text(raw.get('name'), 'Unknown'),
+            role=_text(raw.get('role')),
+            arc=_text(raw.get('arc')),
+            traits=_text_list(raw.get('traits')),
+            extra=_extra(raw, cls.KNOWN)
+        )
+
+    def to_dict(self) -> dict:
+        data = dict(self.extra or {})
+        data.update({'name': self.name, 'role': self.role, 'arc': self.arc, 'traits': self.traits})
+        return data
+
+
+@dataclass(slots=True)
+class Scene:
+    scene_number: int
+    location: str = ''
+    time_of_day: str = ''
+    characters: List[str] = field(default_factory=list)
+    action: str = ''
+    duration: str = ''
+    extra: Optional[dict] = None
+
+    KNOWN = ('sceneNumber', 'location', 'timeOfDay', 'characters', 'action', 'duration')
+
+    @classmethod
+    def from_raw(cls, raw, index: int) -> 'Scene':
+        if isinstance(raw, cls):
+            return raw
+        if not isinstance(raw, dict):
+            raise SchemaError(f"Scene entry is {type(raw).__name__}, not an object")
+        return cls(
+            scene_number=_int(raw.get('sceneNumber'), index + 1),
+            location=_text(raw.get('location')),
+            time_of_day=_text(raw.get('timeOfDay')).upper(),
+            characters=_text_list(raw.get('characters')),
+            action=_text(raw.get('action', raw.get('description'))),
+            duration=_duration(raw.get('duration')),
+            extra=_extra(raw, cls.KNOWN)
+        )
+
+    def to_dict(self) -> dict:
+        data = dict(self.extra or {})
+        data.update({
+            'sceneNumber': self.scene_number,
+            'location': self.location,
+            'timeOfDay': self.time_of_day,
+            'characters': self.characters,
+            'action': self.action,
+            'duration': self.duration
+        })
+        return data
+
+
+@dataclass(slots=True)
+class MusicTheme:
+    style: str = ''
+    mood: str = ''
+    instruments: List[str] = field(default_factory=list)
+    references: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_raw(cls, raw) -> 'MusicTheme':
+        if not isinstance(raw, dict):
+            return cls(style=_text(raw))
+        return cls(style=_text(raw.get('style')), mood=_text(raw.get('mood')),
+                   instruments=_text_list(raw.get('instruments')), references=_text_list(raw.get('references')))
+
+    def to_dict(self) -> dict:
+        return {'style': self.style, 'mood': self.mood, 'instruments': self.instruments, 'references': self.references}
+
+
+@dataclass(slots=True)
+class SoundEffect:
+    category: str = ''
+    description: str = ''
+    scenes: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {'category': self.category, 'description': self.description, 'scenes': self.scenes}
+
+
+@dataclass(slots=True)
+class Ambience:
+    location: str = ''
+    description: str = ''
+    mood: str = ''
+
+    def to_dict(self) -> dict:
+        return {'location': self.location, 'description': self.description, 'mood': self.mood}
+
+
+@dataclass(slots=True)
+class KeyMoment:
+    scene: Optional[int] = None
+    moment: str = ''
+    sound_design: str = ''
+
+    def to_dict(self) -> dict:
+        return {'scene': self.scene, 'moment': self.moment, 'soundDesign': self.sound_design}
+
+
+def _objects(value) -> List[dict]:
+    if isinstance(value, dict):
+        value = list(value.values()) if all(isinstance(v, dict) for v in value.values()) else [value]
+    if not isinstance(value, list):
+        return []
+    return [v if isinstance(v, dict) else {'description': _text(v)} for v in value]
+
+
+@dataclass(slots=True)
+class SoundDesign:
+    music_theme: MusicTheme = field(default_factory=MusicTheme)
+    sound_effects: List[SoundEffect] = field(default_factory=list)
+    ambience: List[Ambience] = field(default_factory=list)
+    key_moments: List[KeyMoment] = field(default_factory=list)
+
+    @classmethod
+    def from_raw(cls, raw) -> 'SoundDesign':
+        if isinstance(raw, cls):
+            return raw
+        if not raw:
+            return cls()
+        if not isinstance(raw, dict):
+            raise SchemaError(f"AI returned {type(raw).__name__} instead of a dictionary for sound design.")
+        return cls(
+            music_theme=MusicTheme.from_raw(raw.get('musicTheme') or {}),
+            sound_effects=[SoundEffect(_text(e.get('category')), _text(e.get('description')), _int_list(e.get('scenes', [])))
+                           for e in _objects(raw.get('soundEffects'))],
+            ambience=[Ambience(_text(a.get('location')), _text(a.get('description')), _text(a.get('mood')))
+                      for a in _objects(raw.get('ambience'))],
+            key_moments=[KeyMoment(_int(m.get('scene')), _text(m.get('moment')), _text(m.get('soundDesign')))
+                         for m in _objects(raw.get('keyMoments'))]
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'musicTheme': self.music_theme.to_dict(),
+            'soundEffects': [e.to_dict() for e in self.sound_effects],
+            'ambience': [a.to_dict() for a in self.ambience],
+            'keyMoments': [m.to_dict() for m in self.key_moments]
+        }
+
+
+@dataclass(slots=True)
+class Package:
+    """Everything generate_pdf() renders"""
+    screenplay: Screenplay
+    characters: List[Character] = field(default_factory=list)
+    scenes: List[Scene] = field(default_factory=list)
+    sound_design: SoundDesign = field(default_factory=SoundDesign)
+
+    def to_dict(self) -> dict:
+        return {
+            'screenplay': self.screenplay.to_dict(),
+            'characters': [c.to_dict() for c in self.characters],
+            'scenes': [s.to_dict() for s in self.scenes],
+            'soundDesign': self.sound_design.to_dict() if self.sound_design != SoundDesign() else None
+        }
+
+
+def normalize_screenplay(raw) -> Screenplay:
+    return Screenplay.from_raw(raw)
+
+
+def normalize_characters(raw) -> List[Character]:
+    return [Character.from_raw(item) for item in unwrap_list(raw, 'characters')
+            if isinstance(item, (Character, dict, str)) and item]
+
+
+def normalize_scenes(raw) -> List[Scene]:
+    items = [item for item in unwrap_list(raw, 'scenes') if isinstance(item, (Scene, dict))]
+    return [Scene.from_raw(item, index) for index, item in enumerate(items)]
+
+
+def normalize_sound_design(raw) -> SoundDesign:
+    return SoundDesign.from_raw(raw)
+
+
+def to_json(value):
+    """
+    JSON-ready form of a stage result
+
+    Schema objects (and lists of them) become their camelCase dicts; plain
+    JSON data, such as outputs loaded from the artifact store, is returned
+    unchanged.
+    """
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return value
+
+
+def normalize_package(data: dict) -> Package:
+    """
+    Validate a full package (as posted to /export_pdf or stored on a Story)
+
+    Raises:
+        SchemaError: if the screenplay is missing or unusable
+    """
+    if not isinstance(data, dict):
+        raise SchemaError("Package must be a JSON object")
+    return Package(
+        screenplay=normalize_screenplay(data.get('screenplay')),
+        characters=normalize_characters(data.get('characters') or []),
+        scenes=normalize_scenes(data.get('scenes') or []),
+        sound_design=normalize_sound_design(data.get('soundDesign'))
+    )
@@ -0,0 +1,201 @@
+"""
+Deterministic screenplay tokenizer and parser
+Pulls scenes, locations, time of day, character cues and dialogue counts out
+of `clean_text` output in a single pass, so the analyze pipeline only asks
+the model for interpretive work.
+
+clean_text strips indentation and blank lines, so classification relies on
+screenplay conventions: INT./EXT. sluglines, upper-case character cues
+followed by dialogue, parentheticals and transitions.
+"""
+import re
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+
+SLUGLINE = re.compile(
+    r'^(?:\d+[A-Z]?\s*[.)]?\s+)?'                       # optional scene number
+    r'(?P<prefix>INT\.?\s*/\s*EXT\.?|EXT\.?\s*/\s*INT\.?|I\s*/\s*E\.?|INT\.|EXT\.|INT\s|EXT\s|EST\.)'
+    r'\s*(?P<rest>.*?)\s*(?:\d+[A-Z]?\.?)?$'             # optional trailing scene number
+)
+TIME_OF_DAY = re.compile(
+    r'\s*[-–—.]+\s*(?P<time>DAY|NIGHT|MORNING|EVENING|AFTERNOON|DAWN|DUSK|SUNSET|SUNRISE|'
+    r'CONTINUOUS|LATER|MOMENTS LATER|SAME(?: TIME)?|MIDNIGHT|NOON)\b.*$'
+)
+TRANSITION = re.compile(r'^(?:[A-Z ]+ TO:|FADE (?:IN|OUT)[:.]?|FADE TO BLACK\.?|CUT TO BLACK\.?|THE END\.?)$')
+CUE = re.compile(r"^(?P<name>[A-Z0-9][A-Z0-9 .'\-&]*?[A-Z0-9.])\s*(?P<ext>\((?:[A-Z. ']+)\))?\s*(?:\(CONT'D\))?$")
+PARENTHETICAL = re.compile(r'^\(.*\)$')
+PAGE_NOISE = re.compile(r"^(?:\d+\.?|\(?MORE\)?|\(?CONTINUED\)?:?|CONT(?:INUED|'D)[:.]?)$")
+
+# Upper-case lines that look like cues but never are
+NON_CUES = {
+    'FADE IN', 'FADE OUT', 'THE END', 'CONTINUED', 'INTERCUT', 'BACK TO SCENE', 'TITLE', 'SUPER',
+    'MONTAGE', 'END MONTAGE', 'FLASHBACK', 'END FLASHBACK', 'LATER', 'SERIES OF SHOTS', 'TITLE CARD',
+}
+MAX_CUE_WORDS = 4
+MAX_CUE_LENGTH = 35
+
+# Rough screen time: one screenplay page (~190 words) is one minute
+WORDS_PER_MINUTE = 190
+
+Token = Tuple[str, str]
+
+
+def parse_slugline(line: str):
+    """
+    Split a slugline into (interior, location, time_of_day)
+
+    Returns:
+        Tuple of strings, or None if the line isn't a slugline
+    """
+    match = SLUGLINE.match(line)
+    if not match:
+        return None
+    prefix = re.sub(r'[\s.]', '', match.group('prefix')).upper()
+    interior = {'INT': 'INT', 'EXT': 'EXT', 'EST': 'EXT'}.get(prefix, 'INT/EXT')
+    rest = match.group('rest').strip(' .-–—')
+    time_of_day = ''
+    time_match = TIME_OF_DAY.search(rest.upper())
+    if time_match:
+        time_of_day = time_match.group('time')
+        rest = rest[:time_match.start()].strip(' .-–—')
+    return interior, rest, time_of_day
+
+
+def _cue_name(line: str):
+    """Character name if the line is a dialogue cue candidate, else None"""
+    if len(line) > MAX_CUE_LENGTH or line != line.upper() or not any(c.isalpha() for c in line):
+        return None
+    match = CUE.match(line)
+    if not match:
+        return None
+    name = match.group('name').strip(' .')
+    if name in NON_CUES or len(name.split()) > MAX_CUE_WORDS or name.endswith(':'):
+        return None
+    return name
+
+
+def tokenize(text: str) -> Iterator[Token]:
+    """
+    Classify each line of cleaned screenplay text
+
+    Yields:
+        (kind, text) where kind is one of 'slugline', 'transition', 'cue',
+        'parenthetical', 'dialogue' or 'action'
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not PAGE_NOISE.match(line)]
+    in_dialogue = False
+
+    for index, line in enumerate(lines):
+        if SLUGLINE.match(line):
+            in_dialogue = False
+            yield 'slugline', line
+            continue
+        if TRANSITION.match(line):
+            in_dialogue = False
+            yield 'transition', line
+            continue
+
+        name = _cue_name(line)
+        if name is not None:
+            # A cue needs something spoken after it that isn't another heading
+            following = lines[index + 1] if index + 1 < len(lines) else ''
+            if following and (PARENTHETICAL.match(following) or following != following.upper()):
+                in_dialogue = True
+                yield 'cue', name
+                continue
+
+        if in_dialogue and PARENTHETICAL.match(line):
+            yield 'parenthetical', line
+            continue
+        if in_dialogue:
+            # Dialogue runs on until a line that reads like scene description
+            # follows a completed sentence
+            yield 'dialogue', line
+            if line.endswith(('.', '!', '?', '"', '--', '…')) and index + 1 < len(lines) \
+                    and _cue_name(lines[index + 1]) is None and not SLUGLINE.match(lines[index + 1]):
+                in_dialogue = False
+            continue
+
+        yield 'action', line
+
+
+def display_name(cue: str) -> str:
+    """Title-case a character cue for display (BOB O'NEIL -> Bob O'Neil)"""
+    return cue.title()
+
+
+def _minutes(words: int) -> str:
+    return str(max(0.5, round(words / WORDS_PER_MINUTE * 2) / 2))
+
+
+def parse_screenplay(text: str) -> dict:
+    """
+    Parse cleaned screenplay text into scenes and characters
+
+    Args:
+        text: Output of clean_text()
+
+    Returns:
+        Dictionary with:
+            scenes: list of scene dicts in the generator's shape (sceneNumber,
+                location, timeOfDay, characters, action, duration) plus
+                heading and dialogueCount
+            characters: list of {name, dialogueCount, sceneCount}, most
+                talkative first; names are title-cased cues
+    """
+    scenes = []
+    stats = OrderedDict()
+    current = None
+
+    def close(scene):
+        if scene is not None:
+            scene['duration'] = _minutes(scene.pop('_words'))
+            scene['action'] = ' '.join(scene.pop('_action'))[:300]
+            scene['characters'] = [display_name(name) for name in scene['characters']]
+
+    for kind, value in tokenize(text):
+        if kind == 'slugline':
+            close(current)
+            interior, location, time_of_day = parse_slugline(value)
+            current = {
+                'sceneNumber': len(scenes) + 1,
+                'heading': value,
+                'location': f'{interior}. {location}'.strip() if location else interior,
+                'timeOfDay': time_of_day or 'DAY',
+                'characters': OrderedDict(),
+                'dialogueCount': 0,
+                '_action': [],
+                '_words': 0,
+            }
+            scenes.append(current)
+            continue
+
+        if current is None:
+            continue  # title page, cast lists, etc.
+
+        current['_words'] += len(value.split())
+        if kind == 'cue':
+            entry = stats.setdefault(value, {'name': display_name(value), 'dialogueCount': 0, 'sceneCount': 0})
+            entry['dialogueCount'] += 1
+            if value not in current['characters']:
+                current['characters'][value] = True
+                entry['sceneCount'] += 1
+            current['dialogueCount'] += 1
+        elif kind == 'action' and sum(len(a) for a in current['_action']) < 300:
+            current['_action'].append(value)
+
+    close(current)
+
+    characters = sorted(stats.values(), key=lambda c: (-c['dialogueCount'], -c['sceneCount']))
+    return {'scenes': scenes, 'characters': characters}
+
+
+def main_character_names(parsed: dict, limit: int = 5) -> List[str]:
+    """Names of the most talkative characters, in order"""
+    return [character['name'] for character in parsed.get('characters', [])[:limit]]
+
+
+def is_formatted_screenplay(parsed: dict, min_scenes: int = 2) -> bool:
+    """True when the text parsed as a real screenplay (not a treatment or outline)"""
+    return len(parsed.get('scenes', [])) >= min_scenes and bool(parsed.get('characters'))
@@ -0,0 +1,192 @@
+"""
+Single-flight coalescing of identical in-flight AI requests
+Concurrent calls with the same key share one upstream call. Within a process
+followers wait on the leader's future; with AI_SINGLE_FLIGHT_SHARED=1,
+workers on the same host also coordinate through a lock table in the shared
+AI cache database and pick the leader's result up from the cache.
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Optional
+
+# How long a cross-worker leader may hold a key before others take over
+SHARED_LOCK_TTL = float(os.getenv('AI_SINGLE_FLIGHT_LOCK_TTL', '120'))
+SHARED_POLL_INTERVAL = float(os.getenv('AI_SINGLE_FLIGHT_POLL_INTERVAL', '0.25'))
+
+
+class SharedFlightLock:
+    """Cross-process leader election through a SQLite table"""
+
+    def __init__(self, path: str, ttl: float = SHARED_LOCK_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._local = threading.local()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS ai_inflight (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str) -> bool:
+        """Try to become the leader for key (expired locks are taken over)"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("DELETE FROM ai_inflight WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO ai_inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, self.owner, now + self.ttl)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key: str):
+        self._connect().execute("DELETE FROM ai_inflight WHERE key = ? AND owner = ?", (key, self.owner))
+
+
+class _LeaderCancelled(Exception):
+    """Handed to followers when the leading request was cancelled"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, shared: Optional[SharedFlightLock] = None):
+        self.shared = shared
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable], lookup: Optional[Callable] = None):
+        """
+        Run factory() once per key at a time and share its result
+
+        Args:
+            key: Identity of the request (the AI cache key)
+            factory: Coroutine function performing the upstream call
+            lookup: Blocking callable(key) returning another worker's stored
+                result or None; required for cross-worker coalescing
+
+        Works across event loops: the leader's result is published through a
+        thread-safe concurrent.futures.Future. If the leader is cancelled,
+        its followers carry on without it instead of being cancelled too.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                    # A running future can't be cancelled, so a cancelled
+                    # follower (through wrap_future) can't cancel the others
+                    future.set_running_or_notify_cancel()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            print("🔗 Joining identical in-flight AI request")
+            try:
+                return await asyncio.wrap_future(future)
+            except _LeaderCancelled:
+                # The leader's own request was cancelled; that's no reason to
+                # fail this one, so run it (or join whoever leads it now)
+                continue
+
+        try:
+            if self.shared is not None and lookup is not None:
+                result = await self._lead_shared(key, factory, lookup)
+            else:
+                result = await factory()
+        except asyncio.CancelledError:
+            self._finish(key, future)
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            self._finish(key, future)
+            future.set_exception(e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key: str, future: Future):
+        """Stop new callers joining a finished call (before followers are woken)"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    async def _lead_shared(self, key: str, factory: Callable[[], Awaitable], lookup: Callable):
+        """Elect one leader across workers; the rest wait for its cached result"""
+        announced = False
+        while True:
+            try:
+                acquired = await asyncio.to_thread(self.shared.acquire, key)
+            except sqlite3.Error as e:
+                print(f"⚠️  Shared single-flight lock unavailable: {e}")
+                return await factory()
+
+            if acquired:
+                try:
+                    return await factory()
+                finally:
+                    try:
+                        await asyncio.to_thread(self.shared.release, key)
+                    except sqlite3.Error:
+                        pass
+
+            if not announced:
+                print("🔗 Waiting on identical AI request in another worker")
+                announced = True
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+            try:
+                value = await asyncio.to_thread(lookup, key)
+            except sqlite3.Error as e:
+                # A locked or broken cache is a miss, not a failed generation
+                print(f"⚠️  Shared AI cache lookup failed: {e}")
+                value = None
+            if value is not None:
+                return value
+            # Otherwise the other leader is still running, failed or died;
+            # the next acquire() tells us which
+
+
+# Global instance
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight(shared_path: Optional[str] = None) -> SingleFlight:
+    """
+    Get or create the process-wide single-flight group
+
+    Args:
+        shared_path: SQLite file for cross-worker locks, used when
+            AI_SINGLE_FLIGHT_SHARED=1 (normally the AI cache database)
+    """
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                shared = None
+                if os.getenv('AI_SINGLE_FLIGHT_SHARED', '0') == '1' and shared_path:
+                    try:
+                        shared = SharedFlightLock(shared_path)
+                    except sqlite3.Error as e:
+                        print(f"⚠️  Cross-worker single-flight disabled: {e}")
+                _single_flight = SingleFlight(shared)
+    return _single_flight
@@ -0,0 +1,105 @@
+"""
+Server-Sent Events helpers for streaming pipeline progress
+"""
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Callable, Iterator
+
+from utils.pipeline import PipelineCancelled
+from utils.schema import to_json
+
+# Comment lines sent while a stage is still running so proxies (Render's
+# load balancer, nginx) don't close an idle connection.
+HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+
+def format_sse(data, event: str = None) -> str:
+    """Encode one SSE message; data is serialised as JSON"""
+    message = ''
+    if event:
+        message += f'event: {event}\n'
+    payload = json.dumps(data, ensure_ascii=False)
+    for line in payload.splitlines() or ['']:
+        message += f'data: {line}\n'
+    return message + '\n'
+
+
+def stream_pipeline(run: Callable, total_stages: int, error_message: str) -> Iterator[str]:
+    """
+    Run a pipeline in a background thread and yield SSE messages as it goes
+
+    Args:
+        run: Callable taking a pipeline listener, an on_item callback and a
+            cancel event, and returning a PipelineResult. The event is set
+            when the client goes away, so no further stage is started.
+        total_stages: Number of stages, for progress reporting
+        error_message: User-facing message sent with the error event
+
+    Yields:
+        'progress' events when stages start and finish, 'item' events for
+        partial results as they arrive ({stage, index, item}; e.g. each scene
+        while the breakdown is still streaming), one event per stage result
+        named after the stage (screenplay, characters, ...), then a final
+        'done' event, or an 'error' event if the pipeline fails.
+    """
+    events = queue.Queue()
+    completed = []
+
+    item_counts = {}
+    cancelled = threading.Event()
+
+    def listener(kind, stage, data):
+        events.put((kind, stage, data))
+
+    def on_item(stage, item):
+        events.put(('item', stage, item))
+
+    def worker():
+        try:
+            events.put(('done', None, run(listener, on_item, cancelled)))
+        except PipelineCancelled:
+            print("🛑 Streaming client disconnected; pipeline stopped")
+        except Exception as e:
+            events.put(('error', None, e))
+
+    threading.Thread(target=worker, name='sse-pipeline', daemon=True).start()
+
+    try:
+        yield format_sse({"status": "started", "completed": 0, "total": total_stages}, event='progress')
+
+        while True:
+            try:
+                kind, stage, data = events.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+
+            if kind == 'started':
+                yield format_sse({"stage": stage, "status": "started",
+                                  "completed": len(completed), "total": total_stages}, event='progress')
+            elif kind == 'item':
+                index = item_counts.get(stage, 0)
+                item_counts[stage] = index + 1
+                yield format_sse({"stage": stage, "index": index, "item": data}, event='item')
+            elif kind == 'completed':
+                completed.append(stage)
+                yield format_sse(to_json(data), event=stage)
+                yield format_sse({"stage": stage, "status": "completed",
+                                  "completed": len(completed), "total": total_stages}, event='progress')
+            elif kind == 'failed':
+                yield format_sse({"stage": stage, "status": "failed",
+                                  "completed": len(completed), "total": total_stages}, event='progress')
+            elif kind == 'done':
+                yield format_sse({"success": True, "pipeline": data.report(),
+                                  "timestamp": datetime.now().isoformat()}, event='done')
+                return
+            elif kind == 'error':
+                print(f"❌ Streaming pipeline error: {data}")
+                yield format_sse({"success": False, "error": error_message, "details": str(data)}, event='error')
+                return
+    finally:
+        # Client disconnect (GeneratorExit) or a finished stream
+        cancelled.set()
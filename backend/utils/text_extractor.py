@@ -1,24 +1,227 @@
 import pdfplumber
 from docx import Document
 import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_from_pdf(file_stream):
-    """Extract text from PDF using pdfplumber."""
-    text = ""
-    with pdfplumber.open(file_stream) as pdf:
+from utils.metrics import EXTRACTION_SECONDS
+
+# PDFs with at least this many pages are extracted in parallel (path-backed only)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '40'))
+# Pages handed to each worker process at a time
+PDF_BATCH_PAGES = int(os.getenv('PDF_BATCH_PAGES', '16'))
+# Rough characters per script page, used to skip the pool for small budgets
+CHARS_PER_PAGE = 3000
+
+# The PDF header may follow a few bytes of junk; readers accept it within 1 KiB
+PDF_MAGIC = b'%PDF-'
+ZIP_MAGIC = b'PK\x03\x04'
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # legacy .doc (and .xls/.ppt)
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool used for large PDFs"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                workers = int(os.getenv('PDF_EXTRACT_PROCESSES', str(os.cpu_count() or 2)))
+                # spawn, not fork: the web process is multi-threaded
+                _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pdf_pool
+
+
+def detect_file_type(file_stream):
+    """
+    Identify an upload from its leading bytes rather than its file name.
+
+    Returns 'pdf', 'docx', 'doc' (legacy Word, which we cannot read) or None.
+    The stream is left at position 0.
+    """
+    file_stream.seek(0)
+    head = file_stream.read(1024)
+    file_stream.seek(0)
+
+    if PDF_MAGIC in head:
+        return 'pdf'
+    if head.startswith(OLE_MAGIC):
+        return 'doc'
+    if head.startswith(ZIP_MAGIC):
+        # Any Office file is a zip; only Word documents have word/document.xml
+        try:
+            with zipfile.ZipFile(file_stream) as archive:
+                is_docx = 'word/document.xml' in archive.namelist()
+        except zipfile.BadZipFile:
+            is_docx = False
+        finally:
+            file_stream.seek(0)
+        return 'docx' if is_docx else None
+    return None
+
+
+def iter_pdf_pages(source, pages=None):
+    """
+    Yield the text of each PDF page lazily, one page in memory at a time.
+
+    source is a path or binary file object; pages is an optional list of
+    1-based page numbers. Pages without text yield ''.
+    """
+    with pdfplumber.open(source, pages=pages) as pdf:
         for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text.strip()
+            yield page.extract_text() or ""
+            page.close()
+
+
+def count_pdf_pages(source):
+    """Number of pages in a PDF, without extracting any text."""
+    with pdfplumber.open(source) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_page_batch(path, pages):
+    """Process pool worker: text of one batch of pages."""
+    return list(iter_pdf_pages(path, pages))
+
+
+def _iter_pdf_pages_parallel(path, page_count):
+    """Yield page texts in order while batches are extracted across processes."""
+    pool = get_pdf_pool()
+    batches = [list(range(start, min(start + PDF_BATCH_PAGES, page_count + 1)))
+               for start in range(1, page_count + 1, PDF_BATCH_PAGES)]
+    futures = [pool.submit(_extract_page_batch, path, batch) for batch in batches]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Early stop: drop batches that have not started yet
+        for future in futures:
+            future.cancel()
+
+
+def _use_pool(page_count, max_chars=None):
+    """Whether reading this many pages for this budget is worth the process pool."""
+    return page_count >= PDF_PARALLEL_MIN_PAGES and \
+        (max_chars is None or max_chars > PDF_BATCH_PAGES * CHARS_PER_PAGE)
+
+
+def _open_pdf_pages(source, page_count=None, max_chars=None):
+    """Page text iterator, spread over the process pool when that pays off."""
+    if isinstance(source, (str, os.PathLike)):
+        if page_count is None:
+            page_count = count_pdf_pages(source)
+        if _use_pool(page_count, max_chars):
+            return _iter_pdf_pages_parallel(os.fspath(source), page_count)
+    return iter_pdf_pages(source)
+
+
+def _preview(texts, max_chars, read_all=False):
+    """
+    Keep text until max_chars has been collected.
+
+    Returns (text, length, count): length is len(clean_text()) of the texts
+    read joined by newlines, count the number of texts read. Reading stops
+    at the budget unless read_all is set, in which case the rest is
+    measured without being kept.
+    """
+    parts = []
+    collected = 0
+    length = 0
+    count = 0
+    for part in texts:
+        count += 1
+        cleaned = clean_text(part)
+        if not cleaned:
+            continue
+        length += len(cleaned) + (1 if length else 0)
+        if collected < max_chars:
+            parts.append(part)
+            collected += len(cleaned) + 1
+        if collected >= max_chars and not read_all:
+            break
+    return "\n".join(parts).strip(), length, count
+
+
+@EXTRACTION_SECONDS.labels(format='pdf').time()
+def extract_text_from_pdf(file_stream, pages=None):
+    """
+    Extract text from PDF using pdfplumber.
+
+    pages is an optional list of 1-based page numbers. Large PDFs given as
+    a file path are split into page batches across a process pool.
+    """
+    page_iter = iter_pdf_pages(file_stream, pages) if pages is not None else _open_pdf_pages(file_stream)
+    try:
+        return "\n".join(page_text for page_text in page_iter if page_text).strip()
+    finally:
+        page_iter.close()
+
+
+def _preview_pdf_pages(source, page_count, max_chars):
+    page_iter = _open_pdf_pages(source, page_count, max_chars)
+    try:
+        text, length, pages_read = _preview(page_iter, max_chars)
+    finally:
+        page_iter.close()
+    if pages_read < page_count:
+        # Extrapolate from the pages read so far
+        return text, round(length * page_count / pages_read), True
+    return text, length, False
+
+
+@EXTRACTION_SECONDS.labels(format='pdf').time()
+def preview_pdf(source, max_chars):
+    """
+    Opening text of a PDF and the cleaned length of the whole document.
+
+    Reading stops once max_chars has been collected, so only the opening
+    pages are extracted; the length is then estimated from those pages and
+    the page count. Budgets spanning several page batches on long PDFs are
+    read across the process pool (a stream is first copied to a temporary
+    file the workers can open).
+
+    Returns:
+        (text, full_length, estimated) - estimated is True when pages were
+        left unread
+    """
+    page_count = count_pdf_pages(source)
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+        if _use_pool(page_count, max_chars):
+            with tempfile.NamedTemporaryFile(suffix='.pdf') as copy:
+                shutil.copyfileobj(source, copy)
+                copy.flush()
+                return _preview_pdf_pages(copy.name, page_count, max_chars)
+    return _preview_pdf_pages(source, page_count, max_chars)
+
+
+@EXTRACTION_SECONDS.labels(format='docx').time()
+def preview_docx(file_stream, max_chars):
+    """
+    Opening text of a DOCX and the cleaned length of the whole document.
+
+    python-docx parses the whole document anyway, so the length is exact.
+
+    Returns:
+        (text, full_length, estimated) - estimated is always False
+    """
+    doc = Document(file_stream)
+    text, length, _ = _preview((para.text for para in doc.paragraphs), max_chars, read_all=True)
+    return text, length, False
+
 
+@EXTRACTION_SECONDS.labels(format='docx').time()
 def extract_text_from_docx(file_stream):
     """Extract text from DOCX using python-docx."""
     doc = Document(file_stream)
-    text = []
-    for para in doc.paragraphs:
-        text.append(para.text)
-    return "\n".join(text).strip()
+    return "\n".join(para.text for para in doc.paragraphs).strip()
 
 def clean_text(text):
     """Basic text cleaning."""
@@ -0,0 +1,108 @@
+"""
+Token budgets for generator prompts and completions
+Prompt sizes are estimated locally, and each stage asks for only as many
+completion tokens as its JSON answer needs (a character list is far smaller
+than a scene breakdown). Smaller max_tokens values finish sooner and reserve
+less of the tokens-per-minute allowance.
+"""
+import json
+import math
+import os
+
+from utils.schema import normalize_screenplay
+
+# Rough size of a token in English prose and JSON
+CHARS_PER_TOKEN = 4
+# Room over the expected answer size, so answers aren't cut off mid-JSON
+HEADROOM = float(os.getenv('TOKEN_BUDGET_HEADROOM', '1.5'))
+MIN_OUTPUT_TOKENS = 256
+MAX_OUTPUT_TOKENS = int(os.getenv('MAX_OUTPUT_TOKENS', '4096'))
+# Smallest context window among the fallback models
+CONTEXT_TOKENS = int(os.getenv('MODEL_CONTEXT_TOKENS', '32768'))
+
+# Expected answer size per stage: (fixed tokens, tokens per item, minimum items)
+STAGE_OUTPUT_TOKENS = {
+    'screenplay': (750, 0, 0),          # title, logline, three acts, plot points
+    'analysis': (800, 0, 0),            # same structure, extracted from a script
+    'chunk_summary': (350, 0, 0),       # summary, characters and events of one part
+    'character_names': (80, 0, 0),
+    'characters': (30, 100, 5),         # per character profile
+    'scenes': (30, 120, 12),            # per scene, up to 12 scenes
+    'soundDesign': (350, 45, 10),       # theme, effects and ambience plus key moments
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def max_tokens_for(stage: str, items: int = 0, prompt: str = '') -> int:
+    """
+    Completion budget for a stage
+
+    Args:
+        stage: Key in STAGE_OUTPUT_TOKENS
+        items: Expected number of list entries in the answer (e.g. characters)
+        prompt: The prompt, so prompt plus answer stays within the context window
+
+    Returns:
+        max_tokens to request
+    """
+    fixed, per_item, min_items = STAGE_OUTPUT_TOKENS[stage]
+    budget = math.ceil((fixed + per_item * max(items, min_items)) * HEADROOM)
+    budget = min(budget, MAX_OUTPUT_TOKENS)
+    if prompt:
+        budget = min(budget, CONTEXT_TOKENS - estimate_tokens(prompt))
+    return max(budget, MIN_OUTPUT_TOKENS)
+
+
+def compact_json(data) -> str:
+    """JSON without indentation or spaces after separators"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def fit_text(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, on a word boundary where possible"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(' ')
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
+
+def compact_screenplay(screenplay_data, max_tokens: int = 300) -> str:
+    """
+    Minimal JSON projection of an outline for downstream prompts
+
+    Keeps title, logline, genre, main characters and each act's summary and
+    key events. Over budget, key events are dropped first, then summaries are
+    shortened.
+    """
+    screenplay = normalize_screenplay(screenplay_data)
+    acts = [{'title': act.title, 'summary': act.description, 'events': act.key_events}
+            for act in screenplay.acts.values()]
+    projection = {
+        'title': screenplay.title,
+        'logline': screenplay.logline,
+        'genre': screenplay.genre,
+        'mainCharacters': screenplay.main_characters,
+        'acts': acts
+    }
+
+    text = compact_json(projection)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    for act in acts:
+        act.pop('events')
+    text = compact_json(projection)
+    if estimate_tokens(text) <= max_tokens or not acts:
+        return text
+    spare = max_tokens - estimate_tokens(text) + sum(estimate_tokens(act['summary']) for act in acts)
+    per_act = max(spare // len(acts), 20)
+    for act in acts:
+        act['summary'] = fit_text(act['summary'], per_act)
+    return compact_json(projection)
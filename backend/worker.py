@@ -0,0 +1,40 @@
+"""
+Standalone job worker process
+Runs generation jobs queued through POST /jobs so web workers only handle
+cheap I/O. Start as many of these as throughput needs:
+
+    python worker.py
+
+JOB_WORKERS sets the number of concurrent jobs per process (default 4).
+"""
+import os
+import signal
+import time
+
+from app import app
+from jobs import start_job_workers
+
+
+def main():
+    count = int(os.getenv('JOB_WORKERS', '4'))
+    print(f"🎬 Scriptoria job worker starting ({count} threads)...")
+    workers = start_job_workers(app, count)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    try:
+        while not stopping:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+    print("🛑 Stopping job workers...")
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -103,7 +103,8 @@ function App({ initialStory, onStorySaved }) {
           setStoryIdea(response.data.extracted_text);
         }
         setUploadedFileName(file.name);
-        alert(`Successfully extracted ${response.data.full_length} characters from ${file.name}`);
+        const approx = response.data.full_length_estimated ? 'about ' : '';
+        alert(`Successfully extracted ${approx}${response.data.full_length} characters from ${file.name}`);
       }
     } catch (err) {
       console.error('Upload failed:', err);